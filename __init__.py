@@ -2,18 +2,113 @@
 
 import os
 from flask import Flask, render_template
+from . import api
+from . import api_alphavantage
+from . import archive
 from . import auth
+from . import benchmark
+from . import cache
 from . import db
+from . import http_client
+from . import indicators
+from . import lazy
+from . import live
+from . import macro
+from . import metrics
+from . import prefetch
 from . import stocks
+from . import stub_upstream
+from . import symbols
 
-def create_app():
-    ''' Init Stock Trends Application. '''
+def create_app(test_config=None):
+    """ Init Stock Trends Application.
+
+    Args:
+        test_config: settings applied over the defaults (Ex: the benchmark's
+            temporary database and stubbed upstream APIs).
+    """
     # create application and setup configuration.
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_mapping(
         SECRET_KEY='dev',
-        DATABASE=os.path.join(app.instance_path, 'StockTrends.sqlite')
+        # serve the Alpha Vantage demo data everywhere (stocks page, data API, live
+        # updates, comparison, macro, news and prefetch) until set to False.
+        MOCK_DATA=True,
+        # add a Server-Timing header (upstream, parse, analytics, db) to responses.
+        SERVER_TIMING=False,
+        # import numpy and pandas at startup instead of on first use
+        # (pre-fork servers: workers then share the loaded modules).
+        PRELOAD_HEAVY_MODULES=False,
+        DATABASE=os.path.join(app.instance_path, 'StockTrends.sqlite'),
+        # SQLite tuning: lock wait (seconds), memory-mapped I/O (bytes), page cache (KiB).
+        SQLITE_BUSY_TIMEOUT=5,
+        SQLITE_MMAP_SIZE=256 * 1024 * 1024,
+        SQLITE_CACHE_SIZE_KB=16 * 1024,
+        # open connections kept between requests (more are opened under load
+        # and closed when returned).
+        SQLITE_POOL_MAX_IDLE=8,
+        # columnar price bar files, one directory per symbol and interval
+        # (`flask archive-bars` moves bars an older version stored in the database).
+        PRICE_ARCHIVE_PATH=os.path.join(app.instance_path, 'archive'),
+        # upstream response cache: 'memory', 'sqlite' or 'tiered'.
+        RESPONSE_CACHE_BACKEND='tiered',
+        RESPONSE_CACHE_PATH=os.path.join(app.instance_path, 'response_cache.sqlite'),
+        RESPONSE_CACHE_MAX_ENTRIES=1024,
+        # per-endpoint TTL overrides in seconds (Ex: {'NEWS_SENTIMENT': 600}).
+        RESPONSE_CACHE_TTLS={},
+        # concurrent upstream fetches on the stocks page.
+        UPSTREAM_MAX_WORKERS=8,
+        UPSTREAM_FANOUT_TIMEOUT=30,
+        # pooled HTTP sessions used for every upstream call.
+        HTTP_POOL_SIZE=10,
+        HTTP_MAX_RETRIES=3,
+        HTTP_BACKOFF_FACTOR=0.5,
+        HTTP_BACKOFF_JITTER=0.5,
+        HTTP_CONNECT_TIMEOUT=3.05,
+        HTTP_READ_TIMEOUT=20,
+        # answer upstream calls offline from recorded fixtures or synthetic payloads,
+        # or record real replies as fixtures.
+        UPSTREAM_STUB=False,
+        UPSTREAM_STUB_LATENCY=0.0,
+        UPSTREAM_STUB_JITTER=0.0,
+        UPSTREAM_STUB_ERROR_RATE=0.0,
+        UPSTREAM_RECORD_FIXTURES=False,
+        UPSTREAM_FIXTURES_PATH=os.path.join(app.instance_path, 'upstream_fixtures'),
+        # Alpha Vantage budget (free tier), calls beyond it are queued or refused.
+        ALPHAVANTAGE_CALLS_PER_MINUTE=5,
+        ALPHAVANTAGE_CALLS_PER_DAY=25,
+        ALPHAVANTAGE_MAX_QUEUE_WAIT=30,
+        # local symbol index for search autocomplete (LISTING_STATUS csv snapshot).
+        SYMBOL_LISTING_PATH=os.path.join(app.instance_path, 'listing_status.csv'),
+        SYMBOL_LISTING_MAX_AGE=24 * 60 * 60,
+        SYMBOL_SEARCH_LIMIT=10,
+        # computed indicator results kept in memory, per series version and spec.
+        INDICATOR_CACHE_MAX_ENTRIES=2048,
+        # basket comparison (/stocks/compare): default index for betas and basket size.
+        COMPARE_BENCHMARK='SPY',
+        COMPARE_MAX_SYMBOLS=100,
+        # live intraday updates (/stocks/stream): seconds between polls of a series,
+        # keep-alive comment interval, events buffered per client and series polled at once.
+        LIVE_POLL_INTERVAL=60,
+        LIVE_HEARTBEAT=15,
+        LIVE_QUEUE_SIZE=16,
+        LIVE_MAX_SYMBOLS=50,
+        # macro dashboard: seconds between checks of a series whose next observation
+        # is due but not out yet.
+        MACRO_RECHECK_INTERVAL=6 * 60 * 60,
+        # background refresh of held and watchlist symbols (or run `flask prefetch`).
+        PREFETCH_ENABLED=False,
+        PREFETCH_INTERVAL=5 * 60,
+        PREFETCH_WATCHLIST=[],
+        PREFETCH_MAX_SYMBOLS=20,
+        # Alpha Vantage calls per day the prefetcher leaves for user requests.
+        PREFETCH_DAILY_RESERVE=15
     )
+    if test_config is not None:
+        app.config.update(test_config)
+
+    if app.config['PRELOAD_HEAVY_MODULES']:
+        lazy.preload()
 
     # ensure instance folder exists
     try:
@@ -21,9 +116,45 @@ def create_app():
     except OSError:
         pass
 
+    # init request metrics and /metrics
+    metrics.init_app(app)
+
     # init database
     db.init_app(app)
 
+    # init price bar archive
+    archive.init_app(app)
+
+    # init upstream response cache
+    cache.init_app(app)
+
+    # init pooled upstream HTTP client
+    http_client.init_app(app)
+
+    # init offline upstream stub (when configured)
+    stub_upstream.init_app(app)
+
+    # init Alpha Vantage call budget
+    api_alphavantage.init_app(app)
+
+    # init local symbol index
+    symbols.init_app(app)
+
+    # init indicator result cache
+    indicators.init_app(app)
+
+    # init live update streams
+    live.init_app(app)
+
+    # init macro dashboard metrics
+    macro.init_app(app)
+
+    # init background prefetch
+    prefetch.init_app(app)
+
+    # init benchmark command
+    benchmark.init_app(app)
+
     # Home Page.
     @app.route('/')
     def home():
@@ -35,4 +166,10 @@ def create_app():
     # Init stock blueprint
     app.register_blueprint(stocks.bp)
 
+    # Init stocks page data API blueprint
+    app.register_blueprint(api.bp)
+
+    # Init macro dashboard blueprint
+    app.register_blueprint(macro.bp)
+
     return app
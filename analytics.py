@@ -0,0 +1,142 @@
+''' vectorized parsing and statistics for Alpha Vantage time series. '''
+
+from stock_trends.lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Alpha Vantage bar fields and the column each one is parsed into.
+BAR_FIELDS = {
+    '1. open': 'open',
+    '2. high': 'high',
+    '3. low': 'low',
+    '4. close': 'close',
+    '5. volume': 'volume',
+}
+COLUMNS = tuple(BAR_FIELDS.values())
+
+
+def parse_time_series(data_set: dict) -> 'pd.DataFrame':
+    """ converts Alpha Vantage time series json data into typed columns.
+
+    Each field is converted in one numpy pass instead of calling strptime and
+    float() per bar. Timestamps ('YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS') are
+    parsed by numpy directly.
+
+    Args:
+        data_set: time series json data from Alpha Vantage API call.
+
+    Returns:
+        pd.DataFrame: float64 open, high, low, close and volume columns on a
+            DatetimeIndex, sorted oldest to newest.
+    """
+    count = len(data_set)
+    timestamps = np.array(list(data_set), dtype='datetime64[s]')
+    bars = list(data_set.values())
+    order = np.argsort(timestamps, kind='stable')
+
+    columns = {}
+    for field, column in BAR_FIELDS.items():
+        if bars and field not in bars[0]:
+            continue
+        raw = np.fromiter((entry[field] for entry in bars), dtype='U32', count=count)
+        columns[column] = raw.astype(np.float64)[order]
+
+    return pd.DataFrame(columns, index=pd.DatetimeIndex(timestamps[order], name='date'))
+
+
+def frame_from_bars(rows) -> 'pd.DataFrame':
+    """ converts (timestamp, OHLCV) rows back into typed columns.
+
+    Args:
+        rows: (timestamp, open, high, low, close, volume) rows, oldest first.
+
+    Returns:
+        pd.DataFrame: same layout as parse_time_series.
+    """
+    values = np.array(rows, dtype=np.float64).reshape(-1, len(COLUMNS) + 1)
+    index = pd.DatetimeIndex(values[:, 0].astype(np.int64).astype('datetime64[s]'), name='date')
+    return pd.DataFrame(values[:, 1:], columns=list(COLUMNS), index=index)
+
+
+def resample_bars(bars: dict, seconds: int) -> 'pd.DataFrame':
+    """ aggregates bars into longer bars in one vectorized pass per column.
+
+    Each period takes the first open, highest high, lowest low, last close
+    and total volume of its bars, and is labelled by its start (Ex: 5min bars
+    at 9:30 to 9:55 become the 30min bar at 9:30). Periods without bars
+    (Ex: overnight) are left out. The columns are only read, so memory
+    mapped slices are aggregated without being copied first.
+
+    Args:
+        bars: dictonary of timestamp (seconds since epoch) and open, high,
+            low, close and volume arrays, oldest first (Ex: PriceArchive.read).
+        seconds: period length, a multiple of the bars' interval.
+
+    Returns:
+        pd.DataFrame: same layout as frame_from_bars.
+    """
+    timestamps = np.asarray(bars['timestamp'], dtype=np.int64)
+    if timestamps.size == 0:
+        return frame_from_bars([])
+    periods = timestamps - timestamps % seconds
+    starts = np.flatnonzero(np.concatenate(([True], periods[1:] != periods[:-1])))
+    ends = np.append(starts[1:], len(periods)) - 1
+
+    columns = {
+        'open': np.asarray(bars['open'], dtype=np.float64)[starts],
+        'high': np.fmax.reduceat(np.asarray(bars['high'], dtype=np.float64), starts),
+        'low': np.fmin.reduceat(np.asarray(bars['low'], dtype=np.float64), starts),
+        'close': np.asarray(bars['close'], dtype=np.float64)[ends],
+        'volume': np.add.reduceat(np.asarray(bars['volume'], dtype=np.float64), starts),
+    }
+    index = pd.DatetimeIndex(periods[starts].astype('datetime64[s]'), name='date')
+    return pd.DataFrame(columns, index=index)
+
+
+def compute_stats(prices: 'np.ndarray') -> dict:
+    """ generates basic statistics over a price column.
+
+    Args:
+        prices: float array of prices.
+
+    Returns:
+        Dict: dictonary with mean, stdev, median, max and min.
+    """
+    return {
+        'mean': float(np.mean(prices)),
+        'stdev': float(np.std(prices)),
+        'median': float(np.median(prices)),
+        'max': float(np.max(prices)),
+        'min': float(np.min(prices))
+    }
+
+
+def extreme_indices(columns, buckets: int) -> 'np.ndarray':
+    """ positions of the lowest and highest value of every column in each bucket.
+
+    The columns are cut into buckets equal slices (about one per pixel
+    column) and each slice's extremes are found with one argmin/argmax over
+    a (buckets, slice) view, so no peak or trough of any column is lost.
+
+    Args:
+        columns: equal length float arrays, NaN is ignored.
+        buckets: number of slices.
+
+    Returns:
+        np.ndarray: sorted unique positions, the first and last included.
+    """
+    count = len(columns[0])
+    size = -(-count // buckets)
+    rows = -(-count // size)
+    offsets = np.arange(rows) * size
+    keep = [np.array([0, count - 1])]
+    for values in columns:
+        grid = np.full(rows * size, np.nan)
+        grid[:count] = values
+        grid = grid.reshape(rows, size)
+        missing = np.isnan(grid)
+        keep.append(offsets + np.where(missing, np.inf, grid).argmin(axis=1))
+        keep.append(offsets + np.where(missing, -np.inf, grid).argmax(axis=1))
+    positions = np.unique(np.concatenate(keep))
+    return positions[positions < count]
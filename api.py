@@ -0,0 +1,239 @@
+''' versioned json API of the stocks page data, with conditional GET and compression. '''
+
+import gzip
+import hashlib
+import time
+from datetime import datetime, timezone
+from flask import Blueprint, Response, current_app, jsonify, request
+from stock_trends.analytics import COLUMNS, compute_stats, extreme_indices
+from stock_trends.api_alphavantage import (BAR_SECONDS, PRICE_COLUMN, get_news, load_price_bars)
+from stock_trends.cache import MARKET_TIMEZONE
+from stock_trends.indicators import (DEFAULT_INDICATORS, InvalidIndicator, compute_indicators,
+                                     indicators_to_json, is_overlay, parse_specs,
+                                     series_version)
+from stock_trends.lazy import lazy_import
+from stock_trends.stocks import BAR_INTERVALS, MAX_BARS, MAX_NEWS_ARTICLES, UPSTREAM_ERRORS
+
+try:
+    import brotli
+except ImportError:  # optional, responses are gzipped instead.
+    brotli = None
+
+np = lazy_import('numpy')
+
+# bump whenever a response's layout changes, so cached responses are not reused.
+API_VERSION = 'v1'
+
+bp = Blueprint('api', __name__, url_prefix=f'/stocks/api/{API_VERSION}')
+
+# responses smaller than this (bytes) are sent uncompressed.
+MIN_COMPRESS_SIZE = 512
+
+# intervals Alpha Vantage labels by the last trading day of the period
+# (so far), rather than by the period's start.
+PERIOD_END_INTERVALS = ('Weekly', 'Monthly')
+
+
+class ApiError(Exception):
+    ''' answered with a json error message and status code. '''
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+@bp.errorhandler(ApiError)
+def api_error(error):
+    ''' answers an ApiError. '''
+    return jsonify(error=str(error)), error.status
+
+
+def _etag(*parts) -> str:
+    return hashlib.sha256('|'.join(map(str, (API_VERSION,) + parts)).encode()).hexdigest()[:32]
+
+
+def _not_modified(etag: str, last_modified: datetime = None):
+    """ a 304 response when the client's copy is current, otherwise None.
+
+    Checked before the body is built, so revalidating costs no serialization.
+    """
+    response = Response(status=200)
+    _validators(response, etag, last_modified)
+    response = response.make_conditional(request)
+    return response if response.status_code == 304 else None
+
+
+def _validators(response, etag: str, last_modified: datetime = None):
+    # weak, as the same content is served with different encodings.
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # cacheable, but revalidated on every use.
+    response.cache_control.no_cache = True
+    return response
+
+
+def _bar_modified(frame, interval: str) -> datetime:
+    """ when the newest bar last changed: the end of its period, or now while it is forming.
+
+    Bar timestamps are New York wall clock times. A weekly or monthly bar is
+    labelled by its last trading day so far and only changes during that
+    day, so it ends with the day rather than a week or month later.
+    """
+    label = datetime.fromtimestamp(int(frame.index[-1].timestamp()), timezone.utc)
+    label = label.replace(tzinfo=MARKET_TIMEZONE).timestamp()
+    span = BAR_SECONDS['Daily' if interval in PERIOD_END_INTERVALS else interval]
+    return datetime.fromtimestamp(min(label + span, time.time()), timezone.utc)
+
+
+def _json_column(values) -> list:
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def _downsample(frame, results: dict, width: int):
+    """ thins bars to the points that can show on a chart width pixels wide.
+
+    Every pixel column keeps the bars holding the lowest and highest price
+    and indicator values, so the chart looks the same as one drawn from every
+    bar. Indicators are computed from every bar before this. Series of at
+    most two bars per pixel column are returned as is.
+
+    Returns:
+        Tuple: (frame, results) of the kept bars.
+    """
+    if len(frame) <= 2 * width:
+        return frame, results
+    columns = [frame[PRICE_COLUMN].to_numpy()] + [
+        values for lines in results.values() for values in lines.values()]
+    keep = extreme_indices(columns, width)
+    return frame.iloc[keep], {label: {line: values[keep] for line, values in lines.items()}
+                              for label, lines in results.items()}
+
+
+def _load(symbol: str):
+    """ the bars of a symbol the interval and limit query parameters ask for.
+
+    Returns:
+        Tuple: (symbol, interval, frame), see load_price_bars.
+    """
+    interval = request.args.get('interval', 'Daily')
+    limit = min(max(request.args.get('limit', 100, type=int), 1), MAX_BARS)
+    if interval not in BAR_INTERVALS:
+        raise ApiError(f"interval must be one of {', '.join(BAR_INTERVALS)}")
+    try:
+        symbol, interval, frame = load_price_bars(
+            symbol.upper(), interval, current_app.config['MOCK_DATA'], limit)
+    except UPSTREAM_ERRORS as error:
+        current_app.logger.warning('api bars for %s failed: %r', symbol, error)
+        raise ApiError('Could not load this series, please try again later.', 502) from error
+    if frame.empty:
+        raise ApiError('No bars are available for this series.', 404)
+    return symbol, interval, frame
+
+
+@bp.route('/<symbol>/bars')
+def bars(symbol):
+    """ bars and indicator lines of a series as columns.
+
+    Query parameters: interval (Daily, Weekly, Monthly or 1min to 60min),
+    limit (bars), indicators (Ex: sma:20,bb:20:2,rsi) and width (pixel
+    columns of the chart, longer series are downsampled to it). The response
+    has symbol, interval, price (the column charts and stats use), time
+    (seconds since epoch, New York wall clock), open, high, low, close and
+    volume arrays, oldest first, and indicators: each spec's label mapped to
+    overlay (drawn over the prices) and lines.
+    """
+    width = request.args.get('width', type=int)
+    try:
+        specs = (parse_specs(request.args.get('indicators', ''))
+                 or parse_specs(DEFAULT_INDICATORS))
+    except InvalidIndicator as error:
+        raise ApiError(str(error)) from error
+    symbol, interval, frame = _load(symbol)
+
+    series = f'{symbol}:{interval}'
+    version = series_version(series, frame, PRICE_COLUMN)
+    etag = _etag('bars', version, width, *specs)
+    last_modified = _bar_modified(frame, interval)
+    cached = _not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+
+    results = compute_indicators(frame, specs, PRICE_COLUMN, series)
+    if width is not None:
+        frame, results = _downsample(frame, results, max(width, 1))
+    results = indicators_to_json(results)
+    data = {
+        'symbol': symbol,
+        'interval': interval,
+        'price': PRICE_COLUMN,
+        'time': frame.index.to_numpy().astype('datetime64[s]').astype(np.int64).tolist(),
+        **{column: _json_column(frame[column].to_numpy()) for column in COLUMNS},
+        'indicators': {label: {'overlay': is_overlay(label), 'lines': lines}
+                       for label, lines in results.items()},
+    }
+    return _validators(jsonify(data), etag, last_modified)
+
+
+@bp.route('/<symbol>/stats')
+def stats(symbol):
+    """ statistics of a series' prices.
+
+    Query parameters: interval and limit, see bars. The response has symbol,
+    interval, last_bar (seconds since epoch) and stats (mean, stdev, median,
+    max and min).
+    """
+    symbol, interval, frame = _load(symbol)
+
+    etag = _etag('stats', series_version(f'{symbol}:{interval}', frame, PRICE_COLUMN))
+    last_modified = _bar_modified(frame, interval)
+    cached = _not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+
+    return _validators(jsonify(
+        symbol=symbol, interval=interval, last_bar=int(frame.index[-1].timestamp()),
+        stats=compute_stats(frame[PRICE_COLUMN].to_numpy())), etag, last_modified)
+
+
+@bp.route('/<symbol>/news')
+def news(symbol):
+    """ latest news articles mentioning a symbol, newest first.
+
+    Query parameters: limit. The response has symbol and articles, see
+    news.article_to_json (/stocks/news also searches and pages).
+    """
+    limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_NEWS_ARTICLES)
+    try:
+        articles = get_news(symbol, current_app.config['MOCK_DATA'], limit)
+    except UPSTREAM_ERRORS as error:
+        current_app.logger.warning('api news for %s failed: %r', symbol, error)
+        raise ApiError('Could not load the news, please try again later.', 502) from error
+
+    etag = _etag('news', symbol.upper(), *(article['id'] for article in articles))
+    last_modified = (datetime.fromisoformat(articles[0]['time_published']).replace(
+        tzinfo=timezone.utc) if articles else None)
+    cached = _not_modified(etag, last_modified)
+    if cached is not None:
+        return cached
+
+    return _validators(jsonify(symbol=symbol.upper(), articles=articles), etag, last_modified)
+
+
+@bp.after_request
+def compress(response):
+    """ compresses json bodies with brotli (when installed) or gzip, as the client accepts. """
+    if (response.status_code != 200 or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or response.content_length is None or response.content_length < MIN_COMPRESS_SIZE):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(response.get_data(), quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(response.get_data(), compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
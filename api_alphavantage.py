@@ -1,285 +1,462 @@
 '''functions to utilize the Alpha Vantage API '''
 # Docs: https://www.alphavantage.co/documentation/
 
-from datetime import datetime
-import base64
-import io
 import os
-import requests
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from stock_trends import http_client
+from stock_trends.analytics import parse_time_series, resample_bars
+from stock_trends.archive import get_archive
+from stock_trends.cache import (cached_json, make_key, refresh_window, ttl_for, MARKET_TIMEZONE,
+                                MemoryCache)
+from stock_trends.db import get_latest_news_timestamp, get_news_articles, store_news_articles
+from stock_trends.indicators import compute_indicators
+from stock_trends.lazy import lazy_import
+from stock_trends.metrics import format_family, register_collector, timed
+from stock_trends.news import article_to_json, parse_feed, time_from
+from stock_trends.throttle import QuotaScheduler, SingleFlight
+np = lazy_import('numpy')
 ALPHAVANTAGE_API_KEY = os.getenv('ALPHAVANTAGE_API_KEY')
 BASE_URL = "https://www.alphavantage.co/query"
 
-def create_graph_and_stats_on_alphavantage_data_set(
-        data_set, is_intraday: bool = False):
-    """Creates a graph and generates basic statistics
+# price column the statistics, charts and price based indicators use.
+PRICE_COLUMN = 'open'
+
+# Alpha Vantage function and json key of each stored bar interval.
+SERIES = {
+    'Daily': ('TIME_SERIES_DAILY', 'Time Series (Daily)'),
+    'Weekly': ('TIME_SERIES_WEEKLY', 'Weekly Time Series'),
+    'Monthly': ('TIME_SERIES_MONTHLY', 'Monthly Time Series'),
+}
+
+# functions that accept outputsize, a compact response holds the latest 100 bars.
+OUTPUTSIZE_FUNCTIONS = ('TIME_SERIES_DAILY', 'TIME_SERIES_INTRADAY')
+COMPACT_BARS = 100
+
+# wall clock seconds per bar, used to judge whether a compact response closes the gap.
+BAR_SECONDS = {
+    'Daily': 24 * 60 * 60,
+    'Weekly': 7 * 24 * 60 * 60,
+    'Monthly': 28 * 24 * 60 * 60,
+    '1min': 60,
+    '5min': 5 * 60,
+    '15min': 15 * 60,
+    '30min': 30 * 60,
+    '60min': 60 * 60,
+}
+
+# (symbol, interval) -> (unix time it expires, market clock) of this process'
+# last sync. The TTL is taken at sync time: for daily data it runs to the
+# close, and taken later it would keep a pre-close sync fresh overnight.
+_synced = {}
+
+# every intraday interval is resampled from one stored series per symbol, so
+# switching intervals costs no upstream call.
+BASE_INTERVAL = '1min'
+
+# resampled intraday bars, (symbol, interval, limit) -> (base series' last
+# sync, frame). The TTL only bounds how long unused frames are kept.
+_resampled = MemoryCache(max_entries=256)
+RESAMPLED_TTL = 24 * 60 * 60
+
+# most articles a NEWS_SENTIMENT request returns, and ticker -> unix time
+# this process' last news sync expires.
+NEWS_LIMIT = 1000
+_news_synced = {}
+
+# US economic indicators, and the parameters the demo key serves them with.
+MACRO_FUNCTIONS = ('CPI', 'INFLATION', 'RETAIL_SALES', 'UNEMPLOYMENT', 'REAL_GDP',
+                   'TREASURY_YIELD', 'FEDERAL_FUNDS_RATE')
+MACRO_DEMO_PARAMS = {
+    'CPI': {'interval': 'monthly'},
+    'REAL_GDP': {'interval': 'annual'},
+    'TREASURY_YIELD': {'interval': 'monthly', 'maturity': '10year'},
+    'FEDERAL_FUNDS_RATE': {'interval': 'monthly'},
+}
+
+# keys Alpha Vantage uses (with a 200 status) for errors and quota notices.
+ERROR_KEYS = ('Error Message', 'Note', 'Information')
+
+# identical concurrent requests share a single upstream call.
+_in_flight = SingleFlight()
+
+# free tier limits, replaced by init_app with the configured budget.
+_scheduler = QuotaScheduler(calls_per_minute=5, calls_per_day=25)
+
+# daily reserve of the current thread's background calls, see background_calls.
+_background = threading.local()
+
+
+class AlphaVantageError(RuntimeError):
+    ''' raised when Alpha Vantage answers with an error or quota payload. '''
+
+
+def acquire_quota(apikey: str) -> None:
+    """ takes a quota token for one upstream call made with apikey.
+
+    Calls using our API key wait for the quota scheduler, the shared 'demo'
+    key is not budgeted. Inside background_calls only a token that is free
+    right away is taken, see QuotaScheduler.acquire.
+    """
+    if apikey == 'demo':
+        return
+    daily_reserve = getattr(_background, 'daily_reserve', None)
+    if daily_reserve is None:
+        _scheduler.acquire()
+    else:
+        _scheduler.acquire(daily_reserve=daily_reserve, max_wait=0)
+
+
+def query(params: dict):
+    """ performs an Alpha Vantage request, served from the response cache when fresh.
+
+    Concurrent identical requests are coalesced and calls using our API key
+    wait for the quota scheduler (the shared 'demo' key is not budgeted).
 
     Args:
-        data_set: time series json data from Alpha Vantage API call.
-        is_intraday: flag that should be True when passing Intraday data.
+        params: query parameters, must include 'function' and 'apikey'.
 
     Returns:
-        Dict: dictonary containing graph data, and statistics.
+        Dict: decoded JSON payload.
     """
 
-    if is_intraday:
-        format_string = "%Y-%m-%d %H:%M:%S"
-    else:
-        format_string = "%Y-%m-%d"
-
-    x_values = []
-    y_values = []
-
-    for date, inner_data_dict in data_set.items():
-        y_values.append(float(inner_data_dict["1. open"]))
-        x_values.append(datetime.strptime(date, format_string))
-
-    # Generate Stats.
-    stats = {
-        'mean': np.mean(y_values),
-        'stdev': np.std(y_values),
-        'median': np.median(y_values),
-        'max': np.max(y_values),
-        'min': np.min(y_values)
-    }
+    def fetch():
+        # a token per attempt, retries are upstream calls too.
+        request = http_client.get(BASE_URL, params=params, endpoint=params['function'],
+                                  before_attempt=lambda: acquire_quota(params['apikey']))
+        request.raise_for_status()
+        with timed('parse'):
+            payload = request.json()
+        for key in ERROR_KEYS:
+            if key in payload:
+                raise AlphaVantageError(f"{params['function']}: {payload[key]}")
+        return payload
+
+    return _in_flight.do(
+        make_key(BASE_URL, params),
+        lambda: cached_json(params['function'], BASE_URL, params, fetch))
+
+
+@contextmanager
+def background_calls(daily_reserve: int):
+    """ makes the current thread's calls yield to user requests.
+
+    Inside the block a call only takes a quota token that is available right
+    away and never uses the last daily_reserve calls of the daily budget,
+    otherwise it raises QuotaExceeded.
+    """
+    _background.daily_reserve = daily_reserve
+    try:
+        yield
+    finally:
+        _background.daily_reserve = None
+
+
+def quota_stats() -> dict:
+    ''' scheduler queue/wait statistics plus the number of coalesced calls. '''
+    stats = _scheduler.stats()
+    stats['in_flight'] = _in_flight.in_flight()
+    stats['coalesced_calls'] = _in_flight.shared
+    return stats
+
+
+def collect_metrics():
+    ''' quota scheduler and request coalescing metric families. '''
+    stats = quota_stats()
+    return [
+        format_family('alphavantage_queue_depth', 'gauge',
+                      'Calls waiting for an Alpha Vantage quota token.',
+                      [('', {}, stats['queue_depth'])]),
+        format_family('alphavantage_calls_remaining_today', 'gauge',
+                      'Alpha Vantage calls left in the daily budget.',
+                      [('', {}, stats['remaining_today'])]),
+        format_family('alphavantage_quota_wait_seconds_total', 'counter',
+                      'Time calls spent waiting for a quota token.',
+                      [('', {}, stats['total_wait'])]),
+        format_family('alphavantage_coalesced_calls_total', 'counter',
+                      'Calls answered by an identical call already in flight.',
+                      [('', {}, stats['coalesced_calls'])]),
+    ]
+
+
+def init_app(app):
+    ''' configures the Alpha Vantage call budget from the app config. '''
+    global _scheduler  # pylint: disable=W0603
+    _scheduler = QuotaScheduler(
+        calls_per_minute=app.config['ALPHAVANTAGE_CALLS_PER_MINUTE'],
+        calls_per_day=app.config['ALPHAVANTAGE_CALLS_PER_DAY'],
+        max_wait=app.config['ALPHAVANTAGE_MAX_QUEUE_WAIT'])
+    register_collector('alphavantage', collect_metrics)
+
+
+def market_clock() -> int:
+    ''' current New York wall clock time as seconds since epoch, like stored bar timestamps. '''
+    return int(datetime.now(MARKET_TIMEZONE).replace(tzinfo=timezone.utc).timestamp())
+
+
+def sync_price_bars(symbol: str, interval: str, params: dict, key: str,
+                    full_history: bool = False) -> None:
+    """ brings the archived series up to date with only the bars it is missing.
+
+    A compact request (latest 100 bars) is enough when the newest stored bar,
+    or the last sync, is within that window; otherwise the full series is
+    requested once to close the gap. Monthly and weekly series are always
+    complete. A series synced within its cache TTL is left alone.
 
-    df = pd.DataFrame({'Date': x_values, 'Price': y_values})
-
-    # Create Graph
-    plt.figure(figsize=(12, 8))
-
-    # Plot original data + ma's
-    plt.scatter(
-        df['Date'],
-        df['Price'],
-        label='Original Data',
-        color='#007acc',
-        linewidth=1.5)
-
-    # Calculate moving averages
-    df['MA_5'] = df['Price'].rolling(window=5).mean()
-    df['MA_10'] = df['Price'].rolling(window=10).mean()
-    df['MA_15'] = df['Price'].rolling(window=15).mean()
-
-    if is_intraday:
-        plt.plot(
-            df['Date'],
-            df['MA_5'],
-            label='5-min MA',
-            color='#FF6F61',
-            linestyle='--',
-            linewidth=1)
-        plt.plot(
-            df['Date'],
-            df['MA_10'],
-            label='10-min MA',
-            color='#8B0000',
-            linestyle='--',
-            linewidth=1)
-        plt.plot(
-            df['Date'],
-            df['MA_15'],
-            label='15-min MA',
-            color='#228B22',
-            linestyle='--',
-            linewidth=1)
-    else:
-        plt.plot(
-            df['Date'],
-            df['MA_5'],
-            label='5-Day MA',
-            color='#FF6F61',
-            linestyle='--',
-            linewidth=1)
-        plt.plot(
-            df['Date'],
-            df['MA_10'],
-            label='10-Day MA',
-            color='#8B0000',
-            linestyle='--',
-            linewidth=1)
-        plt.plot(
-            df['Date'],
-            df['MA_15'],
-            label='15-Day MA',
-            color='#228B22',
-            linestyle='--',
-            linewidth=1)
-
-    plt.xlabel('Date', fontsize=14, color='#444444')
-    plt.ylabel('Price', fontsize=14, color='#444444')
-    plt.title(
-        'Stock Price Analysis',
-        fontsize=24,
-        color='#333333',
-        fontweight='bold',
-        fontfamily='sans-serif')
-
-    # Add grid with subtle lines
-    plt.grid(True, linestyle='-', linewidth=0.5, alpha=0.1)
-
-    # Remove top and right spines
-    plt.gca().spines['top'].set_visible(False)
-    plt.gca().spines['right'].set_visible(False)
-
-    # Set background color with a gradient effect
-    plt.gca().set_facecolor('#F7F7F7')
-
-    plt.xticks(fontsize=12, color='#666666')
-    plt.yticks(fontsize=12, color='#666666')
-
-    plt.legend(
-        loc='upper left',
-        fontsize=12,
-        edgecolor='#333333',
-        facecolor='#F7F7F7')
-
-    plt.gca().patch.set_edgecolor('black')
-    plt.gca().patch.set_linewidth(1)
-    plt.gca().patch.set_facecolor('none')
-
-    # Save Plot
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png')
-    buffer.seek(0)
-    plot_data = base64.b64encode(buffer.read()).decode('utf-8')
-
-    return {'plot': plot_data, 'stats': stats}
-
-
-def get_stock_data(
-        ticker: str,
-        time_interval: str,
-        use_mock_data: bool = False):
-    """ utilizes Alpha Vantage API to gather stock data.
+    Args:
+        symbol: stock ticker the bars are stored under.
+        interval: bar interval (Ex: Daily, 5min).
+        params: Alpha Vantage request parameters for the series.
+        key: json key holding the time series.
+        full_history: request the full series when nothing is stored yet.
+    """
+    last_sync = _synced.get((symbol, interval))
+    if last_sync is not None and time.time() < last_sync[0] - refresh_window():
+        return
+
+    archive = get_archive()
+    latest = archive.latest_timestamp(symbol, interval)
+    now = market_clock()
+
+    if params['function'] in OUTPUTSIZE_FUNCTIONS:
+        if latest is None:
+            outputsize = 'full' if full_history else 'compact'
+        else:
+            covered = max(latest, last_sync[1]) if last_sync else latest
+            missing_bars = (now - covered) / BAR_SECONDS[interval]
+            outputsize = 'compact' if missing_bars < COMPACT_BARS else 'full'
+        params = dict(params, outputsize=outputsize)
+
+    data_set = query(params)[key]
+    with timed('parse'):
+        frame = parse_time_series(data_set)
+
+    # the newest stored bar may still have been forming, so it is replaced too.
+    if latest is not None:
+        frame = frame[frame.index >= np.datetime64(latest, 's')]
+
+    archive.store(symbol, interval, frame)
+    _synced[(symbol, interval)] = (time.time() + ttl_for(params['function']), now)
+
+
+def stored_interval(interval: str, use_mock_data: bool = False) -> str:
+    """ interval the bars of a series are stored at.
+
+    Daily, weekly and monthly series are stored as is, intraday intervals
+    are resampled from the BASE_INTERVAL series (5min with the demo key,
+    which only serves IBM at 5 minutes).
+    """
+    if interval in SERIES:
+        return interval
+    if interval not in BAR_SECONDS:
+        raise ValueError(f'unknown bar interval: {interval}')
+    return '5min' if use_mock_data else BASE_INTERVAL
+
+
+def sync_series(ticker: str, interval: str, use_mock_data: bool = False):
+    """ brings a stored series up to date, see sync_price_bars.
+
+    Intraday intervals sync their base series (see stored_interval), with
+    its full history the first time so every coarser interval can be
+    resampled from it.
 
     Args:
         ticker: Stock ticker. (Ex: AAPL, MSFT).
-        time_interval: time interval must be 'Daily', 'Weekly', or 'Monthly'.
+        interval: 'Daily', 'Weekly', 'Monthly' or an intraday interval
+            ('1min', '5min', '15min', '30min', '60min').
         use_mock_data: data utilized for testing.
 
     Returns:
-        Dict: dictonary containing graph data, and statistics.
+        Tuple: (symbol, interval) of the bars, see get_bars. The interval is
+            the stored one when the requested interval is finer.
     """
-    function_param = ''
-    key = ''
-    if time_interval == "Daily":
-        function_param = "TIME_SERIES_DAILY"
-        key = "Time Series (Daily)"
-    elif time_interval == "Weekly":
-        function_param = "TIME_SERIES_WEEKLY"
-        key = "Weekly Time Series"
-    elif time_interval == "Monthly":
-        function_param = "TIME_SERIES_MONTHLY"
-        key = "Monthly Time Series"
+    symbol = 'IBM' if use_mock_data else ticker.upper()
+    apikey = 'demo' if use_mock_data else ALPHAVANTAGE_API_KEY
+    stored = stored_interval(interval, use_mock_data)
 
-    if use_mock_data:
-        request = requests.get(
-            f'https://www.alphavantage.co/query?function={function_param}&symbol=IBM&apikey=demo'
-            , timeout=20)
+    if interval in SERIES:
+        function_param, key = SERIES[interval]
+        params = {'function': function_param, 'symbol': symbol, 'apikey': apikey}
     else:
-        params = {
-            'function': f'TIME_SERIES_{function_param}',
-            'symbol': ticker,
-            'apikey': ALPHAVANTAGE_API_KEY
-        }
+        interval = max(interval, stored, key=BAR_SECONDS.get)
+        key = f"Time Series ({stored})"
+        params = {'function': 'TIME_SERIES_INTRADAY', 'symbol': symbol,
+                  'interval': stored, 'apikey': apikey}
 
-        request = requests.get(BASE_URL, params=params, timeout=20)
+    sync_price_bars(symbol, stored, params, key, full_history=interval not in SERIES)
+    return symbol, interval
 
-    # parse output
-    data = request.json()[key]
 
-    return create_graph_and_stats_on_alphavantage_data_set(data)
+def get_bars(symbol: str, interval: str, stored: str, limit: int = COMPACT_BARS):
+    """ loads the newest bars of a series, resampling them from the stored interval.
 
+    Bars are resampled straight from the archive's memory mapped columns.
+    Resampled bars are cached until the stored series is next synced.
 
+    Args:
+        symbol: stock ticker the bars are stored under.
+        interval: bar interval.
+        stored: interval the bars are stored at, see stored_interval.
+        limit: maximum number of bars, the newest are kept.
 
-def get_intraday_data_on_stock(
-        ticker: str,
-        time_interval: int = 5,
-        use_mock_data: bool = False):
-    """ utilizes Alpha Vantage API to gather intraday stock data.
+    Returns:
+        pd.DataFrame: bars as returned by PriceArchive.read_frame.
+    """
+    if interval == stored:
+        return get_archive().read_frame(symbol, interval, limit=limit)
+
+    key = f'{symbol}|{interval}|{limit}'
+    version = _synced.get((symbol, stored))
+    cached = _resampled.get(key)
+    if cached is not None and version is not None and cached[0] == version:
+        return cached[1]
+
+    # a period holds at most this many stored bars, so these cover limit + 1 periods.
+    count = (limit + 1) * (BAR_SECONDS[interval] // BAR_SECONDS[stored])
+    bars = get_archive().read(symbol, stored, limit=count)
+    with timed('analytics'):
+        frame = resample_bars(bars, BAR_SECONDS[interval])
+    if len(bars['timestamp']) == count:
+        # the oldest period may be missing bars that were not loaded.
+        frame = frame.iloc[1:]
+    frame = frame.iloc[-limit:]
+
+    if version is not None:
+        _resampled.set(key, (version, frame), RESAMPLED_TTL)
+    return frame
+
+
+def load_price_bars(ticker: str, interval: str, use_mock_data: bool = False,
+                    limit: int = COMPACT_BARS):
+    """ brings a stored series up to date and loads its latest bars.
 
     Args:
         ticker: Stock ticker. (Ex: AAPL, MSFT).
-        time_interval: time interval (in minutes) must be 1, 5, 10, 15, 30, 60.
+        interval: bar interval, see sync_series.
         use_mock_data: data utilized for testing.
+        limit: maximum number of bars, the newest are kept.
 
     Returns:
-        List: list containing opening prices at the given time_interval above.
+        Tuple: (symbol, interval, frame) with the bars as returned by get_bars.
     """
+    symbol, interval = sync_series(ticker, interval, use_mock_data)
+    frame = get_bars(symbol, interval, stored_interval(interval, use_mock_data), limit)
+    return symbol, interval, frame
 
-    if use_mock_data:
-        request = requests.get(
-        'https://www.alphavantage.co/query?function='+
-        'TIME_SERIES_INTRADAY&symbol=IBM&interval=5min&apikey=demo'
-            , timeout=20)
-        data = request.json()["Time Series (5min)"]
-    else:
-        params = {
-            'function': 'TIME_SERIES_INTRADAY',
-            'symbol': ticker,
-            'interval': time_interval,
-            'apikey': ALPHAVANTAGE_API_KEY
-        }
 
-        request = requests.get(BASE_URL, params=params, timeout=20)
-        data = request.json()[f"Time Series ({str(time_interval)}min)"]
+def get_indicators(ticker: str, interval: str, indicators, use_mock_data: bool = False,
+                   limit: int = COMPACT_BARS):
+    """ computes indicators over a stored series, for the JSON API.
 
-    return create_graph_and_stats_on_alphavantage_data_set(data, True)
+    Args:
+        ticker: Stock ticker. (Ex: AAPL, MSFT).
+        interval: bar interval, see load_price_bars.
+        indicators: parsed indicator specs, see indicators.parse_specs.
+        use_mock_data: data utilized for testing.
+        limit: maximum number of bars, the newest are kept.
 
+    Returns:
+        Dict: dictonary with the following keys.
+            * symbol (str)
+            * interval (str)
+            * dates (list): ISO timestamps of the bars, oldest first.
+            * prices (list): price of each bar.
+            * indicators (dict): see indicators.compute_indicators.
+    """
+    symbol, interval, frame = load_price_bars(ticker, interval, use_mock_data, limit)
+    with timed('analytics'):
+        results = compute_indicators(frame, indicators, PRICE_COLUMN, f'{symbol}:{interval}')
+    return {
+        'symbol': symbol,
+        'interval': interval,
+        'dates': np.datetime_as_string(frame.index.to_numpy(), unit='s').tolist(),
+        'prices': frame[PRICE_COLUMN].tolist(),
+        'indicators': results,
+    }
 
-def get_news(ticker: str, use_mock_data: bool = False):
-    """ utilizes Alpha Vantage API to gather news and sentiment of a stock and/or sector.
+
+def news_symbol(ticker: str, use_mock_data: bool = False) -> str:
+    ''' ticker the articles about ticker are stored under (the demo key only serves AAPL). '''
+    return 'AAPL' if use_mock_data else ticker.upper()
+
+
+def sync_news(ticker: str, use_mock_data: bool = False) -> str:
+    """ stores the articles about a ticker published since the newest stored one.
+
+    Only articles at or after the newest stored publication time are
+    requested (time_from); those already stored are skipped by url. A ticker
+    synced within the NEWS_SENTIMENT cache TTL is left alone.
 
     Args:
         ticker: Stock ticker. (Ex: AAPL, MSFT).
-        sector: options: "finance", "life_sciences", "technology", "manufacturing", "blockchain".
         use_mock_data: data utilized for testing.
 
     Returns:
-        List: list of dictonaries, with each dictonary containing the following keys:
-            * summary
-            * time_published
-            * url
-            * overall_sentiment_score
-            * overall_sentiment_label
+        str: ticker the articles are stored under.
     """
+    symbol = news_symbol(ticker, use_mock_data)
+    last_sync = _news_synced.get(symbol)
+    if last_sync is not None and time.time() < last_sync - refresh_window():
+        return symbol
 
     if use_mock_data:
-        request = requests.get(
-            'https://www.alphavantage.co/query?function=NEWS_SENTIMENT&tickers=AAPL&apikey=demo'
-            , timeout=20)
+        params = {'function': 'NEWS_SENTIMENT', 'tickers': 'AAPL', 'apikey': 'demo'}
     else:
-        params = {
-            'function': "NEWS_SENTIMENT",
-            'tickers': ticker,
-            'apikey': ALPHAVANTAGE_API_KEY
-        }
-        request = requests.get(BASE_URL, params=params, timeout=20)
+        params = {'function': 'NEWS_SENTIMENT', 'tickers': symbol, 'sort': 'LATEST',
+                  'limit': NEWS_LIMIT, 'apikey': ALPHAVANTAGE_API_KEY}
+        latest = get_latest_news_timestamp(symbol)
+        if latest is not None:
+            params['time_from'] = time_from(latest)
 
-    # parse output
-    json = request.json()
-    output = []
-    number_articles = 20 if int(json['items']) >= 20 else json['items']
-    for idx in range(number_articles):
-        current_article = json["feed"][idx]
-        article_output = {
-            "summary": current_article["summary"],
-            "time_published": current_article["time_published"],
-            "url": current_article["url"],
-            "overall_sentiment_score": current_article["overall_sentiment_score"],
-            "overall_sentiment_label": current_article["overall_sentiment_label"]}
-
-        output.append(article_output)
+    feed = query(params).get('feed', [])
+    with timed('parse'):
+        articles = parse_feed(feed)
+    store_news_articles(articles)
+    _news_synced[symbol] = time.time() + ttl_for('NEWS_SENTIMENT')
+    return symbol
 
-    return output
+
+def get_news(ticker: str, use_mock_data: bool = False, limit: int = 20):
+    """ gets the latest news and sentiment of a stock from the local news store.
+
+    Args:
+        ticker: Stock ticker. (Ex: AAPL, MSFT).
+        use_mock_data: data utilized for testing.
+        limit: maximum number of articles.
+
+    Returns:
+        List: list of dictonaries, newest first, see news.article_to_json.
+    """
+    symbol = sync_news(ticker, use_mock_data)
+    return [article_to_json(row) for row in get_news_articles(symbol, limit=limit)]
+
+
+def get_macro_series(function: str, use_mock_data: bool = False):
+    """ utilizes Alpha Vantage API to gather the full history of a US economic indicator.
+
+    Args:
+        function: one of MACRO_FUNCTIONS (Ex: CPI).
+        use_mock_data: data utilized for testing.
+
+    Returns:
+        List: dictonaries with date (YYYY-MM-DD) and value keys, newest first.
+    """
+    if use_mock_data:
+        params = dict(MACRO_DEMO_PARAMS.get(function, {}), function=function, apikey='demo')
+    else:
+        params = {'function': function, 'apikey': ALPHAVANTAGE_API_KEY}
+
+    return query(params)["data"]
 
 
 def get_us_market_data(use_mock_data: bool = False):
     """ utilizes Alpha Vantage API to gather US Market data.
 
+    The series are requested concurrently.
+
     Args:
         use_mock_data: data utilized for testing.
 
@@ -293,40 +470,10 @@ def get_us_market_data(use_mock_data: bool = False):
             * Treasury Yield
             * Rate
     """
-    us_market_data = {}
-    functions = ["CPI",
-                 "INFLATION",
-                 "RETAIL_SALES",
-                 "UNEMPLOYMENT",
-                 "REAL_GDP",
-                 "TREASURY_YIELD",
-                 "FEDERAL_FUNDS_RATE"
-                 ]
-
-    if use_mock_data:
-        test_urls = [
-            f"{BASE_URL}?function=CPI&interval=monthly&apikey=demo",
-            f"{BASE_URL}?function=INFLATION&apikey=demo",
-            f"{BASE_URL}?function=RETAIL_SALES&apikey=demo",
-            f"{BASE_URL}?function=UNEMPLOYMENT&apikey=demo",
-            f"{BASE_URL}?function=REAL_GDP&interval=annual&apikey=demo",
-            f"{BASE_URL}?function=TREASURY_YIELD&interval=monthly&maturity=10year&apikey=demo",
-            f"{BASE_URL}?function=FEDERAL_FUNDS_RATE&interval=monthly&apikey=demo"]
-        for key, url in zip(functions, test_urls):
-            request = requests.get(url, timeout=20)
-            us_market_data[key] = request.json()["data"][0]
-
-    else:
-        for function in functions:
-            params = {
-                'function': function,
-                'apikey': ALPHAVANTAGE_API_KEY
-            }
-
-            request = requests.get(BASE_URL, params=params, timeout=20)
-            us_market_data[function] = request.json()["data"][0]
-
-    return us_market_data
+    with ThreadPoolExecutor(max_workers=len(MACRO_FUNCTIONS)) as pool:
+        series = pool.map(lambda function: get_macro_series(function, use_mock_data),
+                          MACRO_FUNCTIONS)
+        return {function: data[0] for function, data in zip(MACRO_FUNCTIONS, series)}
 
 
 def get_ticker_suggestions(user_input: str, use_mock_data: bool = False):
@@ -341,9 +488,11 @@ def get_ticker_suggestions(user_input: str, use_mock_data: bool = False):
     """
 
     if use_mock_data:
-        request = requests.get(
-            'https://www.alphavantage.co/query?function=SYMBOL_SEARCH&keywords=tesco&apikey=demo'
-            , timeout=20)
+        params = {
+            'function': "SYMBOL_SEARCH",
+            'keywords': 'tesco',
+            "apikey": 'demo'
+        }
 
     else:
         params = {
@@ -352,9 +501,7 @@ def get_ticker_suggestions(user_input: str, use_mock_data: bool = False):
             "apikey": ALPHAVANTAGE_API_KEY
         }
 
-        request = requests.get(BASE_URL, params=params, timeout=20)
-
-    data = request.json()["bestMatches"]
+    data = query(params)["bestMatches"]
 
     output = []
 
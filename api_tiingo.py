@@ -2,8 +2,15 @@
 # Docs: https://www.tiingo.com/documentation/
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from stock_trends import http_client
+from stock_trends.cache import cached_json, get_cache, get_fresh, make_key, ttl_for
 TIINGO_API_KEY = os.getenv('TIINGO_API_KEY')
+IEX_URL = "https://api.tiingo.com/iex/"
+
+# upper bound on concurrent EOD lookups for tickers the IEX endpoint does not cover.
+MAX_QUOTE_WORKERS = 8
 
 headers = {
     'Content-Type': 'application/json',
@@ -11,19 +18,105 @@ headers = {
 }
 
 def get_current_stock_price(ticker: str):
-    """ utilizes Tiingo API to return stock open price.
+    """ utilizes Tiingo API to return the latest price of a stock.
 
-    # NOTE: this utilizes the EOD prices, as intraday requires a subscription.
+    The same quote the portfolio is valued at, see get_current_stock_prices.
 
     Args:
         ticker: Stock ticker. (Ex: AAPL, MSFT).
-        use_mock_data: data utilized for testing.
 
     Returns:
-        float: Stock open price for given ticker.
+        float: latest price for given ticker, raises KeyError when there is none.
     """
+    prices = get_current_stock_prices([ticker])
+    if ticker.upper() not in prices:
+        raise KeyError(f'no price for {ticker}')
+    return prices[ticker.upper()]
+
+
+def _get_eod_price(ticker: str):
+    """ close of the latest end of day bar of a stock.
 
+    # NOTE: this utilizes the EOD prices, as intraday requires a subscription.
+    """
     url = f"https://api.tiingo.com/tiingo/daily/{ticker}/prices"
-    request = requests.get(url, headers=headers, timeout=20)
 
-    return request.json()[0]['open']
+    def fetch():
+        request = http_client.get(url, headers=headers, endpoint='TIINGO_DAILY_PRICES')
+        request.raise_for_status()
+        return request.json()
+
+    return cached_json('TIINGO_DAILY_PRICES', url, {}, fetch)[0]['close']
+
+
+def _get_iex_prices(tickers):
+    """ fetches the latest IEX prices of many tickers in one request.
+
+    Returns:
+        Dict: ticker to price, tickers without a quote are left out.
+    """
+    request = http_client.get(
+        IEX_URL, params={'tickers': ','.join(tickers)}, headers=headers,
+        endpoint='TIINGO_IEX_QUOTE')
+    request.raise_for_status()
+
+    prices = {}
+    for quote in request.json():
+        # last trade, or the previous close before the first trade of the day.
+        price = quote.get('tngoLast') or quote.get('last') or quote.get('prevClose')
+        if price is not None:
+            prices[quote['ticker'].upper()] = float(price)
+    return prices
+
+
+def _get_price_or_none(ticker):
+    try:
+        return _get_eod_price(ticker)
+    except (requests.RequestException, KeyError, IndexError, ValueError):
+        return None
+
+
+def get_current_stock_prices(tickers):
+    """ utilizes Tiingo API to return the latest price of many stocks at once.
+
+    A quote is the last trade price. Quotes cached within their TTL are
+    reused, the rest are fetched with a single multi-ticker IEX request.
+    Tickers IEX does not cover (or all of them, when the IEX endpoint is
+    unavailable) fall back to concurrent lookups of the latest EOD close.
+
+    Args:
+        tickers: Stock tickers. (Ex: [AAPL, MSFT]).
+
+    Returns:
+        Dict: ticker to price, tickers without any price are left out.
+    """
+    cache = get_cache()
+    keys = {ticker: make_key(IEX_URL, {'ticker': ticker}) for ticker in
+            {ticker.upper() for ticker in tickers}}
+
+    prices = {}
+    for ticker, key in keys.items():
+        price = get_fresh(key)
+        if price is not None:
+            prices[ticker] = price
+
+    missing = sorted(set(keys) - set(prices))
+    if missing:
+        try:
+            fetched = {ticker: price for ticker, price in _get_iex_prices(missing).items()
+                       if ticker in keys}
+        except (requests.RequestException, ValueError):
+            fetched = {}
+
+        leftover = [ticker for ticker in missing if ticker not in fetched]
+        if leftover:
+            with ThreadPoolExecutor(max_workers=min(MAX_QUOTE_WORKERS, len(leftover))) as pool:
+                for ticker, price in zip(leftover, pool.map(_get_price_or_none, leftover)):
+                    if price is not None:
+                        fetched[ticker] = price
+
+        for ticker, price in fetched.items():
+            cache.set(keys[ticker], price, ttl_for('TIINGO_IEX_QUOTE'))
+        prices.update(fetched)
+
+    return prices
@@ -0,0 +1,276 @@
+''' append-only columnar archive of price bars, read through memory maps. '''
+
+import os
+import re
+import threading
+from contextlib import contextmanager
+from itertools import groupby
+import click
+from stock_trends.analytics import COLUMNS, frame_from_bars
+from stock_trends.db import get_db
+from stock_trends.lazy import lazy_import
+from stock_trends.metrics import format_family, register_collector
+
+try:
+    import fcntl
+except ImportError:  # no file locks (Windows), writers are only serialized per process.
+    fcntl = None
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# column files of a series: seconds since epoch (exchange wall clock, like
+# the bars Alpha Vantage reports) and float64 OHLCV, fixed-width little endian.
+TIMESTAMP_DTYPE = '<i8'
+VALUE_DTYPE = '<f8'
+ITEM_SIZE = 8
+
+# every INDEX_STRIDE-th timestamp (one 4 KiB page of them) is kept in a small
+# index file, so a range lookup binary searches the index and then one block
+# of the timestamp file.
+INDEX_STRIDE = 512
+INDEX_FILE = 'index.i8'
+
+# symbols and intervals become directory names.
+SERIES_NAME = re.compile(r'^[A-Za-z0-9^=_-][A-Za-z0-9.^=_-]*$')
+
+
+def _column_file(column: str) -> str:
+    return f'{column}.i8' if column == 'timestamp' else f'{column}.f8'
+
+
+class PriceArchive:
+    """ one directory of column files per symbol and interval, under path.
+
+    Bars are only ever written over or after the stored ones, so files never
+    shrink and memory maps held by readers stay valid. The timestamp file is
+    written last: a row becomes visible once its timestamp is there.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.bars_written = 0
+        self.reads = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def series_path(self, symbol: str, interval: str) -> str:
+        ''' directory of a series, raises ValueError for names that are not plain. '''
+        if not (SERIES_NAME.match(symbol) and SERIES_NAME.match(interval)):
+            raise ValueError(f'invalid series name: {symbol} {interval}')
+        return os.path.join(self.path, interval, symbol)
+
+    @staticmethod
+    def _rows(path: str) -> int:
+        try:
+            return os.path.getsize(os.path.join(path, _column_file('timestamp'))) // ITEM_SIZE
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def _map(path: str, column: str, rows: int) -> 'np.ndarray':
+        ''' read only memory map of a column's first rows. '''
+        dtype = TIMESTAMP_DTYPE if column == 'timestamp' else VALUE_DTYPE
+        if rows == 0:
+            # an empty file cannot be mapped.
+            return np.empty(0, dtype=dtype)
+        return np.memmap(os.path.join(path, _column_file(column)), dtype=dtype, mode='r',
+                         shape=(rows,))
+
+    @staticmethod
+    def _position(path: str, timestamps, timestamp: int, side: str = 'left') -> int:
+        """ row of timestamp (see np.searchsorted), found from the index and one block.
+
+        Only the index and the pages of one INDEX_STRIDE block of the
+        timestamp file are read.
+        """
+        rows = len(timestamps)
+        index = np.fromfile(os.path.join(path, INDEX_FILE), dtype=TIMESTAMP_DTYPE,
+                            count=-(-rows // INDEX_STRIDE))
+        block = int(np.searchsorted(index, timestamp, side))
+        low = max(block - 1, 0) * INDEX_STRIDE
+        high = min(block * INDEX_STRIDE, rows)
+        return low + int(np.searchsorted(timestamps[low:high], timestamp, side))
+
+    @staticmethod
+    def _write(path: str, name: str, row: int, values, dtype: str) -> None:
+        fd = os.open(os.path.join(path, name), os.O_RDWR | os.O_CREAT, 0o644)
+        with os.fdopen(fd, 'r+b') as handle:
+            handle.seek(row * ITEM_SIZE)
+            np.ascontiguousarray(values, dtype=dtype).tofile(handle)
+
+    @contextmanager
+    def _locked(self, path: str):
+        ''' serializes writers of the archive, and of a series across processes. '''
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(path, 'lock'), 'a+b') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def latest_timestamp(self, symbol: str, interval: str):
+        """ timestamp of the newest stored bar of a series.
+
+        Returns:
+            int: seconds since epoch, or None when nothing is stored.
+        """
+        path = self.series_path(symbol, interval)
+        rows = self._rows(path)
+        if rows == 0:
+            return None
+        return int(self._map(path, 'timestamp', rows)[-1])
+
+    def store(self, symbol: str, interval: str, frame) -> int:
+        """ stores parsed bars, replacing the stored bars at the same timestamps.
+
+        Bars after the newest stored one are appended. Bars at or before it
+        (Ex: a revision of the bar still forming, or older history) rewrite
+        the series from the first of them on, merged with the stored bars
+        they do not replace.
+
+        Args:
+            symbol: stock ticker.
+            interval: bar interval (Ex: Daily, 5min).
+            frame: bars as returned by parse_time_series, oldest first.
+
+        Returns:
+            int: number of bars in the series.
+        """
+        path = self.series_path(symbol, interval)
+        if frame.empty:
+            return self._rows(path)
+
+        timestamps = frame.index.to_numpy().astype('datetime64[s]').astype(np.int64)
+        values = {column: (frame[column].to_numpy(dtype=np.float64) if column in frame
+                           else np.full(len(frame), np.nan)) for column in COLUMNS}
+
+        os.makedirs(path, exist_ok=True)
+        with self._locked(path):
+            rows = self._rows(path)
+            stored = self._map(path, 'timestamp', rows)
+            start = self._position(path, stored, timestamps[0]) if rows else 0
+
+            if start < rows:
+                kept = ~np.isin(stored[start:], timestamps)
+                merged = np.concatenate((timestamps, stored[start:][kept]))
+                order = np.argsort(merged, kind='stable')
+                timestamps = merged[order]
+                values = {column: np.concatenate(
+                    (values[column], self._map(path, column, rows)[start:][kept]))[order]
+                          for column in COLUMNS}
+
+            for column in COLUMNS:
+                self._write(path, _column_file(column), start, values[column], VALUE_DTYPE)
+            first = -(-start // INDEX_STRIDE)
+            self._write(path, INDEX_FILE, first,
+                        timestamps[first * INDEX_STRIDE - start::INDEX_STRIDE], TIMESTAMP_DTYPE)
+            self._write(path, _column_file('timestamp'), start, timestamps, TIMESTAMP_DTYPE)
+
+            self.bars_written += len(timestamps)
+            return start + len(timestamps)
+
+    def read(self, symbol: str, interval: str, start: int = None, end: int = None,  # pylint: disable=R0913,R0917
+             limit: int = None, columns=COLUMNS) -> dict:
+        """ zero-copy slices of a series' columns.
+
+        Args:
+            symbol: stock ticker.
+            interval: bar interval (Ex: Daily, 5min).
+            start: only bars at or after this timestamp (seconds since epoch).
+            end: only bars before this timestamp.
+            limit: only the newest limit bars of the range.
+            columns: value columns to map, the timestamps always are.
+
+        Returns:
+            Dict: dictonary of timestamp and each column to a read only array
+                backed by the memory mapped file, oldest first.
+        """
+        path = self.series_path(symbol, interval)
+        rows = self._rows(path)
+        timestamps = self._map(path, 'timestamp', rows)
+        first = self._position(path, timestamps, start) if rows and start is not None else 0
+        last = self._position(path, timestamps, end) if rows and end is not None else rows
+        if limit is not None:
+            first = max(first, last - limit)
+        first = min(first, last)
+
+        self.reads += 1
+        series = {'timestamp': timestamps[first:last]}
+        series.update((column, self._map(path, column, rows)[first:last]) for column in columns)
+        return series
+
+    def read_frame(self, symbol: str, interval: str, start: int = None,
+                   limit: int = None) -> 'pd.DataFrame':
+        ''' bars of a series (see read) as a frame laid out like frame_from_bars. '''
+        series = self.read(symbol, interval, start, limit=limit)
+        return pd.DataFrame({column: np.array(series[column]) for column in COLUMNS},
+                            index=pd.DatetimeIndex(
+                                series['timestamp'].astype('datetime64[s]'), name='date'))
+
+    def series(self):
+        ''' (symbol, interval, bars) of every stored series. '''
+        found = []
+        for interval in sorted(os.listdir(self.path)):
+            interval_path = os.path.join(self.path, interval)
+            if os.path.isdir(interval_path):
+                found.extend((symbol, interval, self._rows(os.path.join(interval_path, symbol)))
+                             for symbol in sorted(os.listdir(interval_path)))
+        return found
+
+
+_state = {'archive': None}
+
+
+def get_archive() -> PriceArchive:
+    ''' returns the price bar archive. '''
+    return _state['archive']
+
+
+@click.command('archive-bars')
+def archive_bars_command():
+    """Move price bars stored in the database into the archive."""
+    db = get_db()
+    if db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'price_bars'"
+    ).fetchone() is None:
+        click.echo('No price bars stored in the database.')
+        return
+
+    archive = get_archive()
+    # one scan in primary key order: series by series, oldest bar first.
+    bars = db.execute(
+        'SELECT symbol, interval, timestamp, open, high, low, close, volume FROM price_bars \
+        ORDER BY symbol, interval, timestamp')
+    for (symbol, interval), rows in groupby(bars, key=lambda row: (row[0], row[1])):
+        count = archive.store(symbol, interval,
+                              frame_from_bars([tuple(row)[2:] for row in rows]))
+        click.echo(f'{symbol} {interval}: {count} bars')
+
+    # the archive is the bar store now, the table is not read again.
+    db.execute('DROP TABLE price_bars')
+    db.commit()
+
+
+def collect_metrics():
+    ''' archive write and read metric families. '''
+    archive = get_archive()
+    return [
+        format_family('price_archive_bars_written_total', 'counter',
+                      'Bars written to the price archive.',
+                      [('', {}, archive.bars_written)]),
+        format_family('price_archive_reads_total', 'counter',
+                      'Series read from the price archive.',
+                      [('', {}, archive.reads)]),
+    ]
+
+
+def init_app(app):
+    ''' opens the price bar archive from the app config. '''
+    _state['archive'] = PriceArchive(app.config['PRICE_ARCHIVE_PATH'])
+    register_collector('archive', collect_metrics)
+    app.cli.add_command(archive_bars_command)
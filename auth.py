@@ -2,7 +2,7 @@
 
 import re
 import sqlite3
-from flask import Blueprint, render_template, request, session, redirect, url_for
+from flask import Blueprint, jsonify, render_template, request, session, redirect, url_for
 from werkzeug.security import check_password_hash
 from stock_trends.db import (
     get_user_positions,
@@ -10,13 +10,33 @@ from stock_trends.db import (
     get_user,
     register_user,
     update_balance,
-    register_user_stock_purchase,
-    update_user_stock_purchase,
-    delete_user_stock_purchase)
+    register_user_stock_purchase)
 from stock_trends.api_tiingo import get_current_stock_price
+from stock_trends.ledger import FIFO, LOT_METHODS, InsufficientShares, sell_shares
+from stock_trends.portfolio import value_portfolio
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+
+def render_dashboard(username, balance, positions, error=None):
+    ''' renders the authorized page, its positions are valued by the page (see valuation). '''
+    return render_template(
+        'auth/authorized.html',
+        username=username,
+        balance=balance,
+        error=error,
+        positions=positions)
+
+
+# Portfolio valuation, loaded by the dashboard so quotes never hold up its render.
+@bp.route('/valuation')
+def valuation():
+    ''' the signed in user's positions valued at the latest prices, see value_portfolio. '''
+    if 'user_id' not in session:
+        return jsonify(error='Please sign in.'), 401
+    return jsonify(value_portfolio(get_user_positions(session['user_id'])))
+
+
 # Login Page.
 @bp.route('/login', methods=('GET', 'POST'))
 def login():
@@ -45,11 +65,7 @@ def login():
 
             balance = user['balance']
             positions = get_user_positions(session['user_id'])
-            return render_template(
-                "auth/authorized.html",
-                balance=balance,
-                username=username,
-                positions=positions)
+            return render_dashboard(username, balance, positions)
 
         return render_template("auth/login.html", error=error)
 
@@ -121,10 +137,8 @@ def deposit():
     user_balance = float(request.form['amount']) + user['balance']
     update_balance(session['user_id'], user_balance)
 
-    return render_template(
-        'auth/authorized.html',
-        username=user['username'],
-        balance=user_balance)
+    return render_dashboard(
+        user['username'], user_balance, get_user_positions(session['user_id']))
 
 # Purchase / Selling Logic:
 @bp.route('/purchase', methods=('POST',))
@@ -142,13 +156,11 @@ def stock_options():
 
         # User cannot purchase stock (insufficient funds or entered 0 as share amount).
         if new_balance < 0 or share_amount == 0:
-            return render_template(
-                'auth/authorized.html',
-                username=user['username'],
-                error='Insufficient funds.' if new_balance < 0 else "0 entered as share amount.",
-                balance=user['balance'],
-                positions=positions
-                )
+            return render_dashboard(
+                user['username'],
+                user['balance'],
+                positions,
+                error='Insufficient funds.' if new_balance < 0 else "0 entered as share amount.")
 
         update_balance(session['user_id'], new_balance)
         register_user_stock_purchase(
@@ -158,54 +170,20 @@ def stock_options():
             ticker)
 
         positions = get_user_positions(session['user_id'])
-        return render_template(
-            'auth/authorized.html',
-            username=user['username'],
-            balance=new_balance,
-            positions=positions)
-
-    # logic for handling selling action
-    user_positions = get_user_positions(session['user_id'])
-    total_shares = 0
-    potential_delete_shares = []
-    successful_deletion = False
-
-    for position in user_positions:
-        if position['stock_symbol'] == ticker:
-            total_shares += position['shares']
-            potential_delete_shares.append(position)
-
-            # check to see if there is enough shares
-            if total_shares >= share_amount:
-                remaining_shares = total_shares - share_amount
-                successful_deletion = True
-
-                # if remaining shares left, update count for last position
-                # and remove from deleting.
-                if remaining_shares != 0:
-                    update_user_stock_purchase(
-                        position['id'], remaining_shares)
-                    del potential_delete_shares[-1]
-
-                # delete all positions
-                for position in potential_delete_shares:
-                    delete_user_stock_purchase(position['id'])
-
-    if successful_deletion:
-        new_balance = (share_amount * stock_price) + user['balance']
-        update_balance(user['id'], new_balance)
-
-        user_positions = get_user_positions(user['id'])
-        return render_template(
-            'auth/authorized.html',
-            username=user['username'],
-            balance=new_balance,
-            positions=user_positions)
-
-    user_positions = get_user_positions(user['id'])
-    return render_template(
-        'auth/authorized.html',
-        username=user['username'],
-        balance=user['balance'],
-        error='Insufficient shares.',
-        positions=user_positions)
+        return render_dashboard(user['username'], new_balance, positions)
+
+    # logic for handling selling action, matched lots are sold in one transaction.
+    lot_method = request.form.get('lot_method', FIFO)
+    try:
+        new_balance, user_positions = sell_shares(
+            user['id'],
+            ticker,
+            share_amount,
+            stock_price,
+            method=lot_method if lot_method in LOT_METHODS else FIFO,
+            lot_id=request.form.get('lot_id', type=int))
+    except InsufficientShares as error:
+        return render_dashboard(
+            user['username'], user['balance'], get_user_positions(user['id']), error=str(error))
+
+    return render_dashboard(user['username'], new_balance, user_positions)
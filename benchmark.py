@@ -0,0 +1,337 @@
+''' offline load benchmark of the main routes, run against the stubbed upstream APIs. '''
+
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import click
+from stock_trends.db import init_db
+from stock_trends.lazy import HEAVY_MODULES, lazy_import
+from stock_trends.live import running_pollers
+from stock_trends.stub_upstream import STUB_SYMBOLS
+from stock_trends.symbols import refresh_index
+
+np = lazy_import('numpy')
+
+# credentials of the benchmark's virtual users.
+PASSWORD = 'Benchmark1'
+TICKERS = ('AAPL', 'MSFT', 'IBM')
+
+# latency percentiles reported per scenario.
+PERCENTILES = (50, 95, 99)
+
+
+def _stock_page(client, rng):  # pylint: disable=W0613
+    return client.post('/stocks/stock', data={
+        'stock_ticker': 'IBM',
+        'news_articles': 'on',
+        'last_30_day_prices': 'on',
+        'intraday_data': 'on'})
+
+
+def _bars(client, rng):
+    return client.get('/stocks/api/v1/IBM/bars', query_string={
+        'interval': rng.choice(('Daily', '5min', '15min')), 'indicators': 'sma:20,rsi'},
+        headers={'Accept-Encoding': 'gzip'})
+
+
+def _stream(client, rng):
+    # the body is never read, the subscription must still end once the
+    # response is closed (as a WSGI server closes it).
+    response = client.head('/stocks/stream', query_string={
+        'symbol': rng.choice(TICKERS), 'interval': '5min'})
+    response.close()
+    return response
+
+
+def _search(client, rng):
+    symbol = rng.choice(STUB_SYMBOLS)[0]
+    return client.get('/stocks/search', query_string={'q': symbol[:rng.randint(1, 2)]})
+
+
+def _login(client, rng):  # pylint: disable=W0613
+    return client.post('/auth/login', data={'username': client.username, 'password': PASSWORD})
+
+
+def _valuation(client, rng):  # pylint: disable=W0613
+    return client.get('/auth/valuation')
+
+
+def _deposit(client, rng):  # pylint: disable=W0613
+    return client.post('/auth/deposit', data={'amount': '100'})
+
+
+def _purchase(client, rng):
+    return client.post('/auth/purchase', data={
+        'ticker': rng.choice(TICKERS), 'shares': '1', 'action': 'purchase'})
+
+
+def _sell(client, rng):
+    return client.post('/auth/purchase', data={
+        'ticker': rng.choice(TICKERS), 'shares': '1', 'action': 'sell'})
+
+
+# scenario name -> function sending one request with a logged in test client.
+SCENARIOS = {
+    'stock': _stock_page,
+    'bars': _bars,
+    'stream': _stream,
+    'search': _search,
+    'login': _login,
+    'valuation': _valuation,
+    'deposit': _deposit,
+    'purchase': _purchase,
+    'sell': _sell,
+}
+
+
+def benchmark_config(workdir: str, **overrides) -> dict:
+    """ app settings isolating a benchmark run in workdir with stubbed upstream APIs.
+
+    Args:
+        workdir: directory for the database, caches and price archive.
+        overrides: further settings (Ex: UPSTREAM_STUB_LATENCY=0.05).
+
+    Returns:
+        Dict: settings for create_app.
+    """
+    config = {
+        'DATABASE': os.path.join(workdir, 'StockTrends.sqlite'),
+        'PRICE_ARCHIVE_PATH': os.path.join(workdir, 'archive'),
+        'RESPONSE_CACHE_PATH': os.path.join(workdir, 'response_cache.sqlite'),
+        'SYMBOL_LISTING_PATH': os.path.join(workdir, 'listing_status.csv'),
+        'UPSTREAM_STUB': True,
+    }
+    config.update(overrides)
+    return config
+
+
+def create_user(app, username: str):
+    """ registers and logs in a funded user holding shares of every benchmark ticker.
+
+    Returns:
+        FlaskClient: test client with the user's session, username set as an attribute.
+    """
+    client = app.test_client()
+    client.username = username
+    client.post('/auth/register', data={'username': username, 'password': PASSWORD})
+    client.post('/auth/login', data={'username': username, 'password': PASSWORD})
+    client.post('/auth/deposit', data={'amount': '1000000000'})
+    for ticker in TICKERS:
+        client.post('/auth/purchase', data={'ticker': ticker, 'shares': '100000',
+                                            'action': 'purchase'})
+    return client
+
+
+def summarize(latencies, errors: int, elapsed: float) -> dict:
+    """ latency percentiles and throughput of a scenario.
+
+    Args:
+        latencies: seconds per request.
+        errors: requests answered with a 4xx/5xx status.
+        elapsed: wall clock seconds of the whole scenario.
+
+    Returns:
+        Dict: requests, errors, p50_ms, p95_ms, p99_ms, mean_ms and throughput (requests/s).
+    """
+    latencies_ms = np.asarray(latencies, dtype=np.float64) * 1000
+    summary = {'requests': int(latencies_ms.size), 'errors': errors}
+    for percentile, value in zip(PERCENTILES, np.percentile(latencies_ms, PERCENTILES)):
+        summary[f'p{percentile}_ms'] = float(value)
+    summary['mean_ms'] = float(latencies_ms.mean())
+    summary['throughput'] = latencies_ms.size / elapsed if elapsed else 0.0
+    return summary
+
+
+def run_scenario(clients, scenario: str, requests_per_client: int, seed: int = 0) -> dict:
+    """ sends a scenario's requests from every client concurrently, one thread per client.
+
+    Returns:
+        Dict: see summarize.
+    """
+    send = SCENARIOS[scenario]
+    latencies = [[] for _ in clients]
+    errors = [0] * len(clients)
+    start_line = threading.Barrier(len(clients) + 1)
+
+    def user(idx, client):
+        rng = random.Random(seed + idx)
+        start_line.wait()
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            response = send(client, rng)
+            latencies[idx].append(time.perf_counter() - start)
+            errors[idx] += response.status_code >= 400
+
+    threads = [threading.Thread(target=user, args=(idx, client), name=f'benchmark-{idx}')
+               for idx, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    start_line.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return summarize([latency for user_latencies in latencies for latency in user_latencies],
+                     sum(errors), elapsed)
+
+
+def run_benchmark(app, scenarios, threads: int = 4, requests_per_thread: int = 50,
+                  warmup: int = 1) -> dict:
+    """ runs each scenario in turn with threads concurrent virtual users.
+
+    Args:
+        app: app created with benchmark_config.
+        scenarios: names from SCENARIOS.
+        threads: concurrent virtual users.
+        requests_per_thread: measured requests each user sends per scenario.
+        warmup: unmeasured requests each user sends first (fills caches and pools).
+
+    Returns:
+        Dict: scenario name to its summary.
+    """
+    with app.app_context():
+        init_db()
+        refresh_index()
+    clients = [create_user(app, f'benchmark{idx}') for idx in range(threads)]
+
+    results = {}
+    for scenario in scenarios:
+        if warmup:
+            run_scenario(clients, scenario, warmup, seed=-1)
+        results[scenario] = run_scenario(clients, scenario, requests_per_thread)
+    return results
+
+
+def find_regressions(results: dict, baseline: dict, max_regression: float):
+    """ compares p95 latencies with a previous run.
+
+    Returns:
+        List: messages for scenarios more than max_regression (a fraction) slower.
+    """
+    regressions = []
+    for scenario, summary in results.items():
+        previous = baseline.get(scenario)
+        if previous and summary['p95_ms'] > previous['p95_ms'] * (1 + max_regression):
+            regressions.append(f"{scenario}: p95 {summary['p95_ms']:.1f} ms, "
+                               f"baseline {previous['p95_ms']:.1f} ms")
+    return regressions
+
+
+@click.command('benchmark')
+@click.option('--scenario', 'scenarios', multiple=True, type=click.Choice(list(SCENARIOS)),
+              help='Scenario to run, repeatable (default: all).')
+@click.option('--threads', default=4, show_default=True, help='Concurrent virtual users.')
+@click.option('--requests', 'requests_per_thread', default=50, show_default=True,
+              help='Measured requests per user and scenario.')
+@click.option('--latency', default=0.0, show_default=True,
+              help='Stubbed upstream latency in seconds.')
+@click.option('--jitter', default=0.0, show_default=True,
+              help='Extra random upstream latency, up to this many seconds.')
+@click.option('--error-rate', default=0.0, show_default=True,
+              help='Fraction of upstream calls answered with a 503.')
+@click.option('--fixtures', type=click.Path(file_okay=False), default=None,
+              help='Directory of recorded upstream payloads.')
+@click.option('--output', type=click.Path(dir_okay=False), default=None,
+              help='Write the results as json.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Results json of an earlier run to compare against.')
+@click.option('--max-regression', default=0.25, show_default=True,
+              help='Allowed p95 slowdown against the baseline (fraction).')
+def benchmark_command(scenarios, threads, requests_per_thread, latency, jitter,  # pylint: disable=R0913,R0917,R0914
+                      error_rate, fixtures, output, baseline, max_regression):
+    """Load test the routes offline against stubbed upstream APIs."""
+    # imported here, the package imports this module while defining create_app.
+    from stock_trends import create_app  # pylint: disable=C0415
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app = create_app(benchmark_config(
+            workdir,
+            UPSTREAM_STUB_LATENCY=latency,
+            UPSTREAM_STUB_JITTER=jitter,
+            UPSTREAM_STUB_ERROR_RATE=error_rate,
+            UPSTREAM_FIXTURES_PATH=fixtures))
+        results = run_benchmark(app, scenarios or list(SCENARIOS), threads,
+                                requests_per_thread)
+        stub = app.extensions['upstream_stub']
+
+    click.echo(f"{'scenario':<10}{'requests':>10}{'errors':>8}"
+               f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for scenario, summary in results.items():
+        click.echo(f"{scenario:<10}{summary['requests']:>10}{summary['errors']:>8}"
+                   f"{summary['p50_ms']:>10.1f}{summary['p95_ms']:>10.1f}"
+                   f"{summary['p99_ms']:>10.1f}{summary['throughput']:>10.1f}")
+    click.echo(f'upstream calls: {stub.requests} ({stub.errors} injected errors)')
+    leaked = running_pollers()
+    click.echo(f'live pollers left running: {leaked}')
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if baseline:
+        with open(baseline, encoding='utf-8') as f:
+            regressions = find_regressions(results, json.load(f), max_regression)
+        if regressions:
+            raise click.ClickException('p95 regressions:\n' + '\n'.join(regressions))
+    if leaked:
+        raise click.ClickException(f'{leaked} live pollers outlived their streams')
+
+
+# code timed in a fresh interpreter by the startup benchmark.
+STARTUP_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import stock_trends
+app = stock_trends.create_app({'PRELOAD_HEAVY_MODULES': %r})
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'loaded': [name for name in %r if name in sys.modules]}))
+'''
+
+
+def measure_startup(preload: bool = False, runs: int = 5) -> dict:
+    """ times importing the package and creating the app in fresh interpreters.
+
+    Args:
+        preload: create the app with PRELOAD_HEAVY_MODULES.
+        runs: interpreters started.
+
+    Returns:
+        Dict: min_ms, median_ms and the heavy modules loaded at startup.
+    """
+    seconds = []
+    loaded = []
+    for _ in range(runs):
+        probe = subprocess.run(
+            [sys.executable, '-c', STARTUP_PROBE % (preload, HEAVY_MODULES)],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        result = json.loads(probe.stdout.strip().splitlines()[-1])
+        seconds.append(result['seconds'])
+        loaded = result['loaded']
+    return {'min_ms': min(seconds) * 1000,
+            'median_ms': statistics.median(seconds) * 1000,
+            'loaded': loaded}
+
+
+@click.command('benchmark-startup')
+@click.option('--runs', default=5, show_default=True, help='Fresh interpreters per mode.')
+def benchmark_startup_command(runs):
+    """Time package import and app creation, lazy and preloaded."""
+    for preload in (False, True):
+        result = measure_startup(preload, runs)
+        click.echo(f"{'preloaded' if preload else 'lazy':<10} min {result['min_ms']:>7.1f} ms"
+                   f"  median {result['median_ms']:>7.1f} ms"
+                   f"  heavy modules: {', '.join(result['loaded']) or 'none'}")
+
+
+def init_app(app):
+    ''' registers the benchmark commands. '''
+    app.cli.add_command(benchmark_command)
+    app.cli.add_command(benchmark_startup_command)
@@ -0,0 +1,442 @@
+''' response cache shared by the Alpha Vantage and Tiingo API modules. '''
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+import click
+from stock_trends.metrics import format_family, register_collector
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+    MARKET_TIMEZONE = ZoneInfo('America/New_York')
+except (ImportError, ZoneInfoNotFoundError):
+    # no tz database available, fall back to US/Eastern standard time.
+    MARKET_TIMEZONE = timezone(timedelta(hours=-5))
+
+MARKET_CLOSE_HOUR = 16
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# parameters that never take part in a cache key.
+SECRET_PARAMS = ('apikey', 'token')
+
+
+def seconds_until_market_close(now: datetime = None) -> int:
+    """ seconds until the next US market close (16:00 New York, weekdays).
+
+    Daily bars only change once the market closes, so they can be cached until then.
+
+    Args:
+        now: current time (timezone aware), defaults to the current time.
+
+    Returns:
+        int: seconds until the next close (at least one minute).
+    """
+    now = (now or datetime.now(timezone.utc)).astimezone(MARKET_TIMEZONE)
+    close = now.replace(hour=MARKET_CLOSE_HOUR, minute=0, second=0, microsecond=0)
+
+    if now >= close:
+        close += timedelta(days=1)
+    while close.weekday() >= 5:
+        close += timedelta(days=1)
+
+    return max(MINUTE, int((close - now).total_seconds()))
+
+
+# TTL (seconds, or a callable returning seconds) for each upstream endpoint.
+DEFAULT_TTLS = {
+    'TIME_SERIES_INTRADAY': 5 * MINUTE,
+    'TIME_SERIES_DAILY': seconds_until_market_close,
+    'TIME_SERIES_WEEKLY': seconds_until_market_close,
+    'TIME_SERIES_MONTHLY': seconds_until_market_close,
+    'NEWS_SENTIMENT': 15 * MINUTE,
+    'SYMBOL_SEARCH': DAY,
+    'CPI': 3 * DAY,
+    'INFLATION': 3 * DAY,
+    'RETAIL_SALES': 3 * DAY,
+    'UNEMPLOYMENT': 3 * DAY,
+    'REAL_GDP': 3 * DAY,
+    'TREASURY_YIELD': DAY,
+    'FEDERAL_FUNDS_RATE': DAY,
+    'TIINGO_DAILY_PRICES': seconds_until_market_close,
+    'TIINGO_IEX_QUOTE': MINUTE,
+}
+DEFAULT_TTL = 5 * MINUTE
+
+
+class ResponseCache:
+    """ base class for response cache backends.
+
+    Backends store JSON-serializable values with an absolute expiry time and
+    keep hit/miss counters. Subclasses implement _load, _store and clear.
+    """
+
+    def __init__(self):
+        self._counter_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_entry(self, key: str):
+        """ looks up a key.
+
+        Args:
+            key: cache key.
+
+        Returns:
+            Tuple: (value, expires_at) or None when missing or expired.
+        """
+        entry = self._load(key, time.time())
+        with self._counter_lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def get(self, key: str):
+        """ returns the cached value for key, or None. """
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def set(self, key: str, value, ttl: float) -> None:
+        """ stores value under key for ttl seconds. """
+        self.set_entry(key, value, time.time() + ttl)
+
+    def set_entry(self, key: str, value, expires_at: float) -> None:
+        """ stores value under key until expires_at (unix time). """
+        self._store(key, value, expires_at)
+
+    def _count_evictions(self, count: int) -> None:
+        with self._counter_lock:
+            self.evictions += count
+
+    def stats(self) -> dict:
+        """ hit/miss counters for this backend.
+
+        Returns:
+            Dict: dictonary with the following keys.
+                * backend (str)
+                * hits (int)
+                * misses (int)
+                * evictions (int)
+                * entries (int)
+                * hit_ratio (float)
+        """
+        lookups = self.hits + self.misses
+        return {'backend': type(self).__name__,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self),
+                'hit_ratio': self.hits / lookups if lookups else 0.0}
+
+    def _load(self, key, now):
+        raise NotImplementedError
+
+    def _store(self, key, value, expires_at):
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """ removes every entry. """
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class MemoryCache(ResponseCache):
+    """ size-bounded LRU cache held in process memory. """
+
+    def __init__(self, max_entries: int = 1024):
+        super().__init__()
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self._count_evictions(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache(ResponseCache):
+    """ size-bounded cache stored in a SQLite file.
+
+    The file lives in the instance folder so entries survive restarts and are
+    shared by every worker process. Each thread keeps its own connection.
+    """
+
+    def __init__(self, path: str, max_entries: int = 4096):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS response_cache ('
+                ' key TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL,'
+                ' expires_at REAL NOT NULL,'
+                ' stored_at REAL NOT NULL)')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_response_cache_stored_at '
+                'ON response_cache (stored_at)')
+            self._local.conn = conn
+        return conn
+
+    def _load(self, key, now):
+        row = self._connection().execute(
+            'SELECT value, expires_at FROM response_cache WHERE key = ? AND expires_at > ?',
+            (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _store(self, key, value, expires_at):
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO response_cache (key, value, expires_at, stored_at) \
+                VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), expires_at, now))
+            evicted = conn.execute(
+                'DELETE FROM response_cache WHERE expires_at <= ?', (now,)).rowcount
+            # drop the oldest entries beyond max_entries.
+            evicted += conn.execute(
+                'DELETE FROM response_cache WHERE key IN ('
+                ' SELECT key FROM response_cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)).rowcount
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        if evicted:
+            self._count_evictions(evicted)
+
+    def clear(self):
+        self._connection().execute('DELETE FROM response_cache')
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+
+class TieredCache(ResponseCache):
+    """ in-memory LRU in front of a shared (SQLite) backend. """
+
+    def __init__(self, front: ResponseCache, back: ResponseCache):
+        super().__init__()
+        self.front = front
+        self.back = back
+
+    def _load(self, key, now):
+        entry = self.front.get_entry(key)
+        if entry is None:
+            entry = self.back.get_entry(key)
+            if entry is not None:
+                self.front.set_entry(key, *entry)
+        return entry
+
+    def _store(self, key, value, expires_at):
+        self.front.set_entry(key, value, expires_at)
+        self.back.set_entry(key, value, expires_at)
+
+    def clear(self):
+        self.front.clear()
+        self.back.clear()
+
+    def stats(self):
+        stats = super().stats()
+        stats['memory'] = self.front.stats()
+        stats['sqlite'] = self.back.stats()
+        return stats
+
+    def __len__(self):
+        return len(self.back)
+
+
+_cache = MemoryCache()
+_ttls = dict(DEFAULT_TTLS)
+# per-thread refresh-ahead window, see refresh_ahead.
+_refresh = threading.local()
+
+
+def get_cache() -> ResponseCache:
+    ''' returns the response cache in use. '''
+    return _cache
+
+
+def set_cache(cache: ResponseCache) -> None:
+    ''' replaces the response cache backend. '''
+    global _cache  # pylint: disable=W0603
+    _cache = cache
+
+
+def ttl_for(endpoint: str) -> int:
+    """ time to live for responses of an upstream endpoint.
+
+    Args:
+        endpoint: Alpha Vantage function name (Ex: TIME_SERIES_DAILY) or Tiingo endpoint.
+
+    Returns:
+        int: seconds a response stays fresh.
+    """
+    ttl = _ttls.get(endpoint, DEFAULT_TTL)
+    return ttl() if callable(ttl) else ttl
+
+
+@contextmanager
+def refresh_ahead(seconds: float):
+    """ treats entries expiring within seconds as stale in the current thread.
+
+    Used by the prefetcher, so entries are refreshed before a user request
+    would find them expired.
+    """
+    _refresh.window = seconds
+    try:
+        yield
+    finally:
+        _refresh.window = 0
+
+
+def refresh_window() -> float:
+    ''' seconds before expiry an entry counts as stale in the current thread. '''
+    return getattr(_refresh, 'window', 0)
+
+
+def get_fresh(key: str):
+    ''' returns the cached value for key, or None when missing or due for a refresh. '''
+    entry = _cache.get_entry(key)
+    if entry is None or entry[1] - time.time() < refresh_window():
+        return None
+    return entry[0]
+
+
+def make_key(url: str, params: dict = None) -> str:
+    ''' builds a cache key from the url and the (non secret) query parameters. '''
+    params = params or {}
+    query = '&'.join(f'{name}={params[name]}' for name in sorted(params)
+                     if name not in SECRET_PARAMS)
+    return f'{url}?{query}'
+
+
+def cached_json(endpoint: str, url: str, params: dict, loader):
+    """ returns a cached JSON payload, calling loader on a miss.
+
+    Args:
+        endpoint: endpoint name used to pick the TTL.
+        url: request url.
+        params: request parameters (secrets are left out of the key).
+        loader: callable returning the decoded payload, exceptions are not cached.
+
+    Returns:
+        decoded JSON payload.
+    """
+    key = make_key(url, params)
+    value = get_fresh(key)
+    if value is None:
+        value = loader()
+        _cache.set(key, value, ttl_for(endpoint))
+    return value
+
+
+def create_cache(backend: str, path: str, max_entries: int) -> ResponseCache:
+    """ builds a cache backend.
+
+    Args:
+        backend: 'memory', 'sqlite' or 'tiered'.
+        path: SQLite file used by the 'sqlite' and 'tiered' backends.
+        max_entries: maximum number of entries kept by each backend.
+
+    Returns:
+        ResponseCache: configured backend.
+    """
+    if backend == 'memory':
+        return MemoryCache(max_entries)
+    if backend == 'sqlite':
+        return SQLiteCache(path, max_entries)
+    if backend == 'tiered':
+        return TieredCache(MemoryCache(max_entries), SQLiteCache(path, max_entries))
+    raise ValueError(f'unknown response cache backend: {backend}')
+
+
+@click.command('cache-stats')
+def cache_stats_command():
+    """Show response cache hit/miss counters."""
+    for name, value in get_cache().stats().items():
+        click.echo(f'{name}: {value}')
+
+
+@click.command('clear-cache')
+def clear_cache_command():
+    """Remove every cached upstream response."""
+    get_cache().clear()
+    click.echo('Cleared the response cache.')
+
+
+def collect_metrics():
+    ''' hit, miss, eviction and size metric families per cache tier. '''
+    stats = get_cache().stats()
+    tiers = {'all': stats}
+    tiers.update({tier: stats[tier] for tier in ('memory', 'sqlite') if tier in stats})
+    families = []
+    for name, kind, help_text in (
+            ('hits', 'counter', 'Response cache lookups answered from the cache.'),
+            ('misses', 'counter', 'Response cache lookups that went upstream.'),
+            ('evictions', 'counter', 'Entries dropped to stay within the size bound.'),
+            ('entries', 'gauge', 'Entries currently cached.'),
+            ('hit_ratio', 'gauge', 'Share of lookups answered from the cache.')):
+        families.append(format_family(
+            f"response_cache_{name}{'_total' if kind == 'counter' else ''}", kind, help_text,
+            [('', {'tier': tier}, tier_stats[name]) for tier, tier_stats in tiers.items()]))
+    return families
+
+
+def init_app(app):
+    ''' configures the response cache from the app config. '''
+    _ttls.update(app.config.get('RESPONSE_CACHE_TTLS', {}))
+    set_cache(create_cache(
+        app.config['RESPONSE_CACHE_BACKEND'],
+        app.config['RESPONSE_CACHE_PATH'],
+        app.config['RESPONSE_CACHE_MAX_ENTRIES']))
+
+    register_collector('cache', collect_metrics)
+    app.cli.add_command(cache_stats_command)
+    app.cli.add_command(clear_cache_command)
@@ -0,0 +1,170 @@
+''' cross-sectional comparison of many tickers: returns, correlation, beta and volatility. '''
+
+import math
+from stock_trends.lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# bars per year of each interval, used to annualize volatility.
+PERIODS_PER_YEAR = {'Daily': 252, 'Weekly': 52, 'Monthly': 12}
+TRADING_MINUTES_PER_DAY = 390
+
+# values standardized at once when averaging rolling correlations.
+BATCH_ELEMENTS = 1 << 20
+
+
+def periods_per_year(interval: str) -> float:
+    ''' bars per trading year (Ex: Daily -> 252, 5min -> 252 * 78). '''
+    if interval in PERIODS_PER_YEAR:
+        return PERIODS_PER_YEAR[interval]
+    return 252 * TRADING_MINUTES_PER_DAY / int(interval[:-len('min')])
+
+
+def close_matrix(series: dict, columns: dict) -> 'pd.DataFrame':
+    """ aligns the closes of many symbols into one matrix.
+
+    Bars missing for a symbol (Ex: a halted stock) take its previous close,
+    timestamps before every symbol has a bar are dropped. Each symbol's
+    closes are copied once, straight into their column.
+
+    Args:
+        series: dictonary mapping each stored symbol to its (timestamps,
+            closes) arrays, oldest first (Ex: PriceArchive.read slices).
+        columns: dictonary mapping each ticker to the symbol its bars are
+            stored under (with mock data every ticker maps to IBM).
+
+    Returns:
+        pd.DataFrame: closes with a DatetimeIndex (oldest first) and one column per ticker.
+    """
+    symbols = list(dict.fromkeys(columns.values()))
+    timestamps = np.unique(np.concatenate(
+        [np.asarray(series[symbol][0], dtype=np.int64) for symbol in symbols if symbol in series]
+        or [np.empty(0, dtype=np.int64)]))
+
+    wide = np.full((len(timestamps), len(symbols)), np.nan)
+    for position, symbol in enumerate(symbols):
+        if symbol in series:
+            times, closes = series[symbol]
+            wide[np.searchsorted(timestamps, times), position] = closes
+
+    matrix = pd.DataFrame(wide[:, [symbols.index(symbol) for symbol in columns.values()]],
+                          columns=list(columns),
+                          index=pd.DatetimeIndex(timestamps.astype('datetime64[s]'), name='date'))
+    return matrix.ffill().dropna()
+
+
+def _json_values(values) -> list:
+    ''' floats as a (nested) list, with None where the value is not finite. '''
+    return np.where(np.isfinite(values), values, None).tolist()
+
+
+def _standardized(windows):
+    ''' each (symbol, window) row centered and scaled to unit length, NaN without variance. '''
+    centered = windows - windows.mean(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return centered / np.sqrt((centered ** 2).sum(axis=-1, keepdims=True))
+
+
+def _mean_correlations(returns, window: int):
+    """ average pairwise correlation of every window of returns.
+
+    A window's correlation matrix sums to the squared length of the sum of
+    its standardized return rows, so no symbols x symbols matrix is built.
+    Windows are standardized in batches of about BATCH_ELEMENTS values.
+    Symbols without variance in a window are left out of its average.
+
+    Returns:
+        np.ndarray: one average per window, NaN with fewer than two symbols.
+    """
+    windows = np.lib.stride_tricks.sliding_window_view(returns, window, axis=0)
+    batch = max(1, BATCH_ELEMENTS // (returns.shape[1] * window))
+    means = np.empty(len(windows))
+    for start in range(0, len(windows), batch):
+        scaled = _standardized(windows[start:start + batch])
+        symbols = np.isfinite(scaled[:, :, 0]).sum(axis=1)
+        total = (np.nansum(scaled, axis=1) ** 2).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # off-diagonal average, the diagonal is all ones.
+            means[start:start + batch] = (total - symbols) / (symbols * (symbols - 1))
+    return means
+
+
+def _betas(returns, benchmark: int = None):
+    ''' beta of every column at once: cov(r, r_benchmark) / var(r_benchmark). '''
+    if benchmark is None or len(returns) < 2:
+        return np.full(returns.shape[1], np.nan)
+    centered = returns - returns.mean(axis=0)
+    market = centered[:, benchmark]
+    return centered.T @ market / (market @ market)
+
+
+def _correlations(returns, window: int):
+    """ correlation matrix of the last window and the average pairwise correlation of each.
+
+    Returns:
+        Tuple: (symbols x symbols matrix, average per bar), NaN without a full window.
+    """
+    symbols = returns.shape[1]
+    correlation = np.full((symbols, symbols), np.nan)
+    mean_correlation = np.full(len(returns) + 1, np.nan)
+    if 1 < window <= len(returns):
+        scaled = _standardized(returns[-window:].T)
+        correlation = scaled @ scaled.T
+        if symbols > 1:
+            mean_correlation[window:] = _mean_correlations(returns, window)
+    return correlation, mean_correlation
+
+
+def compare_returns(closes, benchmark: str = None, window: int = 20,
+                    interval: str = 'Daily') -> dict:
+    """ compares a basket of tickers with batched operations over the return matrix.
+
+    Args:
+        closes: aligned closes as returned by close_matrix.
+        benchmark: ticker (a column of closes) the betas are measured against.
+        window: bars per rolling correlation window.
+        interval: bar interval, used to annualize volatility.
+
+    Returns:
+        Dict: dictonary with the following keys.
+            * symbols (list): tickers, in column order.
+            * dates (list): ISO timestamps of the aligned bars.
+            * normalized (dict): ticker to its closes rebased to 100 at the first bar.
+            * table (dict): ticker to its last, mean, stdev, median, max and min
+              close, total_return (percent), volatility (annualized) and beta.
+            * correlation (list): return correlation matrix over the last window.
+            * mean_correlation (list): average pairwise correlation of each
+              window, aligned with the dates (None before the first full window).
+    """
+    symbols = list(closes.columns)
+    prices = closes.to_numpy(dtype=np.float64)
+    returns = prices[1:] / prices[:-1] - 1
+    normalized = prices / prices[0] * 100
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        volatility = returns.std(axis=0, ddof=1) * math.sqrt(periods_per_year(interval))
+        beta = _betas(returns, symbols.index(benchmark) if benchmark in symbols else None)
+    correlation, mean_correlation = _correlations(returns, window)
+
+    table = pd.DataFrame({
+        'last': prices[-1],
+        'mean': closes.mean(),
+        'stdev': closes.std(ddof=0),
+        'median': closes.median(),
+        'max': closes.max(),
+        'min': closes.min(),
+        'total_return': normalized[-1] - 100,
+        'volatility': volatility,
+        'beta': beta,
+    }, index=symbols)
+
+    return {
+        'symbols': symbols,
+        'dates': np.datetime_as_string(closes.index.to_numpy(), unit='s').tolist(),
+        'normalized': dict(zip(symbols, _json_values(normalized.T))),
+        'table': {symbol: dict(zip(table.columns, row))
+                  for symbol, row in zip(symbols, _json_values(table.to_numpy()))},
+        'correlation': _json_values(correlation),
+        'mean_correlation': _json_values(mean_correlation),
+    }
@@ -1,30 +1,289 @@
 ''' all logic for interacting and setting up the database. '''
 
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 import click
 from flask import current_app, g
 from werkzeug.security import generate_password_hash
+from stock_trends.metrics import format_family, observe_query, register_collector
+
+# schema changes for databases created by an older schema.sql, in order. The
+# database's PRAGMA user_version counts the ones already applied, schema.sql
+# always describes the latest version.
+MIGRATIONS = (
+    # 1: stored OHLCV history, moved to the price archive by archive-bars
+    # (which drops the table), so schema.sql no longer creates it.
+    '''CREATE TABLE IF NOT EXISTS price_bars (
+        symbol TEXT NOT NULL,
+        interval TEXT NOT NULL,
+        timestamp INTEGER NOT NULL,
+        open REAL,
+        high REAL,
+        low REAL,
+        close REAL,
+        volume REAL,
+        PRIMARY KEY (symbol, interval, timestamp)
+    ) WITHOUT ROWID''',
+    # 2: position lookups by user without a table scan.
+    '''CREATE INDEX IF NOT EXISTS idx_user_stocks_user_id
+        ON user_stocks (user_id)''',
+    # 3: stored macroeconomic series history.
+    '''CREATE TABLE IF NOT EXISTS macro_observations (
+        function TEXT NOT NULL,
+        date TEXT NOT NULL,
+        value REAL,
+        PRIMARY KEY (function, date)
+    ) WITHOUT ROWID''',
+    # 4: stored news articles, deduplicated by url.
+    '''CREATE TABLE IF NOT EXISTS news_articles (
+        id INTEGER PRIMARY KEY,
+        url TEXT NOT NULL UNIQUE,
+        title TEXT,
+        summary TEXT,
+        source TEXT,
+        topics TEXT,
+        published INTEGER NOT NULL,
+        sentiment_score REAL,
+        sentiment_label TEXT
+    )''',
+    # 5: newest articles first without a sort.
+    '''CREATE INDEX IF NOT EXISTS idx_news_articles_published
+        ON news_articles (published)''',
+    # 6: ticker level sentiment of each article, by ticker and publication time.
+    '''CREATE TABLE IF NOT EXISTS news_tickers (
+        ticker TEXT NOT NULL,
+        published INTEGER NOT NULL,
+        article_id INTEGER NOT NULL,
+        relevance REAL,
+        sentiment_score REAL,
+        sentiment_label TEXT,
+        PRIMARY KEY (ticker, published, article_id)
+    ) WITHOUT ROWID''',
+    # 7: daily ticker sentiment totals, kept up to date as articles are stored.
+    '''CREATE TABLE IF NOT EXISTS news_sentiment (
+        ticker TEXT NOT NULL,
+        day TEXT NOT NULL,
+        articles INTEGER NOT NULL,
+        bullish INTEGER NOT NULL,
+        bearish INTEGER NOT NULL,
+        relevance REAL NOT NULL,
+        weighted_score REAL NOT NULL,
+        PRIMARY KEY (ticker, day)
+    ) WITHOUT ROWID''',
+    # 8: full text index of the stored articles.
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS news_search USING fts5(
+        title, summary, topics, content='news_articles', content_rowid='id'
+    )''',
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# database path -> ConnectionPool.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class TimedConnection(sqlite3.Connection):
+    ''' connection reporting every statement's execution time to the metrics. '''
+
+    def _timed(self, method, sql, *args):
+        start = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            observe_query(sql.split(None, 1)[0].upper() if sql.strip() else '',
+                          time.perf_counter() - start)
+
+    def execute(self, sql, *args):
+        ''' timed sqlite3.Connection.execute. '''
+        return self._timed(super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        ''' timed sqlite3.Connection.executemany. '''
+        return self._timed(super().executemany, sql, *args)
+
+    def executescript(self, sql_script):
+        ''' timed sqlite3.Connection.executescript. '''
+        return self._timed(super().executescript, sql_script)
+
+
+def _connect(config):
+    ''' opens a connection to the app database and applies the tuning pragmas. '''
+    db = sqlite3.connect(
+        config['DATABASE'],
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        timeout=config['SQLITE_BUSY_TIMEOUT'],
+        factory=TimedConnection,
+        # pooled connections are handed to whichever thread asks next, one at a time.
+        check_same_thread=False
+    )
+    db.row_factory = sqlite3.Row
+
+    # readers no longer block the writer (and vice versa), WAL only needs an
+    # fsync at checkpoints when synchronous is NORMAL.
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.execute(f'PRAGMA mmap_size={int(config["SQLITE_MMAP_SIZE"])}')
+    # negative cache_size is in KiB rather than pages.
+    db.execute(f'PRAGMA cache_size={-int(config["SQLITE_CACHE_SIZE_KB"])}')
+    db.execute('PRAGMA temp_store=MEMORY')
+
+    migrate(db)
+    return db
+
+
+class ConnectionPool:
+    """ bounded pool of open connections to one database.
+
+    A connection is checked out for the length of an app context and
+    returned at teardown, so it is reused by the next request whichever
+    thread serves it. At most max_idle connections are kept open between
+    requests; when more were checked out at once, the extras are closed as
+    they are returned.
+    """
+
+    def __init__(self, config, max_idle: int = 8):
+        self.config = config
+        self.max_idle = max_idle
+        self.opened = 0
+        self.checkouts = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def checkout(self):
+        ''' an idle connection, or a new one when none is idle. '''
+        with self._lock:
+            self.checkouts += 1
+            if self._idle:
+                # most recently used first, its page cache is the warmest.
+                return self._idle.pop()
+            self.opened += 1
+        return _connect(self.config)
+
+    def release(self, db) -> None:
+        ''' returns a checked out connection, closing it when the pool is full. '''
+        if db.in_transaction:
+            db.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(db)
+                return
+        db.close()
+
+    def idle(self) -> int:
+        ''' number of open connections waiting in the pool. '''
+        with self._lock:
+            return len(self._idle)
+
+
+def get_pool(config=None) -> ConnectionPool:
+    ''' returns the connection pool of the configured database (current app by default). '''
+    config = config or current_app.config
+    with _pools_lock:
+        pool = _pools.get(config['DATABASE'])
+        if pool is None:
+            pool = _pools[config['DATABASE']] = ConnectionPool(
+                config, config['SQLITE_POOL_MAX_IDLE'])
+        return pool
 
 
 def get_db():
-    ''' clarify docstring '''
-    if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
+    """ gets the database connection of the current app context.
 
-        g.db.row_factory = sqlite3.Row
+    The connection is checked out of the pool on first use and returned to
+    it when the context ends (see close_db).
+
+    Returns:
+        sqlite3.Connection: connection returning sqlite3.Row rows.
+    """
+    if 'db' not in g:
+        g.db_pool = get_pool()
+        g.db = g.db_pool.checkout()
 
     return g.db
 
 
 def close_db(e=None): # pylint: disable=W0613
-    ''' clarify docstring '''
+    ''' returns the connection to the pool at teardown, discarding uncommitted writes. '''
     db = g.pop('db', None)
+    pool = g.pop('db_pool', None)
 
     if db is not None:
-        db.close()
+        pool.release(db)
+
+
+def collect_metrics():
+    ''' connection pool metric families. '''
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [
+        format_family('sqlite_connections_opened_total', 'counter',
+                      'SQLite connections opened.',
+                      [('', {}, sum(pool.opened for pool in pools))]),
+        format_family('sqlite_connection_checkouts_total', 'counter',
+                      'SQLite connections checked out of the pool.',
+                      [('', {}, sum(pool.checkouts for pool in pools))]),
+        format_family('sqlite_connections_idle', 'gauge',
+                      'Open SQLite connections waiting in the pool.',
+                      [('', {}, sum(pool.idle() for pool in pools))]),
+    ]
+
+
+def migrate(db) -> int:
+    """ applies the migrations a database is missing.
+
+    Runs whenever a connection is opened. Databases that were never
+    initialized (no user table) are left alone, init_db creates them at the
+    latest version.
+
+    Args:
+        db: sqlite3 connection.
+
+    Returns:
+        int: number of migrations applied.
+    """
+    if db.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        return 0
+
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        # another worker may have migrated while we waited for the lock.
+        version = db.execute('PRAGMA user_version').fetchone()[0]
+        initialized = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user'"
+        ).fetchone()
+        pending = MIGRATIONS[version:] if initialized else ()
+        for statement in pending:
+            db.execute(statement)
+        if pending:
+            db.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+    except BaseException:
+        db.rollback()
+        raise
+    db.commit()
+    return len(pending)
+
+
+@contextmanager
+def transaction():
+    """ runs the enclosed statements as one write transaction.
+
+    BEGIN IMMEDIATE takes the write lock up front, so rows read inside the
+    block cannot change before the block's writes are committed. Everything
+    is rolled back if the block raises.
+
+    Yields:
+        sqlite3.Connection: the request's connection.
+    """
+    db = get_db()
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        yield db
+    except BaseException:
+        db.rollback()
+        raise
+    db.commit()
 
 
 def init_db():
@@ -33,6 +292,7 @@ def init_db():
 
     with current_app.open_resource('schema.sql') as f:
         db.executescript(f.read().decode('utf8'))
+    db.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
 
 
 @click.command('init-db')
@@ -42,10 +302,20 @@ def init_db_command():
     click.echo('Initialized the database.')
 
 
+@click.command('migrate-db')
+def migrate_db_command():
+    """Bring an existing database up to the current schema."""
+    # opening the connection applies any pending migrations.
+    version = get_db().execute('PRAGMA user_version').fetchone()[0]
+    click.echo(f'Database at schema version {version} of {SCHEMA_VERSION}.')
+
+
 def init_app(app):
     ''' clarify docstring '''
     app.teardown_appcontext(close_db)
+    register_collector('sqlite', collect_metrics)
     app.cli.add_command(init_db_command)
+    app.cli.add_command(migrate_db_command)
 
 
 def get_user_positions(user_id: int):
@@ -63,8 +333,9 @@ def get_user_positions(user_id: int):
     """
     db = get_db()
 
+    # purchase order, served straight from the user_id index.
     positions = db.execute(
-        'SELECT * FROM user_stocks WHERE user_id = ? ', (user_id,)
+        'SELECT * FROM user_stocks WHERE user_id = ? ORDER BY id', (user_id,)
     ).fetchall()
 
     cleaned_positions = []
@@ -80,6 +351,22 @@ def get_user_positions(user_id: int):
     return cleaned_positions
 
 
+def get_held_symbols():
+    """ gets every symbol held by any user, most held first.
+
+    Returns:
+        List: (stock_symbol, holders, shares) rows ordered by the number of
+            users holding the symbol, then by total shares.
+    """
+    db = get_db()
+
+    return db.execute(
+        'SELECT UPPER(stock_symbol) AS stock_symbol, COUNT(DISTINCT user_id) AS holders, \
+        SUM(shares) AS shares FROM user_stocks GROUP BY UPPER(stock_symbol) \
+        ORDER BY holders DESC, shares DESC'
+    ).fetchall()
+
+
 def get_user_id(username: str):
     ''' clarify docstring '''
     db = get_db()
@@ -148,35 +435,196 @@ def register_user_stock_purchase(
     db.commit()
 
 
-def update_user_stock_purchase(stock_purchase_id: int, remaining_shares: int):
-    """ updates a user's stock purchase.
+def apply_stock_sale(user_id: int, lot_updates, lot_deletes, proceeds: float) -> None:
+    """ writes the lot changes and balance credit of a sale.
 
-    Args:
-        stock_purchase_id.
-        remaining_shares: shares left after selling a stock.
+    Does not commit, call it inside transaction() together with the reads
+    the lot changes were computed from.
 
+    Args:
+        user_id: id from user table
+        lot_updates: (remaining_shares, stock_purchase_id) pairs.
+        lot_deletes: ids of fully sold stock purchases.
+        proceeds: amount credited to the user's balance.
     """
-
     db = get_db()
 
+    db.executemany(
+        'UPDATE user_stocks SET shares = ? WHERE id = ? AND user_id = ?',
+        [(shares, lot_id, user_id) for shares, lot_id in lot_updates]
+    )
+    if lot_deletes:
+        db.execute(
+            f'DELETE FROM user_stocks WHERE user_id = ? AND id IN \
+            ({", ".join("?" * len(lot_deletes))})',
+            (user_id, *lot_deletes)
+        )
     db.execute(
-        'UPDATE user_stocks SET shares = ? where id = ?',
-        (remaining_shares, stock_purchase_id)
+        'UPDATE user SET balance = balance + ? WHERE id = ?',
+        (proceeds, user_id)
     )
-    db.commit()
 
 
-def delete_user_stock_purchase(stock_purchase_id: int):
-    """ Deletes a user's stock purchase.
+def store_macro_observations(function: str, observations) -> None:
+    """ inserts (or replaces) observations of a macroeconomic series.
 
     Args:
-        stock_purchase_id.
-
+        function: Alpha Vantage function of the series (Ex: CPI).
+        observations: iterable of (date, value) tuples, dates as YYYY-MM-DD.
     """
     db = get_db()
 
-    db.execute(
-        'DELETE FROM user_stocks WHERE id = ?',
-        (stock_purchase_id,)
+    db.executemany(
+        'INSERT OR REPLACE INTO macro_observations (function, date, value) VALUES (?, ?, ?)',
+        ((function, *row) for row in observations)
     )
     db.commit()
+
+
+def get_macro_observations(function: str):
+    """ gets the stored observations of a macroeconomic series, oldest first.
+
+    Returns:
+        List: (date, value) rows.
+    """
+    db = get_db()
+
+    return db.execute(
+        'SELECT date, value FROM macro_observations WHERE function = ? ORDER BY date',
+        (function,)
+    ).fetchall()
+
+
+def get_latest_news_timestamp(ticker: str):
+    """ gets the publication time of the newest stored article mentioning a ticker.
+
+    Returns:
+        int: seconds since epoch, or None when nothing is stored.
+    """
+    db = get_db()
+
+    return db.execute(
+        'SELECT MAX(published) FROM news_tickers WHERE ticker = ?', (ticker,)
+    ).fetchone()[0]
+
+
+def store_news_articles(articles) -> int:
+    """ inserts the articles not stored yet, with their ticker sentiment.
+
+    Articles already stored (same url) are skipped, so the full text index
+    and the daily sentiment totals count every article once.
+
+    Args:
+        articles: iterable of dictonaries with url, title, summary, source,
+            topics, published (seconds since epoch), sentiment_score,
+            sentiment_label and tickers, a list of (ticker, relevance,
+            sentiment_score, sentiment_label) tuples.
+
+    Returns:
+        int: number of articles inserted.
+    """
+    inserted = 0
+    with transaction() as db:
+        for article in articles:
+            cursor = db.execute(
+                'INSERT OR IGNORE INTO news_articles \
+                (url, title, summary, source, topics, published, sentiment_score, \
+                sentiment_label) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (article['url'], article['title'], article['summary'], article['source'],
+                 article['topics'], article['published'], article['sentiment_score'],
+                 article['sentiment_label'])
+            )
+            if not cursor.rowcount:
+                continue
+            inserted += 1
+            article_id = cursor.lastrowid
+            db.execute(
+                'INSERT INTO news_search (rowid, title, summary, topics) VALUES (?, ?, ?, ?)',
+                (article_id, article['title'], article['summary'], article['topics'])
+            )
+            db.executemany(
+                'INSERT OR IGNORE INTO news_tickers \
+                (ticker, published, article_id, relevance, sentiment_score, sentiment_label) \
+                VALUES (?, ?, ?, ?, ?, ?)',
+                ((ticker, article['published'], article_id, *sentiment)
+                 for ticker, *sentiment in article['tickers'])
+            )
+            db.executemany(
+                "INSERT INTO news_sentiment \
+                (ticker, day, articles, bullish, bearish, relevance, weighted_score) \
+                VALUES (?, date(?, 'unixepoch'), 1, ?, ?, ?, ? * ?) \
+                ON CONFLICT (ticker, day) DO UPDATE SET \
+                articles = articles + 1, bullish = bullish + excluded.bullish, \
+                bearish = bearish + excluded.bearish, \
+                relevance = relevance + excluded.relevance, \
+                weighted_score = weighted_score + excluded.weighted_score",
+                ((ticker, article['published'], 'Bullish' in label, 'Bearish' in label,
+                  relevance, relevance, score)
+                 for ticker, relevance, score, label in article['tickers'])
+            )
+    return inserted
+
+
+def get_news_articles(ticker: str = None, match: str = None, before=None, limit: int = 20):
+    """ gets stored articles, newest first.
+
+    Args:
+        ticker: only articles mentioning this ticker.
+        match: only articles matching this full text query (FTS5 syntax).
+        before: (published, id) of the last article of the previous page.
+        limit: maximum number of articles.
+
+    Returns:
+        List: (id, url, title, summary, source, topics, published,
+            sentiment_score, sentiment_label) rows.
+    """
+    db = get_db()
+    joins, conditions, params = [], [], []
+    if ticker is not None:
+        joins.append('JOIN news_tickers t ON t.article_id = a.id AND t.ticker = ?')
+        params.append(ticker)
+    if match is not None:
+        joins.append('JOIN news_search ON news_search.rowid = a.id')
+        conditions.append('news_search MATCH ?')
+        params.append(match)
+    if before is not None:
+        conditions.append('(a.published, a.id) < (?, ?)')
+        params.extend(before)
+
+    return db.execute(
+        f"SELECT a.id, a.url, a.title, a.summary, a.source, a.topics, a.published, \
+        a.sentiment_score, a.sentiment_label FROM news_articles a {' '.join(joins)} \
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''} \
+        ORDER BY a.published DESC, a.id DESC LIMIT ?",
+        (*params, limit)
+    ).fetchall()
+
+
+def get_news_sentiment(ticker: str, start: str, window: int):
+    """ gets a ticker's daily sentiment totals with their rolling sums.
+
+    Args:
+        ticker: stock ticker.
+        start: first day returned (YYYY-MM-DD), earlier days only count
+            towards the rolling sums.
+        window: days per rolling window, the day itself included.
+
+    Returns:
+        List: (day, articles, bullish, bearish, relevance, weighted_score,
+            rolling_articles, rolling_relevance, rolling_weighted_score) rows,
+            oldest first.
+    """
+    db = get_db()
+
+    return db.execute(
+        'SELECT * FROM ( \
+            SELECT day, articles, bullish, bearish, relevance, weighted_score, \
+                SUM(articles) OVER rolling AS rolling_articles, \
+                SUM(relevance) OVER rolling AS rolling_relevance, \
+                SUM(weighted_score) OVER rolling AS rolling_weighted_score \
+            FROM news_sentiment WHERE ticker = ? AND day >= date(?, ?) \
+            WINDOW rolling AS (ORDER BY julianday(day) \
+                RANGE BETWEEN ? PRECEDING AND CURRENT ROW)) \
+        WHERE day >= ? ORDER BY day',
+        (ticker, start, f'-{window - 1} days', window - 1, start)
+    ).fetchall()
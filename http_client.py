@@ -0,0 +1,164 @@
+''' pooled keep-alive HTTP sessions shared by the upstream API modules. '''
+
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from stock_trends.metrics import observe_upstream
+
+# responses worth retrying: rate limited or a transient server error.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+DEFAULT_SETTINGS = {
+    'pool_size': 10,
+    'max_retries': 3,
+    'backoff_factor': 0.5,
+    'backoff_jitter': 0.5,
+    'connect_timeout': 3.05,
+    'read_timeout': 20,
+}
+
+_settings = dict(DEFAULT_SETTINGS)
+# builds the adapter mounted on new sessions (Ex: stub_upstream.StubAdapter offline).
+_adapter_factory = {'factory': HTTPAdapter}
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def create_session(retries: bool = True) -> requests.Session:
+    """ creates a session with a connection pool and retry policy.
+
+    Retries back off exponentially with random jitter and honour Retry-After
+    headers. Once retries are exhausted the last response is returned, so
+    callers still see the status through raise_for_status().
+
+    Args:
+        retries: retry in the transport, otherwise every request is sent once.
+
+    Returns:
+        requests.Session: configured session.
+    """
+    retry = Retry(
+        total=_settings['max_retries'],
+        backoff_factor=_settings['backoff_factor'],
+        backoff_jitter=_settings['backoff_jitter'],
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=('GET',),
+        raise_on_status=False)
+    adapter = _adapter_factory['factory'](
+        pool_connections=1,
+        pool_maxsize=_settings['pool_size'],
+        max_retries=retry if retries else 0)
+
+    session = requests.Session()
+    session.headers.update({'Accept-Encoding': 'gzip, deflate',
+                            'Connection': 'keep-alive'})
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(url: str, retries: bool = True) -> requests.Session:
+    ''' returns the shared session for the url's host, creating it on first use. '''
+    parts = urlsplit(url)
+    key = (f'{parts.scheme}://{parts.netloc}', retries)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = create_session(retries)
+    return session
+
+
+def _backoff(attempt: int, response: requests.Response = None) -> float:
+    ''' seconds to wait before retry number attempt (from 1), honouring Retry-After. '''
+    retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+    if retry_after.isdigit():
+        return float(retry_after)
+    return (_settings['backoff_factor'] * 2 ** (attempt - 1)
+            + random.uniform(0, _settings['backoff_jitter']))
+
+
+def _send(session, url, params, headers, endpoint) -> requests.Response:
+    start = time.perf_counter()
+    status = 'error'
+    try:
+        response = session.get(
+            url, params=params, headers=headers,
+            timeout=(_settings['connect_timeout'], _settings['read_timeout']))
+        status = response.status_code
+        return response
+    finally:
+        observe_upstream(endpoint or urlsplit(url).netloc, status, time.perf_counter() - start)
+
+
+def get(url: str, params: dict = None, headers: dict = None,  # pylint: disable=R0913,R0917
+        endpoint: str = None, before_attempt=None) -> requests.Response:
+    """ performs a GET request over the host's pooled session.
+
+    Args:
+        url: request url.
+        params: query parameters.
+        headers: extra request headers.
+        endpoint: name the call is reported under in the upstream metrics
+            (Ex: TIME_SERIES_DAILY), defaults to the url's host.
+        before_attempt: called before the request and before every retry
+            (Ex: to take an API quota token for each call actually sent).
+            Retries are then made here with the same backoff, instead of
+            by the transport where they cannot be seen.
+
+    Returns:
+        requests.Response: response (after any retries).
+    """
+    if before_attempt is None:
+        return _send(get_session(url), url, params, headers, endpoint)
+
+    session = get_session(url, retries=False)
+    for attempt in range(_settings['max_retries'] + 1):
+        last = attempt == _settings['max_retries']
+        before_attempt()
+        try:
+            response = _send(session, url, params, headers, endpoint)
+        except (requests.ConnectionError, requests.Timeout):
+            if last:
+                raise
+            response = None
+        else:
+            if last or response.status_code not in RETRY_STATUSES:
+                return response
+        time.sleep(_backoff(attempt + 1, response))
+    return response
+
+
+def close_sessions() -> None:
+    ''' closes every pooled session, they are recreated on the next request. '''
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def install_adapter(factory) -> None:
+    """ replaces the transport adapter of every upstream session.
+
+    Args:
+        factory: called with HTTPAdapter's keyword arguments (pool size and
+            retry policy) for each new session, None restores HTTPAdapter.
+    """
+    _adapter_factory['factory'] = factory or HTTPAdapter
+    close_sessions()
+
+
+def init_app(app):
+    ''' configures pool size, retries and timeouts from the app config. '''
+    _settings.update({
+        'pool_size': app.config['HTTP_POOL_SIZE'],
+        'max_retries': app.config['HTTP_MAX_RETRIES'],
+        'backoff_factor': app.config['HTTP_BACKOFF_FACTOR'],
+        'backoff_jitter': app.config['HTTP_BACKOFF_JITTER'],
+        'connect_timeout': app.config['HTTP_CONNECT_TIMEOUT'],
+        'read_timeout': app.config['HTTP_READ_TIMEOUT'],
+    })
+    close_sessions()
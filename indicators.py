@@ -0,0 +1,310 @@
+''' vectorized technical indicators (SMA, EMA, Bollinger bands, VWAP, RSI, MACD, ATR). '''
+
+import hashlib
+import math
+import re
+from stock_trends.cache import MemoryCache
+from stock_trends.lazy import lazy_import
+from stock_trends.metrics import format_family, register_collector
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# drawn on every chart unless the user asks for other indicators.
+DEFAULT_INDICATORS = ('sma:5', 'sma:10', 'sma:15')
+
+# upper bounds on what a single request may ask for.
+MAX_INDICATORS = 12
+MAX_WINDOW = 1000
+
+# results are addressed by content, the TTL only bounds how long unused ones are kept.
+RESULT_TTL = 24 * 60 * 60
+
+
+class InvalidIndicator(ValueError):
+    ''' raised for an unknown indicator or invalid parameters. '''
+
+
+class _Bars:
+    """ columns of one series plus the intermediate results indicators share.
+
+    Moving averages, deviations, EMAs and the true range are computed once per
+    series, however many indicators use them (Ex: sma:20 and bb:20, or ema:12
+    and macd:12:26:9).
+    """
+
+    def __init__(self, frame, price: str):
+        self.frame = frame
+        self.price = price
+        self._memo = {}
+
+    def _remember(self, key, compute):
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    def column(self, name: str) -> 'np.ndarray':
+        ''' a column as float64, NaN when the series does not have it. '''
+        return self._remember(('column', name), lambda: (
+            self.frame[name].to_numpy(dtype=np.float64) if name in self.frame
+            else np.full(len(self.frame), np.nan)))
+
+    def mean(self, window: int) -> 'np.ndarray':
+        ''' simple moving average of the price. '''
+        return self._remember(('mean', window),
+                              lambda: _rolling_mean(self.column(self.price), window))
+
+    def std(self, window: int) -> 'np.ndarray':
+        ''' rolling (population) standard deviation of the price. '''
+        return self._remember(('std', window),
+                              lambda: _rolling_std(self.column(self.price), window))
+
+    def ema(self, span: int) -> 'np.ndarray':
+        ''' exponential moving average of the price. '''
+        return self._remember(('ema', span), lambda: _smooth(
+            self.column(self.price), 2 / (span + 1), span - 1))
+
+    def true_range(self) -> 'np.ndarray':
+        ''' greatest of high - low and the gaps to the previous close. '''
+        def compute():
+            high, low, close = self.column('high'), self.column('low'), self.column('close')
+            previous = np.concatenate(([np.nan], close[:-1]))
+            return np.fmax(high - low, np.fmax(np.abs(high - previous), np.abs(low - previous)))
+        return self._remember(('true_range',), compute)
+
+
+def _rolling_mean(values, window: int):
+    out = np.full(len(values), np.nan)
+    if window <= len(values):
+        sums = np.cumsum(np.concatenate(([0.0], values)))
+        out[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return out
+
+
+def _rolling_std(values, window: int):
+    out = np.full(len(values), np.nan)
+    if window <= len(values):
+        out[window - 1:] = np.lib.stride_tricks.sliding_window_view(values, window).std(axis=1)
+    return out
+
+
+def _smooth(values, alpha: float, warmup: int):
+    ''' exponential smoothing with factor alpha, the first warmup values are NaN. '''
+    out = pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy(copy=True)
+    out[:warmup] = np.nan
+    return out
+
+
+def _sma(bars, window):
+    return {'sma': bars.mean(window)}
+
+
+def _ema(bars, window):
+    return {'ema': bars.ema(window)}
+
+
+def _bollinger(bars, window, width):
+    middle = bars.mean(window)
+    deviation = bars.std(window) * width
+    return {'upper': middle + deviation, 'middle': middle, 'lower': middle - deviation}
+
+
+def _vwap(bars):
+    """ volume weighted average price, restarting every session of intraday bars.
+
+    Daily and longer bars are anchored at the first loaded bar.
+    """
+    typical = (bars.column('high') + bars.column('low') + bars.column('close')) / 3
+    volume = bars.column('volume')
+    days = bars.frame.index.to_numpy().astype('datetime64[D]')
+    starts = np.concatenate(([True], days[1:] != days[:-1]))
+    if starts.all():
+        starts[1:] = False
+
+    # cumulative sums restarted at each session start.
+    first = np.maximum.accumulate(np.where(starts, np.arange(len(days)), 0))
+    weighted = np.cumsum(typical * volume)
+    volumes = np.cumsum(volume)
+    weighted -= np.concatenate(([0.0], weighted))[first]
+    volumes -= np.concatenate(([0.0], volumes))[first]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {'vwap': np.where(volumes > 0, weighted / volumes, np.nan)}
+
+
+def _rsi(bars, window):
+    change = np.diff(bars.column(bars.price), prepend=np.nan)
+    # Wilder's smoothing of the gains and losses.
+    gains = _smooth(np.where(change > 0, change, 0.0), 1 / window, window)
+    losses = _smooth(np.where(change < 0, -change, 0.0), 1 / window, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.where(losses == 0, 100.0, 100 - 100 / (1 + gains / losses))
+    rsi[np.isnan(losses)] = np.nan
+    return {'rsi': rsi}
+
+
+def _macd(bars, fast, slow, signal):
+    macd = bars.ema(fast) - bars.ema(slow)
+    signal_line = _smooth(macd, 2 / (signal + 1), max(fast, slow) + signal - 2)
+    return {'macd': macd, 'signal': signal_line, 'histogram': macd - signal_line}
+
+
+def _atr(bars, window):
+    return {'atr': _smooth(bars.true_range(), 1 / window, window - 1)}
+
+
+# name -> (function, default parameters, drawn over the prices). Integer
+# parameters are windows in bars, float parameters are multipliers.
+INDICATORS = {
+    'sma': (_sma, (20,), True),
+    'ema': (_ema, (20,), True),
+    'bb': (_bollinger, (20, 2.0), True),
+    'vwap': (_vwap, (), True),
+    'rsi': (_rsi, (14,), False),
+    'macd': (_macd, (12, 26, 9), False),
+    'atr': (_atr, (14,), False),
+}
+
+
+def parse_spec(text: str):
+    """ parses one indicator spec, missing parameters take their defaults.
+
+    Args:
+        text: indicator name and parameters separated by colons
+            (Ex: sma:20, bb:20:2, macd:12:26:9, vwap), or an already parsed spec.
+
+    Returns:
+        Tuple: (name, parameters).
+    """
+    if not isinstance(text, str):
+        text = spec_label(text)
+    name, *params = text.strip().lower().split(':')
+    if name not in INDICATORS:
+        raise InvalidIndicator(f"unknown indicator '{name}', use one of {', '.join(INDICATORS)}")
+
+    defaults = INDICATORS[name][1]
+    if len(params) > len(defaults):
+        raise InvalidIndicator(f"'{text}': {name} takes at most {len(defaults)} parameters")
+
+    values = []
+    for param, default in zip(params, defaults):
+        try:
+            value = float(param)
+        except ValueError:
+            raise InvalidIndicator(f"'{text}': '{param}' is not a number") from None
+        if isinstance(default, int):
+            if not value.is_integer() or not 1 <= value <= MAX_WINDOW:
+                raise InvalidIndicator(
+                    f"'{text}': windows are whole numbers from 1 to {MAX_WINDOW}")
+            value = int(value)
+        elif not 0 < value <= 10:
+            raise InvalidIndicator(f"'{text}': multipliers are between 0 and 10")
+        values.append(value)
+
+    return name, tuple(values) + defaults[len(values):]
+
+
+def parse_specs(text) -> list:
+    """ parses a list of indicator specs, duplicates are dropped.
+
+    Args:
+        text: specs separated by commas or spaces (Ex: 'sma:20 rsi'), or a list of specs.
+
+    Returns:
+        List: (name, parameters) tuples, see parse_spec.
+    """
+    if isinstance(text, str):
+        text = re.split(r'[\s,]+', text.strip())
+    specs = list(dict.fromkeys(parse_spec(spec) for spec in text if spec))
+    if len(specs) > MAX_INDICATORS:
+        raise InvalidIndicator(f'at most {MAX_INDICATORS} indicators can be requested at once')
+    return specs
+
+
+def spec_label(spec) -> str:
+    ''' canonical text of a parsed spec (Ex: ('rsi', (14,)) -> rsi:14). '''
+    name, params = spec
+    return ':'.join([name] + [f'{param:g}' for param in params])
+
+
+def is_overlay(label: str) -> bool:
+    ''' whether the indicator is drawn over the prices rather than in its own panel. '''
+    return INDICATORS[label.split(':')[0]][2]
+
+
+def series_version(series: str, frame, price: str) -> str:
+    """ content hash of a series, changes whenever a bar is added or revised.
+
+    Returns:
+        str: hex digest.
+    """
+    digest = hashlib.sha256(f'{series}|{price}|{"|".join(frame.columns)}|'.encode())
+    digest.update(frame.index.to_numpy().astype('datetime64[s]').tobytes())
+    digest.update(frame.to_numpy(dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+_cache = MemoryCache(max_entries=2048)
+
+
+def compute_indicators(frame, specs, price: str = 'close', series: str = None) -> dict:
+    """ computes indicators over price bars in a single pass over the columns.
+
+    Results are cached per series version and spec, so only the indicators
+    not computed for this exact series before are calculated.
+
+    Args:
+        frame: price bars as returned by parse_time_series or PriceArchive.read_frame.
+        specs: (name, parameters) tuples, see parse_specs.
+        price: column the price based indicators (SMA, EMA, BB, RSI, MACD) use.
+        series: symbol and interval of the bars (Ex: IBM:Daily), results are
+            only cached when given.
+
+    Returns:
+        Dict: dictonary mapping each spec's label to a dictonary of its lines
+            (Ex: {'bb:20:2': {'upper': ..., 'middle': ..., 'lower': ...}}). Lines
+            are read-only float arrays aligned with the frame, NaN during warm-up.
+    """
+    version = series_version(series, frame, price) if series else None
+    results = {}
+    bars = None
+    for spec in specs:
+        label = spec_label(spec)
+        lines = _cache.get(f'{version}|{label}') if version else None
+        if lines is None:
+            if bars is None:
+                bars = _Bars(frame, price)
+            name, params = spec
+            lines = INDICATORS[name][0](bars, *params)
+            for values in lines.values():
+                values.flags.writeable = False
+            if version:
+                _cache.set(f'{version}|{label}', lines, RESULT_TTL)
+        results[label] = lines
+    return results
+
+
+def indicators_to_json(results: dict) -> dict:
+    ''' compute_indicators results as lists, with None for the warm-up NaNs. '''
+    return {label: {line: [None if math.isnan(value) else value for value in values.tolist()]
+                    for line, values in lines.items()}
+            for label, lines in results.items()}
+
+
+def collect_metrics():
+    ''' indicator result cache metric families. '''
+    stats = _cache.stats()
+    return [
+        format_family('indicator_cache_lookups_total', 'counter',
+                      'Indicator result lookups by outcome.',
+                      [('', {'result': 'hit'}, stats['hits']),
+                       ('', {'result': 'miss'}, stats['misses'])]),
+        format_family('indicator_cache_entries', 'gauge', 'Indicator results cached.',
+                      [('', {}, stats['entries'])]),
+    ]
+
+
+def init_app(app):
+    ''' sizes the indicator result cache from the app config. '''
+    global _cache  # pylint: disable=W0603
+    _cache = MemoryCache(max_entries=app.config['INDICATOR_CACHE_MAX_ENTRIES'])
+    register_collector('indicators', collect_metrics)
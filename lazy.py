@@ -0,0 +1,42 @@
+''' deferred imports of the numeric libraries. '''
+
+import importlib
+import sys
+import types
+
+# imported by preload(), in dependency order.
+HEAVY_MODULES = ('numpy', 'pandas')
+
+
+class LazyModule(types.ModuleType):  # pylint: disable=R0903
+    """ stands in for a module until one of its attributes is first used.
+
+    The real module's namespace is then copied in, so later lookups cost the
+    same as on the module itself.
+    """
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """ returns the module if it is already imported, otherwise a LazyModule for it.
+
+    Args:
+        name: dotted module name (Ex: numpy.linalg).
+    """
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
+
+
+def preload() -> None:
+    """ imports the heavy libraries now instead of on first use.
+
+    Call it in a pre-fork server's master (Ex: gunicorn --preload, or
+    PRELOAD_HEAVY_MODULES) so workers share the loaded modules instead of
+    each importing them on first use.
+    """
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
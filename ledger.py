@@ -0,0 +1,90 @@
+''' lot matching and selling for paper trading positions. '''
+
+from stock_trends.db import transaction, get_user, get_user_positions, apply_stock_sale
+
+# lot matching methods.
+FIFO = 'fifo'
+LIFO = 'lifo'
+SPECIFIC_LOT = 'specific'
+LOT_METHODS = (FIFO, LIFO, SPECIFIC_LOT)
+
+
+class InsufficientShares(ValueError):
+    ''' raised when the matched lots hold fewer shares than are being sold. '''
+
+
+def match_lots(positions, ticker: str, shares: float, method: str = FIFO, lot_id: int = None):
+    """ picks the lots a sale draws from.
+
+    Args:
+        positions: positions as returned by db.get_user_positions.
+        ticker: stock being sold.
+        shares: amount of shares sold.
+        method: FIFO (oldest lots first), LIFO (newest first) or SPECIFIC_LOT.
+        lot_id: the stock purchase id to sell from when method is SPECIFIC_LOT.
+
+    Returns:
+        Tuple: (lot_updates, lot_deletes, remaining_positions) where lot_updates
+            are (remaining_shares, id) pairs, lot_deletes are ids of fully sold
+            lots and remaining_positions are the positions after the sale.
+    """
+    if method not in LOT_METHODS:
+        raise ValueError(f'unknown lot matching method: {method}')
+    if shares <= 0:
+        raise InsufficientShares('0 entered as share amount.')
+
+    lots = [position for position in positions if position['stock_symbol'] == ticker]
+    if method == SPECIFIC_LOT:
+        lots = [position for position in lots if position['id'] == lot_id]
+    else:
+        # ids follow purchase order.
+        lots.sort(key=lambda position: position['id'], reverse=method == LIFO)
+
+    if sum(position['shares'] for position in lots) < shares:
+        raise InsufficientShares('Insufficient shares.')
+
+    lot_updates = []
+    lot_deletes = []
+    remaining = {}
+    to_sell = shares
+    for position in lots:
+        if to_sell <= 0:
+            break
+        sold = min(position['shares'], to_sell)
+        to_sell -= sold
+        if sold == position['shares']:
+            lot_deletes.append(position['id'])
+        else:
+            remaining[position['id']] = position['shares'] - sold
+            lot_updates.append((remaining[position['id']], position['id']))
+
+    remaining_positions = [dict(position, shares=remaining.get(position['id'], position['shares']))
+                           for position in positions if position['id'] not in lot_deletes]
+
+    return lot_updates, lot_deletes, remaining_positions
+
+
+def sell_shares(user_id: int, ticker: str, shares: float, price: float,  # pylint: disable=R0913,R0917
+                method: str = FIFO, lot_id: int = None):
+    """ sells shares out of a user's lots in a single transaction.
+
+    Args:
+        user_id: id from user table
+        ticker: stock being sold.
+        shares: amount of shares sold.
+        price: price per share.
+        method: lot matching method, see match_lots.
+        lot_id: stock purchase id for SPECIFIC_LOT sales.
+
+    Returns:
+        Tuple: (new_balance, remaining_positions).
+    """
+    proceeds = shares * price
+
+    with transaction():
+        balance = get_user(user_id)['balance']
+        lot_updates, lot_deletes, remaining_positions = match_lots(
+            get_user_positions(user_id), ticker, shares, method, lot_id)
+        apply_stock_sale(user_id, lot_updates, lot_deletes, proceeds)
+
+    return balance + proceeds, remaining_positions
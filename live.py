@@ -0,0 +1,299 @@
+''' shared pollers pushing new intraday bars to server-sent event subscribers. '''
+
+import json
+import logging
+import math
+import queue
+import threading
+import requests
+from flask import current_app
+from stock_trends.analytics import COLUMNS, compute_stats
+from stock_trends.api_alphavantage import PRICE_COLUMN, AlphaVantageError, load_price_bars
+from stock_trends.indicators import compute_indicators, indicators_to_json
+from stock_trends.lazy import lazy_import
+from stock_trends.metrics import format_family, register_collector
+from stock_trends.throttle import QuotaExceeded
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+# failures of a single poll, subscribers get an error event and polling goes on.
+POLL_ERRORS = (requests.RequestException, AlphaVantageError, QuotaExceeded,
+               KeyError, ValueError)
+
+
+class TooManyStreams(RuntimeError):
+    ''' raised when a new symbol would exceed LIVE_MAX_SYMBOLS pollers. '''
+
+
+class SymbolPoller:  # pylint: disable=R0902
+    """ polls one series and fans every change out to all of its subscribers.
+
+    There is one poller (and thread) per series however many clients watch
+    it, so upstream calls scale with the symbols watched rather than the
+    viewers. Each subscriber has a bounded queue, a client that falls behind
+    loses its oldest events instead of holding up the others.
+    """
+
+    def __init__(self, app, symbol: str, interval: str, use_mock_data: bool = False):
+        self.app = app
+        self.symbol = symbol
+        self.interval = interval
+        self.use_mock_data = use_mock_data
+        self.latest = None
+        self.polls = 0
+        self.dropped = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'live-{symbol}-{interval}',
+                                        daemon=True)
+
+    def start(self) -> None:
+        ''' starts polling in the background. '''
+        self._thread.start()
+
+    def stop(self) -> None:
+        ''' stops polling after the current poll. '''
+        self._stop.set()
+
+    def subscribers(self) -> int:
+        ''' number of connected subscribers. '''
+        with self._lock:
+            return len(self._subscribers)
+
+    def subscribe(self) -> queue.Queue:
+        ''' adds a subscriber queue, holding the latest event when there is one. '''
+        subscriber = queue.Queue(maxsize=self.app.config['LIVE_QUEUE_SIZE'])
+        with self._lock:
+            if self.latest is not None:
+                subscriber.put_nowait(self.latest)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue) -> int:
+        ''' removes a subscriber, returns the number left. '''
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            return len(self._subscribers)
+
+    def publish(self, event: dict) -> None:
+        ''' queues an event for every subscriber, dropping their oldest when full. '''
+        with self._lock:
+            if event['event'] == 'bars':
+                self.latest = event
+            for subscriber in self._subscribers:
+                while True:
+                    try:
+                        subscriber.put_nowait(event)
+                        break
+                    except queue.Full:
+                        try:
+                            subscriber.get_nowait()
+                            self.dropped += 1
+                        except queue.Empty:
+                            pass
+
+    def poll(self) -> None:
+        """ syncs the series and publishes it when a bar was added or revised.
+
+        Runs in an app context.
+        """
+        symbol, interval, frame = load_price_bars(self.symbol, self.interval,
+                                                  self.use_mock_data)
+        self.polls += 1
+        if frame.empty:
+            return
+
+        newest = frame.iloc[-1]
+        timestamp = int(frame.index[-1].timestamp())
+        latest = self.latest
+        if (latest is not None and latest['id'] == timestamp
+                and latest['frame'].iloc[-1].equals(newest)):
+            return
+
+        self.publish({
+            'event': 'bars',
+            'id': timestamp,
+            'series': f'{symbol}:{interval}',
+            'frame': frame,
+            'stats': compute_stats(frame[PRICE_COLUMN].to_numpy()),
+        })
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    self.poll()
+                except POLL_ERRORS as error:
+                    logger.warning('polling %s %s failed: %r', self.symbol, self.interval, error)
+                    self.publish({'event': 'error',
+                                  'message': 'Could not refresh this series, retrying.'})
+                except Exception:  # pylint: disable=W0718
+                    # keep the stream alive, the next poll starts over.
+                    logger.exception('polling %s %s failed', self.symbol, self.interval)
+            self._stop.wait(self.app.config['LIVE_POLL_INTERVAL'])
+
+
+# (symbol, interval, use_mock_data) -> SymbolPoller
+_pollers = {}
+_pollers_lock = threading.Lock()
+
+
+def subscribe(symbol: str, interval: str, use_mock_data: bool = False):
+    """ subscribes to a series, starting its poller unless one is running.
+
+    Returns:
+        Tuple: (poller, subscriber queue).
+    """
+    app = current_app._get_current_object()  # pylint: disable=W0212
+    key = (symbol.upper(), interval, use_mock_data)
+    with _pollers_lock:
+        poller = _pollers.get(key)
+        if poller is None:
+            if len(_pollers) >= app.config['LIVE_MAX_SYMBOLS']:
+                raise TooManyStreams(f"at most {app.config['LIVE_MAX_SYMBOLS']} symbols "
+                                     'can be streamed at once')
+            poller = _pollers[key] = SymbolPoller(app, *key)
+            poller.start()
+        return poller, poller.subscribe()
+
+
+def unsubscribe(poller: SymbolPoller, subscriber: queue.Queue) -> None:
+    ''' removes a subscriber, and stops the poller once nobody is left. '''
+    with _pollers_lock:
+        if poller.unsubscribe(subscriber) == 0:
+            poller.stop()
+            key = (poller.symbol, poller.interval, poller.use_mock_data)
+            if _pollers.get(key) is poller:
+                del _pollers[key]
+
+
+def _json_number(value):
+    return None if math.isnan(value) else value
+
+
+def format_event(event: dict, specs, since: int = None) -> str:
+    """ formats an event as a server-sent event message.
+
+    A bars event carries the bars at or after since (the newest bar may be a
+    revision of a still-forming one), or only the newest bar without since,
+    plus the stats and the indicator values of those bars.
+
+    Args:
+        event: event published by a SymbolPoller.
+        specs: indicator specs, see indicators.parse_specs.
+        since: timestamp (seconds since epoch) of the newest bar the client has.
+
+    Returns:
+        str: the message.
+    """
+    if event['event'] != 'bars':
+        return f"event: {event['event']}\ndata: {json.dumps({'message': event['message']})}\n\n"
+
+    frame = event['frame']
+    timestamps = frame.index.to_numpy().astype('datetime64[s]').astype(np.int64)
+    count = max(1, int((timestamps >= since).sum())) if since is not None else 1
+
+    indicators = compute_indicators(frame, specs, PRICE_COLUMN, event['series'])
+    rows = frame.iloc[-count:]
+    data = {
+        'series': event['series'],
+        'bars': [{'time': np.datetime_as_string(np.datetime64(timestamp, 's')),
+                  **{column: _json_number(value) for column, value in zip(COLUMNS, values)}}
+                 for timestamp, values in zip(timestamps[-count:].tolist(),
+                                              rows[list(COLUMNS)].to_numpy().tolist())],
+        'stats': event['stats'],
+        'indicators': indicators_to_json({
+            label: {line: values[-count:] for line, values in lines.items()}
+            for label, lines in indicators.items()}),
+    }
+    return f"id: {event['id']}\nevent: bars\ndata: {json.dumps(data)}\n\n"
+
+
+class EventStream:
+    """ messages of one subscription, the body of a server-sent events response.
+
+    The WSGI server calls close once the response is done, also when the
+    body was never iterated (Ex: a HEAD request, or a client that left
+    before the first message), so the subscription always ends.
+    """
+
+    def __init__(self, poller: SymbolPoller, subscriber: queue.Queue, messages):
+        self._poller = poller
+        self._subscriber = subscriber
+        self._messages = messages
+        self._closed = False
+
+    def __iter__(self):
+        return self._messages
+
+    def close(self) -> None:
+        ''' ends the subscription, stopping the poller once nobody is left. '''
+        if self._closed:
+            return
+        self._closed = True
+        self._messages.close()
+        unsubscribe(self._poller, self._subscriber)
+
+
+def open_stream(symbol: str, interval: str, specs, since: int = None,
+                use_mock_data: bool = False) -> EventStream:
+    """ subscribes to a series and returns the stream of its messages.
+
+    The subscription is made right away (so TooManyStreams is raised before
+    a response is sent) and ends when the stream is closed.
+
+    Args:
+        symbol: stock ticker.
+        interval: bar interval (Ex: 5min).
+        specs: indicator specs pushed with the bars.
+        since: timestamp of the newest bar the client has (Ex: Last-Event-ID).
+        use_mock_data: data utilized for testing.
+
+    Returns:
+        EventStream: server-sent event messages, with keep-alive comments between them.
+    """
+    poller, subscriber = subscribe(symbol, interval, use_mock_data)
+    heartbeat = current_app.config['LIVE_HEARTBEAT']
+
+    def messages(since):
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                event = subscriber.get(timeout=heartbeat)
+            except queue.Empty:
+                # detects disconnected clients and keeps proxies from timing out.
+                yield ': keep-alive\n\n'
+                continue
+            yield format_event(event, specs, since)
+            since = event.get('id', since)
+
+    return EventStream(poller, subscriber, messages(since))
+
+
+def running_pollers() -> int:
+    ''' number of series being polled. '''
+    with _pollers_lock:
+        return len(_pollers)
+
+
+def collect_metrics():
+    ''' live poller and subscriber metric families. '''
+    with _pollers_lock:
+        pollers = list(_pollers.values())
+    return [
+        format_family('live_pollers', 'gauge', 'Series polled for live subscribers.',
+                      [('', {}, len(pollers))]),
+        format_family('live_subscribers', 'gauge', 'Connected live update streams.',
+                      [('', {}, sum(poller.subscribers() for poller in pollers))]),
+        format_family('live_events_dropped_total', 'counter',
+                      'Events dropped for subscribers that fell behind (running pollers).',
+                      [('', {}, sum(poller.dropped for poller in pollers))]),
+    ]
+
+
+def init_app(app):  # pylint: disable=W0613
+    ''' registers the live stream metrics. '''
+    register_collector('live', collect_metrics)
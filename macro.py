@@ -0,0 +1,196 @@
+''' US macroeconomic dashboard, refreshed on each series' publication cadence. '''
+
+import threading
+import time
+from datetime import date, timedelta
+from flask import Blueprint, current_app, render_template
+from stock_trends.api_alphavantage import get_macro_series
+from stock_trends.db import get_macro_observations, store_macro_observations
+from stock_trends.lazy import lazy_import
+from stock_trends.metrics import format_family, register_collector
+from stock_trends.stocks import fetch_sections
+
+np = lazy_import('numpy')
+
+bp = Blueprint('macro', __name__, url_prefix='/macro')
+
+# function -> (title, unit, months per observation, days after the end of an
+# observation's period until it is published).
+MACRO_SERIES = {
+    'CPI': ('Consumer Price Index', 'index', 1, 15),
+    'INFLATION': ('Inflation', '%', 12, 120),
+    'RETAIL_SALES': ('Retail Sales', 'millions USD', 1, 17),
+    'UNEMPLOYMENT': ('Unemployment Rate', '%', 1, 7),
+    'REAL_GDP': ('Real GDP', 'billions USD', 12, 30),
+    'TREASURY_YIELD': ('10 Year Treasury Yield', '%', 1, 1),
+    'FEDERAL_FUNDS_RATE': ('Federal Funds Rate', '%', 1, 1),
+}
+
+# seconds until a series that failed to refresh is tried again.
+RETRY_AFTER_ERROR = 5 * 60
+
+# observations drawn in a sparkline, and its size in pixels.
+SPARKLINE_POINTS = 24
+SPARKLINE_SIZE = (160, 40)
+
+# function -> dictonary with dates and values arrays (oldest first), due (unix
+# time of the next expected publication) and checked (unix time of the last
+# upstream check), built from the database on first use.
+_series = {}
+_series_lock = threading.Lock()
+_stats = {'served': 0, 'refreshes': 0}
+
+
+def _add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def next_publication(latest: str, function: str) -> float:
+    """ when the observation after latest is expected to be published.
+
+    Args:
+        latest: date of the newest observation (YYYY-MM-DD), the start of its period.
+        function: one of MACRO_SERIES.
+
+    Returns:
+        float: unix time.
+    """
+    _, _, months, lag = MACRO_SERIES[function]
+    period_end = _add_months(date.fromisoformat(latest[:10]).replace(day=1), 2 * months)
+    return time.mktime((period_end + timedelta(days=lag)).timetuple())
+
+
+def _load(function: str) -> dict:
+    ''' builds a series' state from its stored observations. '''
+    rows = get_macro_observations(function)
+    return {
+        'dates': [row['date'] for row in rows],
+        'values': np.array([row['value'] for row in rows], dtype=np.float64),
+        'due': next_publication(rows[-1]['date'], function) if rows else 0.0,
+        'checked': 0.0,
+    }
+
+
+def _parse(data) -> list:
+    ''' (date, value) rows, oldest first, of Alpha Vantage observations ('.' means missing). '''
+    rows = []
+    for observation in reversed(data):
+        try:
+            rows.append((observation['date'], float(observation['value'])))
+        except ValueError:
+            rows.append((observation['date'], None))
+    return rows
+
+
+def refresh(function: str, use_mock_data: bool = False) -> int:
+    """ fetches and stores the full history of a series.
+
+    Returns:
+        int: number of observations.
+    """
+    rows = _parse(get_macro_series(function, use_mock_data))
+    store_macro_observations(function, rows)
+    return len(rows)
+
+
+def due_series(now: float = None):
+    """ series whose next observation should be out and that were not checked lately.
+
+    A series checked without finding the new observation waits
+    MACRO_RECHECK_INTERVAL seconds before it is checked again.
+    """
+    now = time.time() if now is None else now
+    recheck = current_app.config['MACRO_RECHECK_INTERVAL']
+    with _series_lock:
+        for function in MACRO_SERIES:
+            if function not in _series:
+                _series[function] = _load(function)
+        return [function for function, state in _series.items()
+                if now >= state['due'] and now - state['checked'] >= recheck]
+
+
+def dashboard() -> tuple:
+    """ latest value, change and sparkline of every series.
+
+    Only series that are due are fetched (concurrently), everything else is
+    served from memory. A series that fails is retried after RETRY_AFTER_ERROR.
+
+    Returns:
+        Tuple: (series, errors) with a list of dictonaries (function, title,
+            unit, date, value, change and sparkline) and a dictonary of the
+            series that could not be refreshed.
+    """
+    use_mock_data = current_app.config['MOCK_DATA']
+    due = due_series()
+    errors = {}
+    if due:
+        results, errors = fetch_sections(
+            {function: (refresh, (function, use_mock_data)) for function in due})
+        now = time.time()
+        retry_at = now - current_app.config['MACRO_RECHECK_INTERVAL'] + RETRY_AFTER_ERROR
+        with _series_lock:
+            for function in due:
+                if function in results:
+                    _series[function] = _load(function)
+                    _series[function]['checked'] = now
+                    _stats['refreshes'] += 1
+                else:
+                    _series[function]['checked'] = retry_at
+
+    with _series_lock:
+        _stats['served'] += 1
+        return [_summary(function, _series[function]) for function in MACRO_SERIES
+                if function in _series], errors
+
+
+def _summary(function: str, state: dict) -> dict:
+    title, unit, _, _ = MACRO_SERIES[function]
+    valid = np.flatnonzero(~np.isnan(state['values']))
+    summary = {'function': function, 'title': title, 'unit': unit,
+               'date': None, 'value': None, 'change': None, 'sparkline': ''}
+    if valid.size:
+        latest = valid[-1]
+        summary.update(date=state['dates'][latest], value=float(state['values'][latest]),
+                       sparkline=sparkline(state['values'][valid[-SPARKLINE_POINTS:]]))
+        if valid.size > 1:
+            summary['change'] = float(state['values'][latest] - state['values'][valid[-2]])
+    return summary
+
+
+def sparkline(values, size=SPARKLINE_SIZE) -> str:
+    """ SVG polyline points drawing values across size (width, height) pixels.
+
+    Returns:
+        str: space separated x,y pairs, the highest value at the top.
+    """
+    width, height = size
+    if len(values) < 2:
+        return ''
+    low, high = float(values.min()), float(values.max())
+    xs = np.linspace(0, width, len(values))
+    ys = height - (values - low) / ((high - low) or 1.0) * height
+    return ' '.join(f'{x:.1f},{y:.1f}' for x, y in zip(xs.tolist(), ys.tolist()))
+
+
+@bp.route('/')
+def macro_dashboard():
+    ''' latest US economic indicators with their recent trend. '''
+    series, errors = dashboard()
+    return render_template('macro/macro.html', series=series, section_errors=errors)
+
+
+def collect_metrics():
+    ''' dashboard views and upstream refresh metric families. '''
+    return [
+        format_family('macro_dashboard_views_total', 'counter', 'Macro dashboard views.',
+                      [('', {}, _stats['served'])]),
+        format_family('macro_series_refreshes_total', 'counter',
+                      'Macro series fetched from upstream.',
+                      [('', {}, _stats['refreshes'])]),
+    ]
+
+
+def init_app(app):  # pylint: disable=W0613
+    ''' registers the macro dashboard metrics. '''
+    register_collector('macro', collect_metrics)
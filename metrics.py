@@ -0,0 +1,198 @@
+''' request, upstream, cache and SQLite timings, exposed in Prometheus text format. '''
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from flask import Response, g, has_request_context, request
+
+# upper bounds (seconds) of the latency histogram buckets.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0, float('inf'))
+
+PREFIX = 'stocktrends_'
+
+# request environ key of the per-request timing breakdown, the environ is
+# shared with the request context copies the upstream fan-out threads use.
+TIMINGS_KEY = 'stock_trends.timings'
+_timings_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+    return f'{{{pairs}}}'
+
+
+def _format_value(value) -> str:
+    return '+Inf' if value == float('inf') else repr(float(value))
+
+
+def format_family(name: str, kind: str, help_text: str, samples) -> str:
+    """ formats one metric family in the Prometheus text exposition format.
+
+    Args:
+        name: metric name without PREFIX.
+        kind: 'counter', 'gauge' or 'histogram'.
+        help_text: HELP line.
+        samples: (suffix, labels, value) tuples (Ex: ('_bucket', {'le': 0.1}, 3)).
+
+    Returns:
+        str: the family's lines.
+    """
+    lines = [f'# HELP {PREFIX}{name} {help_text}', f'# TYPE {PREFIX}{name} {kind}']
+    for suffix, labels, value in samples:
+        labels = {key: _format_value(val) if key == 'le' else val for key, val in labels.items()}
+        lines.append(f'{PREFIX}{name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+    return '\n'.join(lines)
+
+
+def histogram_samples(labels: dict, buckets, total: float):
+    """ samples of one labelled histogram series.
+
+    Args:
+        labels: the series' labels.
+        buckets: (upper bound, cumulative count) pairs, ending with +Inf.
+        total: sum of the observed values.
+    """
+    samples = [('_bucket', dict(labels, le=bound), count) for bound, count in buckets]
+    samples.append(('_sum', labels, total))
+    samples.append(('_count', labels, buckets[-1][1] if buckets else 0))
+    return samples
+
+
+class Histogram:
+    ''' labelled latency histogram, safe to observe from any thread. '''
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> ([count per bucket], sum)
+        self._series = {}
+
+    def observe(self, seconds: float, *labelvalues) -> None:
+        ''' records one observation for the series with labelvalues. '''
+        with self._lock:
+            counts, total = self._series.get(labelvalues, ([0] * len(self.buckets), 0.0))
+            counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self._series[labelvalues] = (counts, total + seconds)
+
+    def collect(self) -> str:
+        ''' the histogram in Prometheus text format. '''
+        with self._lock:
+            series = [(labelvalues, list(counts), total)
+                      for labelvalues, (counts, total) in sorted(self._series.items())]
+        samples = []
+        for labelvalues, counts, total in series:
+            cumulative = 0
+            buckets = []
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                buckets.append((bound, cumulative))
+            samples.extend(histogram_samples(dict(zip(self.labelnames, labelvalues)),
+                                             buckets, total))
+        return format_family(self.name, 'histogram', self.help_text, samples)
+
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Time spent handling requests.',
+    ('endpoint', 'method', 'status'))
+UPSTREAM_SECONDS = Histogram(
+    'upstream_request_duration_seconds', 'Upstream API call latency (including retries).',
+    ('endpoint', 'status'))
+STAGE_SECONDS = Histogram(
+    'stage_duration_seconds', 'Time spent in a processing stage (parse, analytics).',
+    ('stage',))
+SQLITE_SECONDS = Histogram(
+    'sqlite_query_duration_seconds', 'SQLite statement execution time.', ('operation',))
+
+_histograms = (REQUEST_SECONDS, UPSTREAM_SECONDS, STAGE_SECONDS, SQLITE_SECONDS)
+
+# name -> function returning formatted metric families, registered by the
+# modules that keep their own statistics (cache, archive, Alpha Vantage quota).
+_collectors = {}
+
+
+def register_collector(name: str, collect) -> None:
+    ''' adds (or replaces) a function returning metric families for /metrics. '''
+    _collectors[name] = collect
+
+
+def add_timing(name: str, seconds: float) -> None:
+    ''' adds seconds to the current request's timing breakdown (no-op outside a request). '''
+    if has_request_context():
+        with _timings_lock:
+            timings = request.environ.setdefault(TIMINGS_KEY, {})
+            timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str):
+    ''' times the enclosed block as a processing stage. '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage)
+        add_timing(stage, elapsed)
+
+
+def observe_upstream(endpoint: str, status, seconds: float) -> None:
+    ''' records an upstream call, status is the HTTP status or 'error'. '''
+    UPSTREAM_SECONDS.observe(seconds, endpoint, str(status))
+    add_timing('upstream', seconds)
+
+
+def observe_query(operation: str, seconds: float) -> None:
+    ''' records a SQLite statement. '''
+    SQLITE_SECONDS.observe(seconds, operation)
+    add_timing('db', seconds)
+
+
+def render_metrics() -> str:
+    ''' every metric family in Prometheus text format. '''
+    families = [histogram.collect() for histogram in _histograms]
+    for collect in list(_collectors.values()):
+        families.extend(collect())
+    return '\n'.join(families) + '\n'
+
+
+def server_timing(timings: dict, total: float) -> str:
+    ''' formats a timing breakdown (seconds) as a Server-Timing header value. '''
+    entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in sorted(timings.items())]
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def init_app(app):
+    ''' times every request and serves /metrics. '''
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('request_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        REQUEST_SECONDS.observe(elapsed, request.endpoint or 'unmatched', request.method,
+                                str(response.status_code))
+        if app.config['SERVER_TIMING']:
+            response.headers['Server-Timing'] = server_timing(
+                request.environ.get(TIMINGS_KEY, {}), elapsed)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,116 @@
+''' news feed parsing, full text queries and rolling ticker sentiment of the local news store. '''
+
+from datetime import datetime, timezone
+
+# Alpha Vantage time_published format, times are stored as if UTC.
+PUBLISHED_FORMAT = '%Y%m%dT%H%M%S'
+
+
+def parse_feed(feed) -> list:
+    """ converts a NEWS_SENTIMENT feed into articles for db.store_news_articles.
+
+    Args:
+        feed: 'feed' list of an Alpha Vantage NEWS_SENTIMENT payload.
+
+    Returns:
+        List: dictonaries with url, title, summary, source, topics (comma
+            separated), published (seconds since epoch), sentiment_score,
+            sentiment_label and tickers, a list of (ticker, relevance,
+            sentiment_score, sentiment_label) tuples.
+    """
+    articles = []
+    for item in feed:
+        published = datetime.strptime(item['time_published'], PUBLISHED_FORMAT)
+        articles.append({
+            'url': item['url'],
+            'title': item.get('title'),
+            'summary': item.get('summary'),
+            'source': item.get('source'),
+            'topics': ', '.join(topic['topic'] for topic in item.get('topics', ())),
+            'published': int(published.replace(tzinfo=timezone.utc).timestamp()),
+            'sentiment_score': float(item['overall_sentiment_score']),
+            'sentiment_label': item.get('overall_sentiment_label'),
+            'tickers': [(sentiment['ticker'], float(sentiment['relevance_score']),
+                         float(sentiment['ticker_sentiment_score']),
+                         sentiment['ticker_sentiment_label'])
+                        for sentiment in item.get('ticker_sentiment', ())],
+        })
+    return articles
+
+
+def time_from(published: int) -> str:
+    ''' Alpha Vantage time_from parameter of a stored publication time (Ex: 20240101T0930). '''
+    return datetime.fromtimestamp(published, timezone.utc).strftime('%Y%m%dT%H%M')
+
+
+def article_to_json(row) -> dict:
+    ''' a stored article (see db.get_news_articles) as a dictonary. '''
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'summary': row['summary'],
+        'source': row['source'],
+        'topics': row['topics'].split(', ') if row['topics'] else [],
+        'time_published': datetime.fromtimestamp(
+            row['published'], timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'url': row['url'],
+        'overall_sentiment_score': row['sentiment_score'],
+        'overall_sentiment_label': row['sentiment_label'],
+    }
+
+
+def match_query(text: str) -> str:
+    """ FTS5 query matching the articles that contain every word of text.
+
+    Words are quoted, so FTS5 syntax typed by a user is searched for
+    literally instead of failing; a trailing * still matches prefixes
+    (Ex: earn* matches earnings).
+
+    Returns:
+        str: the query, or None when text has no words.
+    """
+    terms = []
+    for word in text.split():
+        term = word.rstrip('*').replace('"', '""')
+        if term:
+            terms.append(f'"{term}"' + ('*' if word.endswith('*') else ''))
+    return ' '.join(terms) or None
+
+
+def encode_cursor(row) -> str:
+    ''' cursor of the page after a stored article (Ex: 1704067200-42). '''
+    return f"{row['published']}-{row['id']}"
+
+
+def parse_cursor(cursor: str):
+    """ parses a cursor made by encode_cursor.
+
+    Returns:
+        Tuple: (published, id), raises ValueError when malformed.
+    """
+    published, article_id = cursor.split('-')
+    return int(published), int(article_id)
+
+
+def _weighted(score: float, relevance: float):
+    return score / relevance if relevance else None
+
+
+def sentiment_to_json(rows) -> list:
+    """ daily sentiment totals (see db.get_news_sentiment) as dictonaries.
+
+    Scores are averages weighted by each article's relevance to the ticker.
+
+    Returns:
+        List: dictonaries with day, articles, bullish, bearish, score,
+            rolling_articles and rolling_score, oldest first.
+    """
+    return [{
+        'day': row['day'],
+        'articles': row['articles'],
+        'bullish': row['bullish'],
+        'bearish': row['bearish'],
+        'score': _weighted(row['weighted_score'], row['relevance']),
+        'rolling_articles': row['rolling_articles'],
+        'rolling_score': _weighted(row['rolling_weighted_score'], row['rolling_relevance']),
+    } for row in rows]
@@ -0,0 +1,68 @@
+''' portfolio valuation for the paper trading dashboard. '''
+
+from stock_trends.api_tiingo import get_current_stock_prices
+from stock_trends.lazy import lazy_import
+
+np = lazy_import('numpy')
+
+
+def value_portfolio(positions):
+    """ values every lot and the whole portfolio at the latest prices.
+
+    Quotes for the distinct symbols are fetched in one batched pass, the
+    arithmetic is done on numpy arrays over all lots at once.
+
+    Args:
+        positions: positions as returned by db.get_user_positions.
+
+    Returns:
+        Dict: dictonary with the following keys.
+            * lots (list): each position plus current_price, market_value,
+              cost_basis, unrealized_pnl and unrealized_pnl_pct (None when unpriced).
+            * totals (dict): market_value, cost_basis, unrealized_pnl and
+              unrealized_pnl_pct over all priced lots.
+            * unpriced (list): symbols no quote could be found for.
+    """
+    symbols, symbol_index = np.unique(
+        np.array([position['stock_symbol'].upper() for position in positions], dtype=str),
+        return_inverse=True)
+    quotes = get_current_stock_prices(symbols.tolist()) if len(symbols) else {}
+    symbol_prices = np.array([quotes.get(symbol, np.nan) for symbol in symbols], dtype=np.float64)
+
+    shares = np.array([position['shares'] for position in positions], dtype=np.float64)
+    columns = {'current_price': symbol_prices[symbol_index]}
+    columns['market_value'] = shares * columns['current_price']
+    columns['cost_basis'] = shares * np.array(
+        [position['purchase_price'] for position in positions], dtype=np.float64)
+    columns['unrealized_pnl'] = columns['market_value'] - columns['cost_basis']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        columns['unrealized_pnl_pct'] = np.where(
+            columns['cost_basis'] != 0,
+            columns['unrealized_pnl'] / columns['cost_basis'] * 100,
+            np.nan)
+
+    lots = []
+    for idx, position in enumerate(positions):
+        lots.append(dict(position, **{name: _value(values[idx])
+                                      for name, values in columns.items()}))
+
+    priced = ~np.isnan(columns['current_price'])
+    market_value = float(columns['market_value'][priced].sum())
+    cost_basis = float(columns['cost_basis'][priced].sum())
+    return {
+        'lots': lots,
+        'totals': {
+            'market_value': market_value,
+            'cost_basis': cost_basis,
+            'unrealized_pnl': market_value - cost_basis,
+            'unrealized_pnl_pct': ((market_value - cost_basis) / cost_basis * 100
+                                   if cost_basis else None),
+        },
+        'unpriced': [symbol for symbol, price in zip(symbols.tolist(), symbol_prices)
+                     if np.isnan(price)],
+    }
+
+
+def _value(number):
+    ''' converts a numpy scalar to float, NaN (unpriced) becomes None. '''
+    return None if np.isnan(number) else float(number)
@@ -0,0 +1,180 @@
+''' background refresh of held and watched tickers, so page views find warm data. '''
+
+import logging
+import threading
+import time
+import click
+import requests
+from flask import current_app
+from stock_trends.api_alphavantage import (AlphaVantageError, background_calls, get_news,
+                                          quota_stats, sync_series)
+from stock_trends.api_tiingo import get_current_stock_prices
+from stock_trends.cache import refresh_ahead
+from stock_trends.db import get_held_symbols
+from stock_trends.metrics import format_family, register_collector
+from stock_trends.throttle import QuotaExceeded
+
+logger = logging.getLogger(__name__)
+
+# data refreshed for every symbol, in this order: (name, function, args after the symbol).
+TASKS = (
+    ('daily', sync_series, ('Daily',)),
+    ('intraday', sync_series, ('5min',)),
+    ('news', get_news, ()),
+)
+
+# failures of a single refresh, the cycle moves on to the next one.
+TASK_ERRORS = (requests.RequestException, AlphaVantageError, KeyError, ValueError)
+
+_state = {'thread': None, 'stop': threading.Event()}
+_stats = {'cycles': 0, 'refreshed': 0, 'failed': 0, 'deferred': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(outcome: str, amount: int = 1) -> None:
+    with _stats_lock:
+        _stats[outcome] += amount
+
+
+def prefetch_targets(watchlist=(), limit: int = None):
+    """ symbols to keep warm, most valuable first.
+
+    Held symbols come first, ordered by the number of users holding them,
+    followed by the watchlist. Needs an app context.
+
+    Args:
+        watchlist: extra symbols to refresh.
+        limit: maximum number of symbols.
+
+    Returns:
+        List: upper case symbols without duplicates.
+    """
+    symbols = [row['stock_symbol'] for row in get_held_symbols()]
+    symbols.extend(symbol.upper() for symbol in watchlist)
+    return list(dict.fromkeys(symbols))[:limit]
+
+
+def _run_task(function, args, pause: float) -> bool:
+    """ runs one refresh, waiting out the per-minute budget once.
+
+    Returns:
+        bool: False when the daily budget (less the reserve) is used up.
+    """
+    for attempt in range(2):
+        try:
+            function(*args)
+            _count('refreshed')
+            return True
+        except QuotaExceeded:
+            if quota_stats()['remaining_today'] <= current_app.config['PREFETCH_DAILY_RESERVE']:
+                return False
+            if attempt == 0:
+                # no token right now, users go first.
+                time.sleep(pause)
+        except TASK_ERRORS as error:
+            logger.warning('prefetching %s%r failed: %r', function.__name__, args, error)
+            _count('failed')
+            return True
+    _count('deferred')
+    return True
+
+
+def run_prefetch_cycle(stop: threading.Event = None) -> int:
+    """ refreshes quotes, then daily bars, intraday bars and news of every target symbol.
+
+    Runs in an app context. Entries due to expire before the next cycle are
+    refreshed too, upstream calls only use quota tokens that are free right
+    away and leave PREFETCH_DAILY_RESERVE daily calls for users.
+
+    Args:
+        stop: event ending the cycle early.
+
+    Returns:
+        int: number of target symbols.
+    """
+    config = current_app.config
+    symbols = prefetch_targets(config['PREFETCH_WATCHLIST'], config['PREFETCH_MAX_SYMBOLS'])
+    mock = config['MOCK_DATA']
+    pause = 60 / config['ALPHAVANTAGE_CALLS_PER_MINUTE']
+
+    with refresh_ahead(config['PREFETCH_INTERVAL']), \
+            background_calls(config['PREFETCH_DAILY_RESERVE']):
+        if symbols:
+            # one batched request for every quote.
+            get_current_stock_prices(symbols)
+
+        for symbol in symbols:
+            for _, function, args in TASKS:
+                if stop is not None and stop.is_set():
+                    return len(symbols)
+                if not _run_task(function, (symbol, *args, mock), pause):
+                    logger.info('prefetch stopped, daily budget reserve reached.')
+                    return len(symbols)
+
+    _count('cycles')
+    return len(symbols)
+
+
+def _prefetch_loop(app, stop):
+    while not stop.is_set():
+        with app.app_context():
+            try:
+                run_prefetch_cycle(stop)
+            except Exception:  # pylint: disable=W0718
+                # keep the scheduler alive, the next cycle starts over.
+                logger.exception('prefetch cycle failed')
+        stop.wait(app.config['PREFETCH_INTERVAL'])
+
+
+def start_prefetcher(app) -> threading.Thread:
+    ''' starts the background prefetch thread (once per process). '''
+    if _state['thread'] is None or not _state['thread'].is_alive():
+        _state['stop'] = threading.Event()
+        _state['thread'] = threading.Thread(
+            target=_prefetch_loop, args=(app, _state['stop']), name='prefetch', daemon=True)
+        _state['thread'].start()
+    return _state['thread']
+
+
+def stop_prefetcher() -> None:
+    ''' asks the background prefetch thread to stop after its current refresh. '''
+    _state['stop'].set()
+
+
+def collect_metrics():
+    ''' prefetch cycle and refresh metric families. '''
+    with _stats_lock:
+        stats = dict(_stats)
+    return [
+        format_family('prefetch_cycles_total', 'counter', 'Completed prefetch cycles.',
+                      [('', {}, stats['cycles'])]),
+        format_family('prefetch_refreshes_total', 'counter', 'Prefetch refreshes by outcome.',
+                      [('', {'outcome': outcome}, stats[outcome])
+                       for outcome in ('refreshed', 'failed', 'deferred')]),
+    ]
+
+
+@click.command('prefetch')
+@click.option('--once', is_flag=True, help='Run a single cycle and exit.')
+def prefetch_command(once):
+    """Keep held and watched tickers warm in the cache and price store."""
+    if once:
+        symbols = run_prefetch_cycle()
+        click.echo(f'Prefetched {symbols} symbols: {_stats["refreshed"]} refreshed, '
+                   f'{_stats["failed"]} failed, {_stats["deferred"]} deferred.')
+        return
+
+    app = current_app._get_current_object()  # pylint: disable=W0212
+    stop = threading.Event()
+    try:
+        _prefetch_loop(app, stop)
+    except KeyboardInterrupt:
+        stop.set()
+
+
+def init_app(app):
+    ''' registers the prefetch command, and starts the background thread when enabled. '''
+    app.cli.add_command(prefetch_command)
+    register_collector('prefetch', collect_metrics)
+    if app.config['PREFETCH_ENABLED']:
+        start_prefetcher(app)
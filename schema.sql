@@ -13,3 +13,51 @@ CREATE TABLE user_stocks (
     stock_symbol TEXT,
     FOREIGN KEY (user_id) REFERENCES users (id)
 );
+
+CREATE INDEX idx_user_stocks_user_id ON user_stocks (user_id);
+
+CREATE TABLE macro_observations (
+    function TEXT NOT NULL,
+    date TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (function, date)
+) WITHOUT ROWID;
+
+CREATE TABLE news_articles (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    title TEXT,
+    summary TEXT,
+    source TEXT,
+    topics TEXT,
+    published INTEGER NOT NULL,
+    sentiment_score REAL,
+    sentiment_label TEXT
+);
+
+CREATE INDEX idx_news_articles_published ON news_articles (published);
+
+CREATE TABLE news_tickers (
+    ticker TEXT NOT NULL,
+    published INTEGER NOT NULL,
+    article_id INTEGER NOT NULL,
+    relevance REAL,
+    sentiment_score REAL,
+    sentiment_label TEXT,
+    PRIMARY KEY (ticker, published, article_id)
+) WITHOUT ROWID;
+
+CREATE TABLE news_sentiment (
+    ticker TEXT NOT NULL,
+    day TEXT NOT NULL,
+    articles INTEGER NOT NULL,
+    bullish INTEGER NOT NULL,
+    bearish INTEGER NOT NULL,
+    relevance REAL NOT NULL,
+    weighted_score REAL NOT NULL,
+    PRIMARY KEY (ticker, day)
+) WITHOUT ROWID;
+
+CREATE VIRTUAL TABLE news_search USING fts5(
+    title, summary, topics, content='news_articles', content_rowid='id'
+);
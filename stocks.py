@@ -1,11 +1,99 @@
 ''' Stocks logic. '''
 
-from flask import render_template, request, Blueprint, jsonify
-from stock_trends.api_alphavantage import (get_news, get_intraday_data_on_stock,
-                                          get_stock_data, get_ticker_suggestions)
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
+import requests
+from flask import (render_template, request, Blueprint, jsonify, current_app,
+                   copy_current_request_context, Response, url_for)
+from stock_trends.api_alphavantage import (BAR_SECONDS, get_news, get_indicators,
+                                          get_bars, get_ticker_suggestions, news_symbol,
+                                          stored_interval, sync_news, sync_series,
+                                          AlphaVantageError)
+from stock_trends.archive import get_archive
+from stock_trends.comparison import close_matrix, compare_returns
+from stock_trends.db import get_news_articles, get_news_sentiment
+from stock_trends.indicators import (DEFAULT_INDICATORS, InvalidIndicator,
+                                     indicators_to_json, parse_specs, spec_label)
+from stock_trends.live import TooManyStreams, open_stream
+from stock_trends.metrics import timed
+from stock_trends.news import (article_to_json, encode_cursor, match_query, parse_cursor,
+                               sentiment_to_json)
+from stock_trends.symbols import get_index
+from stock_trends.throttle import QuotaExceeded
 
 bp = Blueprint('stocks', __name__, url_prefix='/stocks')
 
+# failures of a single upstream section, reported on the page instead of a 500.
+UPSTREAM_ERRORS = (requests.RequestException, AlphaVantageError, QuotaExceeded,
+                   KeyError, ValueError)
+
+# series the json APIs serve, and the most bars they return.
+BAR_INTERVALS = tuple(BAR_SECONDS)
+MAX_BARS = 1000
+
+# most news articles per page and days of sentiment the json APIs return.
+MAX_NEWS_ARTICLES = 100
+MAX_SENTIMENT_DAYS = 365
+
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    ''' returns the app's bounded thread pool used to fan out upstream fetches. '''
+    with _executor_lock:
+        executor = current_app.extensions.get('upstream_executor')
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=current_app.config['UPSTREAM_MAX_WORKERS'],
+                thread_name_prefix='upstream')
+            current_app.extensions['upstream_executor'] = executor
+    return executor
+
+
+def fetch_sections(calls: dict):
+    """ runs the selected upstream fetches concurrently.
+
+    Args:
+        calls: dictonary mapping a section name to a (function, args) pair.
+
+    Returns:
+        Tuple: (results, errors) dictonaries keyed by section name. A failing
+            or timed out section only sets its entry in errors.
+    """
+    executor = get_executor()
+    futures = {}
+    for section, (function, args) in calls.items():
+        futures[executor.submit(copy_current_request_context(function), *args)] = section
+
+    results = {}
+    errors = {}
+    try:
+        for future in as_completed(futures, timeout=current_app.config['UPSTREAM_FANOUT_TIMEOUT']):
+            section = futures[future]
+            try:
+                results[section] = future.result()
+            except UPSTREAM_ERRORS as error:
+                current_app.logger.warning('fetching %s failed: %r', section, error)
+                errors[section] = 'Could not load this section, please try again later.'
+    except FutureTimeout:
+        for future, section in futures.items():
+            if not future.done():
+                future.cancel()
+                errors[section] = 'This section timed out, please try again later.'
+
+    return results, errors
+
+
+def _data_urls(ticker: str, interval: str, labels: str) -> dict:
+    ''' data API urls a chart section of the stocks page loads, see api.bars and api.stats. '''
+    return {
+        'bars': url_for('api.bars', symbol=ticker, interval=interval, indicators=labels),
+        'stats': url_for('api.stats', symbol=ticker, interval=interval),
+    }
+
+
 # Stocks page
 @bp.route('/stock', methods=('GET', 'POST'))
 def stock_home_page():
@@ -27,34 +115,264 @@ def stock_home_page():
                 error_message="Please enter a single stock ticker and select at \
                 least one option from the drop-down.")
 
-        # Calling API and generating output as needed.
-        output_news_data = False
-        output_price_data = False
-        output_intraday_data = False
+        # Error Handling - checking the requested intraday interval.
+        minutes = request.form.get('intraday_interval', 5, type=int)
+        if f'{minutes}min' not in BAR_SECONDS:
+            return render_template('stocks/stocks.html',
+                                   error_message='Please select an intraday interval.')
 
+        # Error Handling - checking the requested chart indicators.
+        try:
+            specs = (parse_specs(request.form.get('indicators', ''))
+                     or parse_specs(DEFAULT_INDICATORS))
+        except InvalidIndicator as error:
+            return render_template('stocks/stocks.html', error_message=f'Indicators: {error}')
+
+        # Calling API for the news, charts are drawn in the browser from the data API.
         # NOTE: assumption is that the client will supply a valid ticker.
+        calls = {}
         if selected_news_articles:
-            output_news_data = get_news(str(ticker), True)
+            calls['news'] = (get_news, (str(ticker), current_app.config['MOCK_DATA']))
+
+        results, errors = fetch_sections(calls)
 
+        labels = ','.join(spec_label(spec) for spec in specs)
         if selected_last_30_day_prices:
-            output_price_data = get_stock_data(str(ticker), 'Daily', True)
+            results['price'] = _data_urls(ticker, 'Daily', labels)
 
         if selected_intraday_data:
-            output_intraday_data = get_intraday_data_on_stock(
-                str(ticker), 5, True)
+            results['intraday'] = _data_urls(ticker, f'{minutes}min', labels)
+            # live updates of the intraday section, see stream.
+            results['intraday']['stream'] = url_for(
+                'stocks.stream', symbol=ticker, interval=f'{minutes}min', indicators=labels)
 
         return render_template('stocks/stocks.html',
-                               output_news_data=output_news_data,
-                               output_price_data=output_price_data,
-                               output_intraday_data=output_intraday_data)
+                               output_news_data=results.get('news', False),
+                               output_price_data=results.get('price', False),
+                               output_intraday_data=results.get('intraday', False),
+                               section_errors=errors)
 
     return render_template('stocks/stocks.html')
 
 
 @bp.route('/search')
 def search():
-    ''' add doc string '''
+    ''' ticker autocomplete, answered from the local symbol index when loaded. '''
     query = request.args.get('q', '').upper()
-    suggestions = get_ticker_suggestions(query, True)
+    limit = request.args.get('limit', current_app.config['SYMBOL_SEARCH_LIMIT'], type=int)
+
+    index = get_index()
+    if index is not None:
+        matches = index.search(query, limit)
+        if matches:
+            return jsonify([match['symbol'] for match in matches])
+
+    # fall back to the remote search while the index loads or when it has no match.
+    try:
+        suggestions = get_ticker_suggestions(query, True)[:limit]
+    except UPSTREAM_ERRORS as error:
+        current_app.logger.warning('ticker search failed: %r', error)
+        suggestions = []
 
     return jsonify(suggestions)
+
+
+@bp.route('/indicators')
+def indicators():
+    """ indicator lines of a series as json.
+
+    Query parameters: symbol, interval (Daily, Weekly, Monthly or 1min to
+    60min), indicators (Ex: sma:20,bb:20:2,rsi) and limit (bars).
+    """
+    symbol = request.args.get('symbol', '')
+    interval = request.args.get('interval', 'Daily')
+    limit = min(max(request.args.get('limit', 100, type=int), 1), MAX_BARS)
+    if not symbol:
+        return jsonify(error='symbol is required'), 400
+    if interval not in BAR_INTERVALS:
+        return jsonify(error=f"interval must be one of {', '.join(BAR_INTERVALS)}"), 400
+
+    try:
+        specs = (parse_specs(request.args.get('indicators', ''))
+                 or parse_specs(DEFAULT_INDICATORS))
+        result = get_indicators(symbol, interval, specs, current_app.config['MOCK_DATA'],
+                                limit)
+    except InvalidIndicator as error:
+        return jsonify(error=str(error)), 400
+    except UPSTREAM_ERRORS as error:
+        current_app.logger.warning('indicators for %s failed: %r', symbol, error)
+        return jsonify(error='Could not load this series, please try again later.'), 502
+
+    result['indicators'] = indicators_to_json(result['indicators'])
+    return jsonify(result)
+
+
+def _closes(symbols, interval: str, stored: str, limit: int) -> dict:
+    """ newest closes of many series, see comparison.close_matrix.
+
+    Stored intervals are zero-copy archive slices, resampled ones are
+    resampled series by series.
+    """
+    closes = {}
+    for symbol in symbols:
+        if interval == stored:
+            bars = get_archive().read(symbol, interval, limit=limit, columns=('close',))
+            closes[symbol] = (bars['timestamp'], bars['close'])
+        else:
+            frame = get_bars(symbol, interval, stored, limit)
+            closes[symbol] = (frame.index.to_numpy().astype('datetime64[s]').astype('int64'),
+                              frame['close'].to_numpy())
+    return closes
+
+
+@bp.route('/compare')
+def compare():
+    """ normalized returns, correlation, beta and volatility of a basket as json.
+
+    Query parameters: symbols (Ex: AAPL,MSFT,NVDA), benchmark (the index the
+    betas are measured against), interval, window (bars per correlation
+    window) and limit (bars). Series are synced concurrently, symbols that
+    could not be loaded are listed under unavailable.
+    """
+    config = current_app.config
+    tickers = list(dict.fromkeys(
+        ticker.upper() for ticker in re.split(r'[\s,]+', request.args.get('symbols', ''))
+        if ticker))
+    benchmark = request.args.get('benchmark', config['COMPARE_BENCHMARK']).upper()
+    interval = request.args.get('interval', 'Daily')
+    window = request.args.get('window', 20, type=int)
+    limit = min(max(request.args.get('limit', 100, type=int), 2), MAX_BARS)
+
+    if not 1 <= len(tickers) <= config['COMPARE_MAX_SYMBOLS']:
+        return jsonify(
+            error=f"symbols takes 1 to {config['COMPARE_MAX_SYMBOLS']} tickers"), 400
+    if interval not in BAR_INTERVALS:
+        return jsonify(error=f"interval must be one of {', '.join(BAR_INTERVALS)}"), 400
+    if not 2 <= window < limit:
+        return jsonify(error='window must be at least 2 and less than limit'), 400
+
+    tickers = list(dict.fromkeys(tickers + [benchmark]))
+    synced, unavailable = fetch_sections(
+        {ticker: (sync_series, (ticker, interval, config['MOCK_DATA']))
+         for ticker in tickers})
+    columns = {ticker: synced[ticker][0] for ticker in tickers if ticker in synced}
+    if not columns:
+        return jsonify(error='Could not load any series, please try again later.',
+                       unavailable=unavailable), 502
+
+    interval = next(iter(synced.values()))[1]
+    closes = close_matrix(
+        _closes(set(columns.values()), interval,
+                stored_interval(interval, config['MOCK_DATA']), limit), columns)
+    if len(closes) < 2:
+        return jsonify(error='Not enough overlapping bars to compare.',
+                       unavailable=unavailable), 502
+
+    with timed('analytics'):
+        result = compare_returns(closes, benchmark, window, interval)
+    result.update(benchmark=benchmark if benchmark in columns else None,
+                  interval=interval, window=window, unavailable=unavailable)
+    return jsonify(result)
+
+
+def _sync_news(symbol: str):
+    """ fetches a ticker's new articles into the news store.
+
+    Returns:
+        Tuple: (ticker the articles are stored under, whether the fetch
+            failed and only stored articles are served).
+    """
+    use_mock_data = current_app.config['MOCK_DATA']
+    try:
+        return sync_news(symbol, use_mock_data), False
+    except UPSTREAM_ERRORS as error:
+        current_app.logger.warning('news for %s failed: %r', symbol, error)
+        return news_symbol(symbol, use_mock_data), True
+
+
+@bp.route('/news')
+def news():
+    """ stored news articles as json, newest first.
+
+    Query parameters: symbol (only articles mentioning it), q (full text
+    search of the titles, summaries and topics), limit and cursor (next of
+    the previous page). The symbol's new articles are fetched before its
+    first page is served.
+    """
+    symbol = request.args.get('symbol', '').upper() or None
+    match = match_query(request.args.get('q', ''))
+    limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_NEWS_ARTICLES)
+    try:
+        cursor = request.args.get('cursor')
+        before = parse_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify(error='invalid cursor'), 400
+
+    stale = False
+    if symbol is not None and before is None:
+        symbol, stale = _sync_news(symbol)
+    elif symbol is not None:
+        # later pages only read the store, so they line up with the first one.
+        symbol = news_symbol(symbol, current_app.config['MOCK_DATA'])
+
+    rows = get_news_articles(symbol, match, before, limit)
+    return jsonify(articles=[article_to_json(row) for row in rows],
+                   next=encode_cursor(rows[-1]) if len(rows) == limit else None,
+                   stale=stale)
+
+
+@bp.route('/sentiment')
+def sentiment():
+    """ daily and rolling news sentiment of a ticker as json.
+
+    Query parameters: symbol, days (days returned, newest last) and window
+    (days per rolling average). Served from the daily totals kept up to date
+    as articles are stored, after fetching the symbol's new articles.
+    """
+    symbol = request.args.get('symbol', '').upper()
+    days = min(max(request.args.get('days', 30, type=int), 1), MAX_SENTIMENT_DAYS)
+    window = min(max(request.args.get('window', 7, type=int), 1), MAX_SENTIMENT_DAYS)
+    if not symbol:
+        return jsonify(error='symbol is required'), 400
+
+    symbol, stale = _sync_news(symbol)
+    start = datetime.now(timezone.utc).date() - timedelta(days=days - 1)
+    daily = sentiment_to_json(get_news_sentiment(symbol, start.isoformat(), window))
+    return jsonify(symbol=symbol, window=window, days=daily, stale=stale)
+
+
+@bp.route('/stream')
+def stream():
+    """ server-sent events with the new bars, stats and indicators of a series.
+
+    Query parameters: symbol, interval (Ex: 5min), indicators and since (the
+    newest bar the client has, a reconnecting client's Last-Event-ID header
+    takes precedence). Every viewer of a series shares one upstream poller.
+    """
+    symbol = request.args.get('symbol', '').upper()
+    interval = request.args.get('interval', '5min')
+    since = request.headers.get('Last-Event-ID', request.args.get('since'))
+    if not symbol:
+        return jsonify(error='symbol is required'), 400
+    if interval not in BAR_INTERVALS:
+        return jsonify(error=f"interval must be one of {', '.join(BAR_INTERVALS)}"), 400
+
+    try:
+        specs = (parse_specs(request.args.get('indicators', ''))
+                 or parse_specs(DEFAULT_INDICATORS))
+        since = int(since) if since else None
+        # streams the same (mock) data the stocks page's charts show.
+        messages = open_stream(symbol, interval, specs, since,
+                               current_app.config['MOCK_DATA'])
+    except InvalidIndicator as error:
+        return jsonify(error=str(error)), 400
+    except ValueError:
+        return jsonify(error='since must be a timestamp'), 400
+    except TooManyStreams as error:
+        return jsonify(error=str(error)), 503
+
+    response = Response(messages, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # stop proxies (Ex: nginx) from buffering the stream.
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
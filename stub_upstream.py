@@ -0,0 +1,347 @@
+''' offline stand-in for the Alpha Vantage and Tiingo APIs, used for benchmarks and development. '''
+
+import csv
+import functools
+import io
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qsl, urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+from stock_trends import http_client
+
+# topics tagged on synthetic news articles.
+NEWS_TOPICS = ('earnings', 'technology', 'financial_markets', 'economy_macro',
+               'mergers_and_acquisitions', 'ipo', 'retail_wholesale', 'energy_transportation')
+
+# symbols served by the synthetic listing, search and quote payloads.
+STUB_SYMBOLS = (
+    ('AAPL', 'Apple Inc', 'NASDAQ'),
+    ('AMD', 'Advanced Micro Devices Inc', 'NASDAQ'),
+    ('AMZN', 'Amazon.com Inc', 'NASDAQ'),
+    ('GOOGL', 'Alphabet Inc - Class A', 'NASDAQ'),
+    ('IBM', 'International Business Machines Corp', 'NYSE'),
+    ('INTC', 'Intel Corp', 'NASDAQ'),
+    ('JPM', 'JPMorgan Chase & Co', 'NYSE'),
+    ('KO', 'Coca-Cola Co', 'NYSE'),
+    ('META', 'Meta Platforms Inc - Class A', 'NASDAQ'),
+    ('MSFT', 'Microsoft Corporation', 'NASDAQ'),
+    ('NVDA', 'NVIDIA Corp', 'NASDAQ'),
+    ('TSCO', 'Tractor Supply Co', 'NASDAQ'),
+    ('TSLA', 'Tesla Inc', 'NASDAQ'),
+    ('WMT', 'Walmart Inc', 'NYSE'),
+    ('XOM', 'Exxon Mobil Corp', 'NYSE'),
+)
+
+# bars in a synthetic time series response.
+COMPACT_BARS = 100
+FULL_BARS = 1000
+
+SERIES_KEYS = {
+    'TIME_SERIES_DAILY': 'Time Series (Daily)',
+    'TIME_SERIES_WEEKLY': 'Weekly Time Series',
+    'TIME_SERIES_MONTHLY': 'Monthly Time Series',
+}
+SERIES_STEPS = {
+    'TIME_SERIES_DAILY': timedelta(days=1),
+    'TIME_SERIES_WEEKLY': timedelta(weeks=1),
+    'TIME_SERIES_MONTHLY': timedelta(days=30),
+}
+
+
+def fixture_name(url: str, params: dict) -> str:
+    """ name a recorded payload is stored under, without its extension.
+
+    Alpha Vantage payloads are keyed by function and interval, Tiingo
+    payloads by endpoint. The symbol is not part of the name, a recorded
+    payload is replayed for every symbol.
+
+    Returns:
+        str: fixture name, or None for urls that are not stubbed.
+    """
+    parts = urlsplit(url)
+    if parts.netloc == 'www.alphavantage.co':
+        return '_'.join(['alphavantage', params.get('function', '')]
+                        + ([params['interval']] if 'interval' in params else []))
+    if parts.netloc == 'api.tiingo.com':
+        if parts.path.startswith('/iex'):
+            return 'tiingo_iex'
+        if parts.path.startswith('/tiingo/daily/'):
+            return 'tiingo_daily_prices'
+    return None
+
+
+def _rng(*seed) -> random.Random:
+    ''' generator seeded from the payload's identity, so replies are repeatable. '''
+    return random.Random(zlib.crc32('|'.join(map(str, seed)).encode()))
+
+
+def _base_price(symbol: str) -> float:
+    return 20 + zlib.crc32(symbol.encode()) % 480
+
+
+def _time_series(function: str, params: dict) -> dict:
+    symbol = params.get('symbol', 'IBM').upper()
+    count = FULL_BARS if params.get('outputsize') == 'full' else COMPACT_BARS
+    now = datetime.now().replace(second=0, microsecond=0)
+
+    if function == 'TIME_SERIES_INTRADAY':
+        key = f"Time Series ({params['interval']})"
+        step = timedelta(minutes=int(params['interval'].rstrip('min')))
+        latest = now - timedelta(minutes=now.minute % (step.seconds // 60))
+        fmt = '%Y-%m-%d %H:%M:%S'
+    else:
+        key = SERIES_KEYS[function]
+        step = SERIES_STEPS[function]
+        latest = now.replace(hour=0, minute=0)
+        fmt = '%Y-%m-%d'
+
+    rng = _rng(symbol, function, latest.date())
+    price = _base_price(symbol)
+    bars = {}
+    for idx in range(count):
+        change = rng.gauss(0, price * 0.01)
+        bars[(latest - idx * step).strftime(fmt)] = {
+            '1. open': f'{price:.4f}',
+            '2. high': f'{max(price, price + change) + abs(rng.gauss(0, price * 0.005)):.4f}',
+            '3. low': f'{min(price, price + change) - abs(rng.gauss(0, price * 0.005)):.4f}',
+            '4. close': f'{price + change:.4f}',
+            '5. volume': str(rng.randint(10_000, 5_000_000)),
+        }
+        # walking back in time.
+        price = max(1.0, price - change)
+
+    return {'Meta Data': {'2. Symbol': symbol}, key: bars}
+
+
+def _news(params: dict) -> dict:
+    """ an article per hour up to now, newest first, honouring time_from, limit and sort. """
+    tickers = params.get('tickers', 'AAPL').upper().split(',')
+    latest = datetime.now(timezone.utc).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+    oldest = (datetime.strptime(params['time_from'], '%Y%m%dT%H%M')
+              if 'time_from' in params else datetime.min)
+    feed = []
+    for idx in range(int(params.get('limit', 50))):
+        published = latest - timedelta(hours=idx)
+        if published < oldest:
+            break
+        rng = _rng(tickers[0], 'news', published)
+        score = round(rng.uniform(-0.5, 0.5), 6)
+        mentioned = [tickers[0]] + rng.sample([symbol for symbol, _, _ in STUB_SYMBOLS], 2)
+        ticker_sentiment = []
+        for symbol in dict.fromkeys(mentioned):
+            ticker_score = score + rng.uniform(-0.2, 0.2)
+            ticker_sentiment.append({
+                'ticker': symbol, 'relevance_score': f'{rng.random():.6f}',
+                'ticker_sentiment_score': f'{ticker_score:.6f}',
+                'ticker_sentiment_label': _sentiment_label(ticker_score)})
+        feed.append({
+            'title': f'{tickers[0]} headline {published:%Y-%m-%d %H:00}',
+            'url': f'https://news.example.com/{tickers[0].lower()}/{published:%Y%m%d%H}',
+            'time_published': published.strftime('%Y%m%dT%H%M%S'),
+            'summary': f'Synthetic article about {tickers[0]} and {rng.choice(NEWS_TOPICS)}.',
+            'source': rng.choice(('Benzinga', 'Reuters', 'Motley Fool', 'Zacks')),
+            'topics': [{'topic': topic, 'relevance_score': f'{rng.random():.6f}'}
+                       for topic in rng.sample(NEWS_TOPICS, 2)],
+            'overall_sentiment_score': score,
+            'overall_sentiment_label': _sentiment_label(score),
+            'ticker_sentiment': ticker_sentiment,
+        })
+    if params.get('sort') == 'EARLIEST':
+        feed.reverse()
+    return {'items': str(len(feed)), 'feed': feed}
+
+
+def _sentiment_label(score: float) -> str:
+    if score <= -0.35:
+        return 'Bearish'
+    if score <= -0.15:
+        return 'Somewhat-Bearish'
+    if score < 0.15:
+        return 'Neutral'
+    return 'Somewhat-Bullish' if score < 0.35 else 'Bullish'
+
+
+def _symbol_search(params: dict) -> dict:
+    keywords = params.get('keywords', '').upper()
+    return {'bestMatches': [
+        {'1. symbol': symbol, '2. name': name, '4. region': 'United States'}
+        for symbol, name, _ in STUB_SYMBOLS
+        if symbol.startswith(keywords) or keywords in name.upper()]}
+
+
+def _listing() -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\r\n')
+    writer.writerow(('symbol', 'name', 'exchange', 'assetType', 'ipoDate',
+                     'delistingDate', 'status'))
+    for symbol, name, exchange in STUB_SYMBOLS:
+        writer.writerow((symbol, name, exchange, 'Stock', '1990-01-01', 'null', 'Active'))
+    return buffer.getvalue()
+
+
+def _economic_indicator(function: str) -> dict:
+    rng = _rng(function)
+    start = datetime(2024, 1, 1)
+    return {'name': function, 'data': [
+        {'date': (start - timedelta(days=30 * idx)).strftime('%Y-%m-%d'),
+         'value': f'{rng.uniform(0.5, 10):.3f}'}
+        for idx in range(24)]}
+
+
+def _tiingo_daily(url: str) -> list:
+    ticker = urlsplit(url).path.split('/')[3].upper()
+    price = _base_price(ticker)
+    return [{'date': datetime.now().strftime('%Y-%m-%dT00:00:00.000Z'),
+             'open': price, 'high': price * 1.01, 'low': price * 0.99,
+             'close': price * 1.005, 'volume': 1_000_000}]
+
+
+def _tiingo_iex(params: dict) -> list:
+    return [{'ticker': ticker.upper(),
+             'tngoLast': _base_price(ticker.upper()),
+             'last': _base_price(ticker.upper()),
+             'prevClose': _base_price(ticker.upper())}
+            for ticker in params.get('tickers', '').split(',') if ticker]
+
+
+def synthetic_payload(url: str, params: dict):
+    """ generates a plausible payload for an upstream request.
+
+    Returns:
+        Tuple: (body, content type), or None for requests that are not stubbed.
+    """
+    name = fixture_name(url, params)
+    function = params.get('function', '')
+    if name is None:
+        return None
+    if name == 'tiingo_iex':
+        payload = _tiingo_iex(params)
+    elif name == 'tiingo_daily_prices':
+        payload = _tiingo_daily(url)
+    elif function == 'LISTING_STATUS':
+        return _listing().encode(), 'text/csv'
+    elif function in SERIES_KEYS or function == 'TIME_SERIES_INTRADAY':
+        payload = _time_series(function, params)
+    elif function == 'NEWS_SENTIMENT':
+        payload = _news(params)
+    elif function == 'SYMBOL_SEARCH':
+        payload = _symbol_search(params)
+    else:
+        payload = _economic_indicator(function)
+    return json.dumps(payload).encode(), 'application/json'
+
+
+class StubAdapter(HTTPAdapter):  # pylint: disable=R0902
+    """ transport adapter answering upstream requests without the network.
+
+    A payload recorded in fixtures_path (see RecordingAdapter) is replayed
+    when one exists, otherwise a synthetic payload is generated. Every reply
+    is delayed by latency seconds plus up to jitter seconds, and error_rate
+    of them are answered with error_status instead.
+
+    Mounted in place of the pooled HTTPAdapter, so urllib3 retries are not
+    exercised: injected errors reach the caller directly.
+    """
+
+    def __init__(self, fixtures_path: str = None, latency: float = 0.0,  # pylint: disable=R0913,R0917
+                 jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 503,
+                 seed: int = None):
+        super().__init__()
+        self.fixtures_path = fixtures_path
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def _fixture(self, url, params):
+        name = fixture_name(url, params)
+        if self.fixtures_path is None or name is None:
+            return None
+        for extension, content_type in (('json', 'application/json'), ('csv', 'text/csv')):
+            path = os.path.join(self.fixtures_path, f'{name}.{extension}')
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    return f.read(), content_type
+        return None
+
+    def _reply(self, url, params, failed):
+        ''' status, body and content type answering a request. '''
+        if failed:
+            return self.error_status, json.dumps({'error': 'injected failure'}).encode(), \
+                'application/json'
+        reply = self._fixture(url, params) or synthetic_payload(url, params)
+        if reply is None:
+            return 404, json.dumps({'error': f'no stub for {url}'}).encode(), 'application/json'
+        return (200, *reply)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None,  # pylint: disable=R0913,R0917
+             proxies=None):
+        ''' answers the request from a fixture or a synthetic payload. '''
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+            self.errors += failed
+        time.sleep(delay)
+
+        status, body, content_type = self._reply(
+            request.url.split('?')[0], dict(parse_qsl(urlsplit(request.url).query)), failed)
+        raw = HTTPResponse(body=io.BytesIO(body), status=status, preload_content=False,
+                           headers={'Content-Type': content_type,
+                                    'Content-Length': str(len(body))})
+        return self.build_response(request, raw)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """ pooled adapter that saves every successful upstream reply as a fixture.
+
+    Run the app against the real APIs once with UPSTREAM_RECORD_FIXTURES on,
+    then replay the recorded payloads offline with UPSTREAM_STUB.
+    """
+
+    def __init__(self, fixtures_path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.fixtures_path = fixtures_path
+        os.makedirs(fixtures_path, exist_ok=True)
+
+    def send(self, request, *args, **kwargs):  # pylint: disable=W0221
+        ''' sends the request and stores the reply under its fixture name. '''
+        response = super().send(request, *args, **kwargs)
+        name = fixture_name(request.url.split('?')[0],
+                            dict(parse_qsl(urlsplit(request.url).query)))
+        if name is not None and response.status_code == 200:
+            is_csv = 'csv' in response.headers.get('Content-Type', '')
+            path = os.path.join(self.fixtures_path, f"{name}.{'csv' if is_csv else 'json'}")
+            partial = f'{path}.{os.getpid()}.partial'
+            with open(partial, 'wb') as f:
+                f.write(response.content)
+            os.replace(partial, path)
+        return response
+
+
+def init_app(app):
+    ''' installs the stub (or recording) adapter on the upstream HTTP client when configured. '''
+    if app.config['UPSTREAM_STUB']:
+        # one adapter shared by every host, so its counters cover all upstream calls.
+        stub = StubAdapter(
+            fixtures_path=app.config['UPSTREAM_FIXTURES_PATH'],
+            latency=app.config['UPSTREAM_STUB_LATENCY'],
+            jitter=app.config['UPSTREAM_STUB_JITTER'],
+            error_rate=app.config['UPSTREAM_STUB_ERROR_RATE'])
+        app.extensions['upstream_stub'] = stub
+        http_client.install_adapter(lambda **_: stub)
+    elif app.config['UPSTREAM_RECORD_FIXTURES']:
+        http_client.install_adapter(
+            functools.partial(RecordingAdapter, app.config['UPSTREAM_FIXTURES_PATH']))
+    else:
+        http_client.install_adapter(None)
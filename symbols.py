@@ -0,0 +1,203 @@
+''' local ticker symbol index used for search autocomplete. '''
+# Listing source: https://www.alphavantage.co/documentation/#listing-status
+
+import bisect
+import csv
+import functools
+import heapq
+import io
+import logging
+import os
+import threading
+import time
+import click
+from stock_trends import http_client
+from stock_trends.api_alphavantage import (ALPHAVANTAGE_API_KEY, BASE_URL, ERROR_KEYS,
+                                          AlphaVantageError, acquire_quota)
+from stock_trends.throttle import QuotaExceeded
+
+logger = logging.getLogger(__name__)
+
+# a failed refresh is retried after this many seconds.
+RETRY_DELAY = 5 * 60
+
+# first columns of a LISTING_STATUS csv snapshot.
+LISTING_HEADER = 'symbol,name,exchange'
+
+# result tiers, lower ranks first.
+EXACT_SYMBOL = 0
+SYMBOL_PREFIX = 1
+NAME_START = 2
+NAME_WORD = 3
+
+# distinct (query, limit) results remembered per index.
+RESULT_CACHE_SIZE = 4096
+
+
+class SymbolIndex:
+    """ in-memory prefix index over symbols and company names.
+
+    Symbols and every word of each company name are kept in sorted lists, so a
+    prefix lookup is a binary search followed by a scan of the matching range.
+    """
+
+    def __init__(self, entries):
+        """
+        Args:
+            entries: iterable of (symbol, name, exchange) tuples.
+        """
+        self.entries = sorted({(symbol.upper(), name, exchange)
+                               for symbol, name, exchange in entries if symbol})
+        self.symbols = [entry[0] for entry in self.entries]
+
+        words = []
+        for position, (_, name, _) in enumerate(self.entries):
+            for word in set(name.upper().split()):
+                words.append((word, position))
+        words.sort()
+        self.words = [word for word, _ in words]
+        self.word_positions = [position for _, position in words]
+
+        # autocomplete repeats short prefixes, remember recent answers.
+        self._cached_search = functools.lru_cache(maxsize=RESULT_CACHE_SIZE)(self._search)
+
+    @classmethod
+    def from_csv(cls, text: str):
+        ''' builds an index from Alpha Vantage LISTING_STATUS csv text. '''
+        reader = csv.DictReader(io.StringIO(text))
+        return cls((row['symbol'], row['name'], row['exchange']) for row in reader
+                   if row.get('status', 'Active') == 'Active')
+
+    def _prefix_range(self, keys, prefix):
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + '\uffff', start)
+        return range(start, end)
+
+    def search(self, query: str, limit: int = 10):
+        """ ranked prefix search on symbol and company name.
+
+        Args:
+            query: user input, matched case-insensitively.
+            limit: maximum number of results.
+
+        Returns:
+            Tuple: dictonaries with symbol, name and exchange keys. Exact symbol
+                matches come first, then symbol prefixes (shortest first), then
+                company name word prefixes.
+        """
+        query = query.strip().upper()
+        if not query:
+            return []
+        return self._cached_search(query, limit)
+
+    def _search(self, query, limit):
+        ranked = {}
+        for position in self._prefix_range(self.symbols, query):
+            tier = EXACT_SYMBOL if self.symbols[position] == query else SYMBOL_PREFIX
+            ranked[position] = (tier, len(self.symbols[position]), self.symbols[position])
+
+        for word_position in self._prefix_range(self.words, query):
+            position = self.word_positions[word_position]
+            if position not in ranked:
+                name = self.entries[position][1].upper()
+                tier = NAME_START if name.startswith(query) else NAME_WORD
+                ranked[position] = (tier, len(self.symbols[position]), self.symbols[position])
+
+        best = heapq.nsmallest(limit, ranked, key=ranked.get)
+        return tuple({'symbol': self.entries[position][0],
+                 'name': self.entries[position][1],
+                 'exchange': self.entries[position][2]} for position in best)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+_refresh_lock = threading.Lock()
+_state = {'index': None, 'path': None, 'max_age': 24 * 60 * 60, 'next_refresh': 0.0}
+
+
+def download_listing(path: str) -> None:
+    """ downloads the LISTING_STATUS csv snapshot to path (atomically replaced).
+
+    A reply that is not a listing (Ex: a quota notice, which Alpha Vantage
+    sends as json with a 200 status) raises AlphaVantageError or ValueError
+    and leaves the previous snapshot in place.
+    """
+    apikey = ALPHAVANTAGE_API_KEY or 'demo'
+    request = http_client.get(BASE_URL, params={
+        'function': 'LISTING_STATUS',
+        'apikey': apikey}, endpoint='LISTING_STATUS',
+        before_attempt=lambda: acquire_quota(apikey))
+    request.raise_for_status()
+
+    if not request.text.lstrip('\ufeff').startswith(LISTING_HEADER):
+        try:
+            payload = request.json()
+        except ValueError:
+            payload = {}
+        for key in ERROR_KEYS:
+            if key in payload:
+                raise AlphaVantageError(f'LISTING_STATUS: {payload[key]}')
+        raise ValueError('LISTING_STATUS reply is not a listing csv')
+
+    partial = f'{path}.partial'
+    with open(partial, 'w', encoding='utf-8') as f:
+        f.write(request.text)
+    os.replace(partial, path)
+
+
+def refresh_index(force_download: bool = False) -> SymbolIndex:
+    """ (re)loads the index from the listing file, downloading it first when stale.
+
+    Args:
+        force_download: download a new snapshot even if the file is recent.
+
+    Returns:
+        SymbolIndex: the new index.
+    """
+    path = _state['path']
+    if (force_download or not os.path.exists(path)
+            or time.time() - os.path.getmtime(path) > _state['max_age']):
+        download_listing(path)
+
+    with open(path, encoding='utf-8') as f:
+        _state['index'] = SymbolIndex.from_csv(f.read())
+    _state['next_refresh'] = time.time() + _state['max_age']
+    return _state['index']
+
+
+def _refresh():
+    try:
+        refresh_index()
+    except (OSError, ValueError, KeyError, csv.Error, AlphaVantageError,
+            QuotaExceeded) as error:
+        logger.warning('refreshing the symbol listing failed: %r', error)
+        _state['next_refresh'] = time.time() + RETRY_DELAY
+    finally:
+        _refresh_lock.release()
+
+
+def get_index():
+    """ returns the loaded symbol index, or None while it is still loading.
+
+    A missing or stale index is (re)loaded in a background thread, callers
+    keep using the previous index (or the remote search) in the meantime.
+    """
+    if (_state['path'] is not None and time.time() >= _state['next_refresh']
+            and _refresh_lock.acquire(blocking=False)):  # pylint: disable=R1732
+        threading.Thread(target=_refresh, name='symbol-listing', daemon=True).start()
+    return _state['index']
+
+
+@click.command('refresh-symbols')
+def refresh_symbols_command():
+    """Download the symbol listing and rebuild the search index."""
+    index = refresh_index(force_download=True)
+    click.echo(f'Indexed {len(index)} symbols.')
+
+
+def init_app(app):
+    ''' configures the listing file location and refresh interval. '''
+    _state['path'] = app.config['SYMBOL_LISTING_PATH']
+    _state['max_age'] = app.config['SYMBOL_LISTING_MAX_AGE']
+    app.cli.add_command(refresh_symbols_command)
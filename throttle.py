@@ -0,0 +1,150 @@
+''' request coalescing and quota scheduling for upstream APIs. '''
+
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+
+class QuotaExceeded(RuntimeError):
+    ''' raised when a call cannot be made within the configured API budget. '''
+
+
+class SingleFlight:
+    """ coalesces concurrent calls that share a key.
+
+    The first caller for a key runs the function, every caller arriving while
+    it is in flight waits for and shares that result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, function):
+        """ runs function once for all concurrent callers of key.
+
+        Args:
+            key: hashable identity of the call.
+            function: callable without arguments.
+
+        Returns:
+            the function's result.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = function()
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        ''' number of distinct calls currently running. '''
+        return len(self._calls)
+
+
+class QuotaScheduler:  # pylint: disable=R0902
+    """ token bucket keeping calls within a per-minute and per-day budget.
+
+    Each caller reserves the next token, so callers are served in arrival
+    order and wait outside the lock. A call that would wait longer than
+    max_wait, or that exceeds the daily budget, raises QuotaExceeded instead.
+    Budgets are tracked per process.
+    """
+
+    def __init__(self, calls_per_minute: int, calls_per_day: int, max_wait: float = 30):
+        self.calls_per_minute = calls_per_minute
+        self.calls_per_day = calls_per_day
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._tokens = float(calls_per_minute)
+        self._updated = time.monotonic()
+        self._day = None
+        self.calls_today = 0
+        self.queue_depth = 0
+        self.waited_calls = 0
+        self.total_wait = 0.0
+        self.longest_wait = 0.0
+
+    def _refill(self, now):
+        rate = self.calls_per_minute / 60
+        self._tokens = min(self.calls_per_minute, self._tokens + (now - self._updated) * rate)
+        self._updated = now
+
+    def acquire(self, daily_reserve: int = 0, max_wait: float = None) -> float:
+        """ blocks until a call may be made.
+
+        Args:
+            daily_reserve: calls of the daily budget this call may not use
+                (Ex: kept for user requests by background work).
+            max_wait: overrides the scheduler's max_wait for this call.
+
+        Returns:
+            float: seconds spent waiting.
+        """
+        with self._lock:
+            today = datetime.now(timezone.utc).date()
+            if today != self._day:
+                self._day = today
+                self.calls_today = 0
+            if self.calls_today >= self.calls_per_day - daily_reserve:
+                raise QuotaExceeded(f'daily budget of {self.calls_per_day} calls used up.')
+
+            self._refill(time.monotonic())
+            wait = max(0.0, (1 - self._tokens) * 60 / self.calls_per_minute)
+            if wait > (self.max_wait if max_wait is None else max_wait):
+                raise QuotaExceeded(f'call would wait {wait:.1f}s for the per-minute budget.')
+
+            self._tokens -= 1
+            self.calls_today += 1
+            if wait:
+                self.queue_depth += 1
+
+        if wait:
+            time.sleep(wait)
+            with self._lock:
+                self.queue_depth -= 1
+                self.waited_calls += 1
+                self.total_wait += wait
+                self.longest_wait = max(self.longest_wait, wait)
+        return wait
+
+    def stats(self) -> dict:
+        """ current scheduler state.
+
+        Returns:
+            Dict: dictonary with the following keys.
+                * queue_depth (int): callers waiting for a token.
+                * calls_today (int)
+                * remaining_today (int)
+                * waited_calls (int)
+                * total_wait (float): seconds.
+                * average_wait (float): seconds, over calls that waited.
+                * longest_wait (float): seconds.
+        """
+        with self._lock:
+            return {'queue_depth': self.queue_depth,
+                    'calls_today': self.calls_today,
+                    'remaining_today': max(0, self.calls_per_day - self.calls_today),
+                    'waited_calls': self.waited_calls,
+                    'total_wait': self.total_wait,
+                    'average_wait': (self.total_wait / self.waited_calls
+                                     if self.waited_calls else 0.0),
+                    'longest_wait': self.longest_wait}